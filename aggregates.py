@@ -0,0 +1,393 @@
+import copy
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+import data_loader
+
+# Precomputed aggregates for the interactive dashboard.
+# The cube is built once per process from the incident table; every year range,
+# metric and state selection is then answered by slicing and summing arrays
+# instead of grouping the incident rows on each rerun. Range totals come from
+# prefix sums over the year axis, so they cost the same for any range length.
+# Batches appended by ingest.py --append are added to the cached aggregates
+# as deltas (see data_loader.cached_incremental). With SHOOTINGS_AGGREGATES_DIR
+# set, the cube and the groupings come from the per-cell totals streaming.py
+# folds out of a feed too large to load.
+
+METRICS = ['Shootings', 'Victims Killed', 'Victims Injured', 'Total Victims', 'Suspects Killed', 'Suspects Arrested']
+
+
+def _county_key(incidents):
+    """County dimension key, (FIPS_State, FIPS), so a county filed under a
+    different state than its FIPS prefix still counts for that state."""
+    return incidents['FIPS_State'].to_numpy().astype(np.int64) * 1_000_000 + incidents['FIPS'].to_numpy()
+
+
+def _prefix(values):
+    """Cumulative sums along the year axis (axis 1) with a leading row of zeros."""
+    shape = list(values.shape)
+    shape[1] = 1
+    return np.concatenate([np.zeros(shape, dtype=values.dtype), np.cumsum(values, axis=1)], axis=1)
+
+
+class AggregateCube:
+    """Dense Year x State x County totals for every metric.
+
+    Counties are sorted by state, so each state is a contiguous block of the
+    county axis. values has shape (metric, year, county); state_values and
+    region_values hold the same totals summed to state and region. The
+    *_prefix arrays hold cumulative sums over years with a leading zero row,
+    so the total for years [a, b] is prefix[:, b + 1] - prefix[:, a].
+    """
+
+    def __init__(self, incidents, metrics=METRICS):
+        self.metrics = list(metrics)
+        year = incidents['Year'].to_numpy()
+        self.first_year = int(year.min())
+        self.last_year = int(year.max())
+        self.years = np.arange(self.first_year, self.last_year + 1)
+        year_idx = year - self.first_year
+
+        # County dimension
+        self.county_keys, first_row, county_idx = np.unique(_county_key(incidents), return_index=True, return_inverse=True)
+        rows = incidents.iloc[first_row]
+        self.counties = pd.DataFrame({
+            'FIPS': rows['FIPS'].to_numpy(),
+            'FIPS_State': rows['FIPS_State'].to_numpy(),
+            'State': rows['State'].astype(str).to_numpy(),
+            'Region': rows['Region'].astype(str).to_numpy(),
+            'County': rows['County'].fillna(rows['FIPS'].astype(str)).to_numpy()
+        })
+
+        # State dimension: start offset of each state's block of counties
+        state_fips = self.counties['FIPS_State'].to_numpy()
+        self.state_starts = np.flatnonzero(np.r_[True, state_fips[1:] != state_fips[:-1]])
+        self.states = self.counties.iloc[self.state_starts][['State', 'FIPS_State', 'Region']].reset_index(drop=True)
+        self.county_state = np.repeat(np.arange(len(self.states)), np.diff(np.r_[self.state_starts, len(self.counties)]))
+
+        self.regions = np.array(sorted(self.states['Region'].unique()))
+        self.state_region = np.searchsorted(self.regions, self.states['Region'].to_numpy())
+
+        n_years, n_counties = len(self.years), len(self.counties)
+        self.values = np.zeros((len(self.metrics), n_years, n_counties), dtype=np.int64)
+        self.incidents_per_year = np.zeros(n_years, dtype=np.int64)
+        # First row of each state per year, so state lists keep the order in
+        # which states appear in the source file
+        self._unseen = 0
+        self.first_seen = np.zeros((n_years, len(self.states)), dtype=np.int64)
+        self._add(incidents, year_idx, county_idx)
+
+    def _add(self, incidents, year_idx, county_idx):
+        """Add incident rows to values and the per-year counts, then refresh the totals."""
+        n_years, n_counties = len(self.years), len(self.counties)
+        cell = year_idx * n_counties + county_idx
+        for i, metric in enumerate(self.metrics):
+            weights = incidents[metric].to_numpy() if metric in incidents else None
+            self.values[i] += np.rint(np.bincount(cell, weights=weights, minlength=n_years * n_counties)).astype(np.int64).reshape(n_years, n_counties)
+        # Rows may be pre-aggregated, with their number of incidents in 'Shootings'
+        counts = incidents['Shootings'].to_numpy() if 'Shootings' in incidents else None
+        self.incidents_per_year += np.bincount(year_idx, weights=counts, minlength=n_years).astype(np.int64)
+        self.active_year_prefix = np.r_[0, np.cumsum(self.incidents_per_year > 0)]
+
+        # Rows are numbered after the ones already added; unseen cells move
+        # to the new sentinel
+        unseen = self._unseen + len(incidents)
+        self.first_seen[self.first_seen == self._unseen] = unseen
+        np.minimum.at(self.first_seen, (year_idx, self.county_state[county_idx]), np.arange(self._unseen, unseen))
+        self._unseen = unseen
+
+        values = self.values
+        self.state_values = np.add.reduceat(values, self.state_starts, axis=2)
+        region_onehot = np.zeros((len(self.states), len(self.regions)), dtype=np.int64)
+        region_onehot[np.arange(len(self.states)), self.state_region] = 1
+        self.region_values = self.state_values @ region_onehot
+
+        self.county_prefix = _prefix(values)
+        self.state_prefix = _prefix(self.state_values)
+        self.region_prefix = _prefix(self.region_values)
+        self.national_prefix = _prefix(self.state_values.sum(axis=2))
+
+    def extended(self, incidents):
+        """New cube with `incidents` added, leaving this one untouched.
+
+        The rows must come after the ones the cube was built from. Returns None
+        when they fall in a year or county the cube has no cell for; the cube
+        then has to be rebuilt.
+        """
+        year_idx = incidents['Year'].to_numpy().astype(np.int64) - self.first_year
+        county_key = _county_key(incidents)
+        county_idx = np.minimum(np.searchsorted(self.county_keys, county_key), len(self.county_keys) - 1)
+        if ((year_idx < 0) | (year_idx >= len(self.years))).any() or (self.county_keys[county_idx] != county_key).any():
+            return None
+        cube = copy.copy(self)
+        cube.values = self.values.copy()
+        cube.incidents_per_year = self.incidents_per_year.copy()
+        cube.first_seen = self.first_seen.copy()
+        cube._add(incidents, year_idx, county_idx)
+        return cube
+
+    # Sharing between processes
+
+    def save(self, directory):
+        """Write the cube as .npy arrays, Arrow frames and a JSON file of the rest."""
+        os.makedirs(directory, exist_ok=True)
+        scalars = {}
+        for name, value in vars(self).items():
+            if isinstance(value, np.ndarray):
+                np.save(os.path.join(directory, f'{name}.npy'), value, allow_pickle=False)
+            elif isinstance(value, pd.DataFrame):
+                data_loader.write_arrow(value, os.path.join(directory, f'{name}.arrow'))
+            else:
+                scalars[name] = value
+        with open(os.path.join(directory, 'cube.json'), 'w') as sink:
+            json.dump(scalars, sink)
+
+    @classmethod
+    def load(cls, directory):
+        """Cube written by save(), its arrays memory-mapped read-only."""
+        cube = cls.__new__(cls)
+        with open(os.path.join(directory, 'cube.json')) as source:
+            vars(cube).update(json.load(source))
+        for entry in os.listdir(directory):
+            name, extension = os.path.splitext(entry)
+            path = os.path.join(directory, entry)
+            if extension == '.npy':
+                setattr(cube, name, np.load(path, mmap_mode='r'))
+            elif extension == '.arrow':
+                setattr(cube, name, data_loader.read_arrow(path))
+        return cube
+
+    # Indexing
+
+    def metric_index(self, metric):
+        return self.metrics.index(metric)
+
+    def _year_slice(self, first_year, last_year):
+        first = min(max(first_year, self.first_year), self.last_year + 1) - self.first_year
+        last = max(min(last_year, self.last_year), self.first_year - 1) - self.first_year
+        return slice(first, max(first, last + 1))
+
+    def _range_total(self, prefix, metric, first_year, last_year):
+        year_slice = self._year_slice(first_year, last_year)
+        prefix = prefix[self.metric_index(metric)]
+        return prefix[year_slice.stop] - prefix[year_slice.start]
+
+    def state_positions(self, states):
+        lookup = pd.Index(self.states['State'])
+        positions = lookup.get_indexer(list(states))
+        return positions[positions >= 0]
+
+    # Totals over a year range
+
+    def total(self, metric, first_year, last_year):
+        return int(self._range_total(self.national_prefix, metric, first_year, last_year))
+
+    def active_years(self, first_year, last_year):
+        """Number of years in the range with at least one incident."""
+        year_slice = self._year_slice(first_year, last_year)
+        return int(self.active_year_prefix[year_slice.stop] - self.active_year_prefix[year_slice.start])
+
+    def state_totals(self, metric, first_year, last_year):
+        return self._range_total(self.state_prefix, metric, first_year, last_year)
+
+    def region_totals(self, metric, first_year, last_year):
+        return self._range_total(self.region_prefix, metric, first_year, last_year)
+
+    def county_totals(self, metric, first_year, last_year):
+        return self._range_total(self.county_prefix, metric, first_year, last_year)
+
+    def states_with_incidents(self, first_year, last_year):
+        """States with incidents in the range, in order of first appearance."""
+        first_seen = self.first_seen[self._year_slice(first_year, last_year)].min(axis=0, initial=self._unseen)
+        order = np.argsort(first_seen, kind='stable')
+        order = order[first_seen[order] < self._unseen]
+        return self.states['State'].to_numpy()[order].tolist()
+
+    # Chart-ready frames
+
+    def state_frame(self, metric, first_year, last_year):
+        frame = self.states.copy()
+        frame[metric] = self.state_totals(metric, first_year, last_year)
+        return frame
+
+    def region_year_frame(self, metric, first_year, last_year):
+        year_slice = self._year_slice(first_year, last_year)
+        block = self.region_values[self.metric_index(metric), year_slice]
+        return pd.DataFrame({
+            'Year': np.repeat(self.years[year_slice], len(self.regions)),
+            'Region': np.tile(self.regions, block.shape[0]),
+            metric: block.ravel()
+        })
+
+    def region_endpoints_frame(self, metric, first_year, last_year):
+        """Region totals for the first and last year of the range, for slope charts."""
+        years = sorted({first_year, last_year})
+        blocks = [self.region_totals(metric, year, year) for year in years]
+        return pd.DataFrame({
+            'Year': np.repeat(years, len(self.regions)),
+            'Region': np.tile(self.regions, len(years)),
+            metric: np.concatenate(blocks)
+        })
+
+    def state_year_frame(self, metric, first_year, last_year, states):
+        positions = self.state_positions(states)
+        year_slice = self._year_slice(first_year, last_year)
+        block = self.state_values[self.metric_index(metric), year_slice][:, positions]
+        selected = self.states.iloc[positions]
+        return pd.DataFrame({
+            'State': np.tile(selected['State'].to_numpy(), block.shape[0]),
+            'Year': np.repeat(self.years[year_slice], len(positions)),
+            metric: block.ravel(),
+            'FIPS_State': np.tile(selected['FIPS_State'].to_numpy(), block.shape[0]),
+            'Region': np.tile(selected['Region'].to_numpy(), block.shape[0])
+        })
+
+    def state_year_table(self):
+        """Year x State totals of every metric over all years, one column per metric.
+
+        Small enough to ship to the browser whole: narrow integer columns and
+        categorical names.
+        """
+        n_years, n_states = len(self.years), len(self.states)
+        frame = pd.DataFrame({
+            'Year': np.repeat(self.years, n_states).astype(np.int16),
+            'State': np.tile(self.states['State'].to_numpy(), n_years),
+            'FIPS_State': np.tile(self.states['FIPS_State'].to_numpy(), n_years),
+            'Region': np.tile(self.states['Region'].to_numpy(), n_years)
+        }).astype({'State': 'category', 'Region': 'category'})
+        for i, metric in enumerate(self.metrics):
+            frame[metric] = self.state_values[i].ravel().astype(np.int32)
+        return frame
+
+    def county_frame(self, metric, first_year, last_year, states):
+        positions = self.state_positions(states)
+        mask = np.isin(self.county_state, positions)
+        frame = self.counties.loc[mask, ['FIPS', 'State', 'County', 'Region']].reset_index(drop=True)
+        frame[metric] = self.county_totals(metric, first_year, last_year)[mask]
+        return frame
+
+    def county_year_frames(self, metric, first_year, last_year, states):
+        """County x Year grid of each state, limited to counties with incidents in the range.
+
+        Built for all states in one pass over the cube and split by state,
+        which works because each state's counties are contiguous.
+        """
+        positions = self.state_positions(states)
+        year_slice = self._year_slice(first_year, last_year)
+        years = self.years[year_slice]
+        active = self.county_totals('Shootings', first_year, last_year) > 0
+        mask = np.isin(self.county_state, positions) & active
+        block = self.values[self.metric_index(metric), year_slice][:, mask]
+        owners = self.county_state[mask]
+        columns = {
+            'County': np.repeat(self.counties['County'].to_numpy()[mask], len(years)),
+            'Year': np.tile(years, mask.sum()),
+            metric: block.T.ravel()
+        }
+        names = self.states['State'].to_numpy()
+        starts = np.flatnonzero(np.r_[True, owners[1:] != owners[:-1]]) if len(owners) else np.array([], dtype=np.int64)
+        stops = np.r_[starts[1:], len(owners)]
+        # Frames are built from array slices, so each holds only its own rows
+        frames = {
+            names[owners[start]]: pd.DataFrame({
+                column: values[start * len(years):stop * len(years)] for column, values in columns.items()
+            })
+            for start, stop in zip(starts, stops)
+        }
+        empty = pd.DataFrame({column: values[:0] for column, values in columns.items()})
+        return {state: frames.get(state, empty) for state in states}
+
+    def county_year_frame(self, metric, first_year, last_year, state):
+        """County x Year grid for one state, limited to counties with incidents in the range."""
+        return self.county_year_frames(metric, first_year, last_year, [state])[state]
+
+
+def _group(incidents, keys, columns=None, aggregations=None):
+    grouped = incidents.groupby(['File'] + list(keys), observed=True)
+    return grouped.agg(**aggregations) if aggregations else grouped[columns].sum()
+
+
+def _split(result):
+    return {
+        str(file): part.droplevel('File').reset_index()
+        for file, part in result.groupby(level='File', observed=True)
+    }
+
+
+def group_by_file(incidents, keys, columns=None, **aggregations):
+    """Group every incident family in one scan and split the result by 'File'.
+
+    Sums `columns` per File and `keys`, or applies named `aggregations` in the
+    style of DataFrame.agg. Returns {file: frame} with `keys` as columns, so
+    adding an incident category to the source costs no extra passes.
+    """
+    return _split(_group(incidents, keys, columns, aggregations))
+
+
+# How the aggregate of the cached rows combines with that of appended rows,
+# both aligned on the union of their groups
+_COMBINE = {
+    'sum': lambda old, new, index: old.reindex(index, fill_value=0) + new.reindex(index, fill_value=0),
+    'first': lambda old, new, index: old.reindex(index).combine_first(new.reindex(index))
+}
+
+
+def load_groups_by_file(name, keys, columns=None, **aggregations):
+    """group_by_file() over dataset `name`, cached per dataset version.
+
+    'Shootings' counts incidents. Appended batches are grouped on their own
+    and combined with the cached result, so aggregations are limited to the
+    functions in _COMBINE.
+    """
+    functions = {column: 'sum' for column in columns or []}
+    functions.update({column: function for column, (_, function) in aggregations.items()})
+    unsupported = set(functions.values()) - set(_COMBINE)
+    if unsupported:
+        raise ValueError(f"aggregations {sorted(unsupported)} cannot be updated incrementally")
+
+    def build(incidents):
+        return _group(incidents.assign(Shootings=1), keys, columns, aggregations)
+
+    def update(result, incidents):
+        delta = build(incidents)
+        index = result.index.union(delta.index)
+        return pd.DataFrame({
+            column: _COMBINE[functions[column]](result[column], delta[column], index)
+            for column in result.columns
+        }, index=index)
+
+    key = ('groups_by_file', name, tuple(keys), tuple(columns or ()), tuple(sorted(aggregations.items())))
+    if data_loader.AGGREGATES_DIR and name == data_loader.INCIDENTS:
+        # Sums of cell totals are the totals; 'first' holds because the cells
+        # are in order of their first incident
+        return _split(data_loader.cached(
+            key, data_loader.dataset_signature(name),
+            lambda: _group(data_loader.load_streamed('cells'), keys, columns, aggregations),
+            f'streamed cells by File x {", ".join(keys)}'
+        ))
+    return _split(data_loader.cached_incremental(key, name, build, update, f'{name} by File x {", ".join(keys)}'))
+
+
+def load_cube():
+    """AggregateCube over the incident store, built once per dataset version
+    and extended by delta when batches are appended."""
+    if data_loader.SHARED_DIR:
+        return data_loader.cached(
+            ('aggregate_cube',), data_loader.dataset_signature(data_loader.INCIDENTS),
+            lambda: AggregateCube.load(data_loader.shared_path('cube')), 'aggregate cube (shared)'
+        )
+    if data_loader.AGGREGATES_DIR:
+        return data_loader.cached(
+            ('aggregate_cube',), data_loader.dataset_signature(data_loader.INCIDENTS),
+            lambda: AggregateCube.load(data_loader.streamed_path('cube')), 'aggregate cube (streamed)'
+        )
+    return data_loader.cached_incremental(
+        ('aggregate_cube',),
+        data_loader.INCIDENTS,
+        AggregateCube,
+        lambda cube, incidents: cube.extended(incidents),
+        'aggregate cube'
+    )
@@ -0,0 +1,328 @@
+import argparse
+import datetime
+import gc
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+
+import altair as alt
+import numpy as np
+import pandas as pd
+
+import aggregates
+import chart_cache
+import data_loader
+import interactive_charts
+import overview_charts
+import payload
+import query_service
+import synth
+import timeseries
+from render import common_year_ranges
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+# Benchmark harness for the dashboard pipeline, run headless without the
+# Streamlit server. Each phase runs on the shipped data (scale 1) and on
+# synthetic data from synth.py scaled 10x, 100x and 1000x, through the same
+# loaders and chart builders the dashboards use (overview_charts.py and
+# interactive_charts.py), with data_loader pointed at a copy of the data:
+#
+#   load        parse the sources into the typed, coded datasets
+#   aggregate   the overview dashboard's frames (its graph nodes and trend
+#               series) and the aggregate cube of the interactive one
+#   chart       every overview chart, and every interactive chart for each
+#               metric, common year range and the first selected states,
+#               with the query results they read computed afresh
+#   serialize   Streamlit's conversion of those charts to Vega-Lite specs,
+#               cut down by payload.optimize() as chart_cache does
+#
+# Results hold wall times, peak RSS and allocation counts per scale and phase
+# and are written as JSON so two runs can be compared:
+#
+#   python bench.py                                  # all scales
+#   python bench.py --scales 1 10 --repeat 5
+#   python bench.py --baseline benchmarks/old.json   # run, then compare
+#   python bench.py --compare old.json new.json      # compare two result files
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+BENCH_DIR = os.path.join(ROOT, 'benchmarks')
+DATA_DIR = os.path.join(BENCH_DIR, 'data')
+RESULTS_VERSION = 3
+
+SCALES = [1, 10, 100, 1000]
+PHASES = ['load', 'aggregate', 'chart', 'serialize']
+# Incident tables that grow with the scale; the lookup tables stay as shipped
+SCALED_DATASETS = ['mass_shootings', 'mass_school_shootings', 'counties']
+# States charted per metric and year range, like a multiselect of a few states
+SELECTED_STATES = 3
+# Cached objects each phase computes, dropped before every run of it
+AGGREGATE_KEYS = [('derived', 'query'), ('derived', 'groups_by_file'), ('derived', 'aggregate_cube'),
+                  ('derived', 'series')]
+CHART_KEYS = [('derived', 'query')]
+# A median this much slower or faster than the baseline is flagged
+THRESHOLD = 0.10
+
+
+# Synthetic data
+
+def data_root(scale, seed=0, chunk_rows=synth.CHUNK_ROWS):
+    """Directory holding every source file under its shipped name: the incident
+    tables with `scale` times the shipped rows and the lookup tables as shipped.
+
+    The rows come from synth.py, the same incidents in every table; at scale 1
+    the shipped files are copied. An existing directory for the same scale and
+    seed is reused.
+    """
+    root = os.path.join(DATA_DIR, f'x{scale}' if scale == 1 else f'x{scale}-seed{seed}')
+    paths = {name: os.path.join(root, source) for name, (source, _, _) in data_loader.DATASETS.items()}
+    if all(os.path.exists(path) for path in paths.values()):
+        return root
+    os.makedirs(root, exist_ok=True)
+    for name, path in paths.items():
+        if scale == 1 or name not in SCALED_DATASETS:
+            shutil.copyfile(os.path.join(ROOT, data_loader.DATASETS[name][0]), path)
+    if scale > 1:
+        rows = len(data_loader.read_csv(os.path.join(ROOT, data_loader.DATASETS[SCALED_DATASETS[0]][0])))
+        synth.write({name: paths[name] for name in SCALED_DATASETS}, rows * scale, seed, chunk_rows)
+    return root
+
+
+# Phases
+
+def load(root):
+    data_loader.set_data_root(root)
+    data_loader.clear_cache()
+    frames = {name: data_loader.load_dataset(name) for name in data_loader.SERVED_DATASETS}
+    data_loader.load_dimensions()
+    return frames
+
+
+def overview_graph():
+    graph = overview_charts.graph(data_loader.dataset_signature(data_loader.INCIDENTS))
+    graph.input('bucket', timeseries.DEFAULT_BUCKET)
+    return graph
+
+
+def aggregate(frames):
+    data_loader.clear_cache(*AGGREGATE_KEYS)
+    graph = overview_graph()
+    overview = {node.__name__: graph[node.__name__] for node in overview_charts.FRAMES}
+    overview['trend'] = {file: query_service.query('trend_series', file=file, bucket=timeseries.DEFAULT_BUCKET)
+                         for file in ['MS', 'SS']}
+    return overview, aggregates.load_cube()
+
+
+def chart(aggregated):
+    data_loader.clear_cache(*CHART_KEYS)
+    cube = aggregated[1]
+    graph = overview_graph()
+    charts = [graph[build.__name__] for build in overview_charts.CHARTS]
+    for metric in aggregates.METRICS:
+        for first_year, last_year in common_year_ranges(cube.first_year, cube.last_year):
+            states = sorted(cube.states_with_incidents(first_year, last_year)[:SELECTED_STATES])
+            builders = interactive_charts.chart_builders(metric, (first_year, last_year), states)
+            charts += [builders[name]() for name in ['region_line', 'region_slope', 'global_choropleth']]
+            if states:
+                charts += [builders[name]() for name in ['state_line', 'state_slope', 'county_choropleth']]
+                charts += [builders['county_heatmap'](state) for state in states]
+    return charts
+
+
+def serialize(charts):
+    return sum(chart_cache.spec_size(payload.optimize(chart_cache.vega_lite_spec(chart))[0]) for chart in charts)
+
+
+# Measurement
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def current_rss():
+    """Resident set size in bytes, or the peak so far where it cannot be read."""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * _PAGE_SIZE
+    except OSError:
+        if resource is None:
+            return 0
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class _PeakRSS(threading.Thread):
+    """Samples the RSS in the background while a phase runs."""
+
+    def __init__(self, interval=0.002):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak = current_rss()
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.wait(self.interval):
+            self.peak = max(self.peak, current_rss())
+
+    def stop(self):
+        self._done.set()
+        self.join()
+        self.peak = max(self.peak, current_rss())
+        return self.peak
+
+
+def measure(function, argument, repeat=3, trace_alloc=True):
+    """Run function(argument) `repeat` times; returns (result, measurements).
+
+    Allocations are counted in one extra run under tracemalloc so the traced
+    run does not skew the timings: alloc_blocks is the number of memory blocks
+    the phase allocated and still held at its end, alloc_peak_bytes the peak
+    of traced memory while it ran.
+    """
+    runs = []
+    result = None
+    gc.collect()
+    base_rss = current_rss()
+    peak_rss = base_rss
+    for _ in range(repeat):
+        result = None
+        gc.collect()
+        sampler = _PeakRSS()
+        sampler.start()
+        start = time.perf_counter()
+        result = function(argument)
+        runs.append(time.perf_counter() - start)
+        peak_rss = max(peak_rss, sampler.stop())
+
+    measurements = {
+        'wall_seconds': {
+            'min': min(runs),
+            'median': statistics.median(runs),
+            'max': max(runs),
+            'runs': runs
+        },
+        'peak_rss_bytes': peak_rss,
+        'rss_growth_bytes': peak_rss - base_rss,
+        'alloc_blocks': None,
+        'alloc_peak_bytes': None
+    }
+    if trace_alloc:
+        gc.collect()
+        tracemalloc.start()
+        traced = function(argument)
+        snapshot = tracemalloc.take_snapshot()
+        _, alloc_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del traced
+        measurements['alloc_blocks'] = sum(stat.count for stat in snapshot.statistics('filename'))
+        measurements['alloc_peak_bytes'] = alloc_peak
+    return result, measurements
+
+
+def run_scale(scale, repeat=3, trace_alloc=True, seed=0):
+    records = []
+    value = data_root(scale, seed)
+    steps = [('load', load), ('aggregate', aggregate), ('chart', chart), ('serialize', serialize)]
+    rows = None
+    for phase, function in steps:
+        value, measurements = measure(function, value, repeat, trace_alloc)
+        if phase == 'load':
+            rows = len(value[data_loader.INCIDENTS])
+        records.append({'scale': scale, 'phase': phase, 'rows': rows, 'repeat': repeat, **measurements})
+        print(f"x{scale:<5} {phase:<10} {measurements['wall_seconds']['median'] * 1000:10.1f} ms "
+              f"{measurements['peak_rss_bytes'] / 2**20:8.0f} MiB peak RSS")
+    return records
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(scales=SCALES, repeat=3, trace_alloc=True, seed=0):
+    results = []
+    for scale in scales:
+        results.extend(run_scale(scale, repeat, trace_alloc, seed))
+    return {
+        'version': RESULTS_VERSION,
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'commit': _git_commit(),
+        'seed': seed,
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'altair': alt.__version__
+        },
+        'results': results
+    }
+
+
+def compare(baseline, current, threshold=THRESHOLD):
+    """Print median wall time and peak RSS of `current` relative to `baseline`."""
+    if baseline.get('version') != current.get('version'):
+        print(f"Results of versions {baseline.get('version')} and {current.get('version')}: phases may not time the same work")
+    previous = {(record['scale'], record['phase']): record for record in baseline['results']}
+    print(f"{'scale':>6} {'phase':<10} {'baseline ms':>12} {'current ms':>12} {'ratio':>7} {'RSS ratio':>9}")
+    for record in current['results']:
+        before = previous.get((record['scale'], record['phase']))
+        if before is None:
+            continue
+        old = before['wall_seconds']['median']
+        new = record['wall_seconds']['median']
+        ratio = new / old if old else float('inf')
+        rss_ratio = record['peak_rss_bytes'] / before['peak_rss_bytes'] if before['peak_rss_bytes'] else float('inf')
+        flag = 'slower' if ratio > 1 + threshold else 'faster' if ratio < 1 - threshold else ''
+        print(f"x{record['scale']:<5} {record['phase']:<10} {old * 1000:12.1f} {new * 1000:12.1f} {ratio:7.2f} {rss_ratio:9.2f}  {flag}")
+
+
+def _read(path):
+    with open(path) as source:
+        return json.load(source)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the load, aggregation and chart phases of the dashboards.")
+    parser.add_argument('--scales', type=int, nargs='+', default=SCALES, help="data scales to run (default: %(default)s)")
+    parser.add_argument('--repeat', type=int, default=3, help="timed runs per phase (default: %(default)s)")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the synthetic datasets")
+    parser.add_argument('--no-alloc', action='store_true', help="skip the tracemalloc run that counts allocations")
+    parser.add_argument('--output', help="results file (default: benchmarks/<timestamp>.json)")
+    parser.add_argument('--baseline', help="results file to compare this run against")
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'), help="compare two results files and exit")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(_read(args.compare[0]), _read(args.compare[1]))
+        return
+    if any(scale < 1 for scale in args.scales):
+        parser.error("scales must be positive")
+    if data_loader.SHARED_DIR or data_loader.AGGREGATES_DIR or query_service.QUERY_URL:
+        parser.error("unset SHOOTINGS_SHARED_DIR, SHOOTINGS_AGGREGATES_DIR and SHOOTINGS_QUERY_URL: "
+                     "the benchmark loads and queries the data in this process")
+
+    results = run(args.scales, args.repeat, not args.no_alloc, args.seed)
+    output = args.output or os.path.join(BENCH_DIR, f"{datetime.datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as out:
+        json.dump(results, out, indent=1)
+    print(f"Results written to {os.path.relpath(output)}")
+    if args.baseline:
+        compare(_read(args.baseline), results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,267 @@
+import concurrent.futures
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+import altair as alt
+import streamlit as st
+from streamlit import dataframe_util
+
+import payload
+import profiling
+
+# Memoized Vega-Lite specs for both dashboards.
+# Building an Altair chart, validating it and serializing its data costs far
+# more than drawing the finished spec, so each chart is built by a function
+# that only runs on a cache miss. Specs are keyed on the chart name plus the
+# part of the selection it depends on (view, metric, year range, sorted
+# states, time bucket) and tagged with the signature of its inputs, so a changed dataset
+# rebuilds it. The cache is process-wide and shared by every session.
+# Before a spec is cached, payload.optimize() cuts its datasets down to the
+# fields it draws; the bytes this saves are reported per chart.
+# Charts are converted to specs by vega_lite_spec(), the conversion
+# st.altair_chart runs: no default theme, and frames sent as Arrow datasets.
+# Builds run concurrently: only that conversion holds the lock on Altair's
+# global theme and data transformer, so a builder must not make Altair
+# serialize a frame itself (geo.lookup_data passes lookup tables inline).
+# Background builds (speculation.py) wait while a foreground get() is
+# building or waiting for a spec, see wait_idle().
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CAPACITY = 256                  # finished specs kept
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024    # serialized size of those specs
+# Threads building missing specs for altair_charts()
+BUILD_WORKERS = min(8, (os.cpu_count() or 1) + 2)
+
+
+def selection_key(view=None, metric=None, year_range=None, states=(), bucket=None):
+    """Normalized selection tuple; state order does not change a chart."""
+    return (view, metric, tuple(year_range) if year_range is not None else None, tuple(sorted(states)), bucket)
+
+
+# Altair's theme and data transformer are process-wide settings; the ones
+# vega_lite_spec() enables only apply while it holds this lock
+_altair_lock = threading.Lock()
+
+
+def _arrow_dataset(data, datasets):
+    """Altair data transformer storing each frame as Arrow IPC bytes named after their content."""
+    data = dataframe_util.convert_anything_to_arrow_bytes(data)
+    name = hashlib.md5(data).hexdigest()
+    datasets[name] = data
+    return {'name': name}
+
+
+alt.data_transformers.register('arrow_dataset', _arrow_dataset)
+
+
+def vega_lite_spec(chart):
+    """Vega-Lite spec of an Altair chart, with its frames as Arrow datasets."""
+    datasets = {}
+    # alt.theme replaced alt.themes in Altair 5.5
+    theme = getattr(alt, 'theme', None) or alt.themes
+    with _altair_lock:
+        # The default theme sets a width and height Streamlit sizes itself
+        no_theme = theme.enable('none') if theme.active == 'default' else contextlib.nullcontext()
+        with no_theme, alt.data_transformers.enable('arrow_dataset', datasets=datasets):
+            spec = chart.to_dict()
+    # Charts may carry inline datasets of their own
+    spec['datasets'] = {**(spec.get('datasets') or {}), **datasets}
+    return spec
+
+
+def spec_size(spec):
+    """Approximate bytes a spec holds: Arrow datasets plus the JSON of the rest."""
+    datasets = spec.get('datasets') or {}
+    size = sum(len(data) if isinstance(data, bytes) else len(json.dumps(data)) for data in datasets.values())
+    rest = {key: value for key, value in spec.items() if key != 'datasets'}
+    return size + len(json.dumps(rest, default=str))
+
+
+class ChartSpecCache:
+    """Bounded LRU of finished chart specs, evicting by entry count and total bytes."""
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, max_bytes=DEFAULT_MAX_BYTES):
+        self.capacity = capacity
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # key -> (signature, spec, size)
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._payload = {}              # chart name -> bytes and bytes saved of its last spec
+        self._building = {}             # key -> lock held while its spec is built
+        self._foreground = 0            # foreground get() calls building or waiting on a miss
+        self._idle = threading.Condition(self._lock)
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.capacity or self._bytes > self.max_bytes):
+            _, (_, _, size) = self._entries.popitem(last=False)
+            self._bytes -= size
+            self._evictions += 1
+
+    def _lookup(self, key, signature):
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == signature:
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[1]
+        return None
+
+    def contains(self, key, signature):
+        """True when a current spec for `key` is cached; not counted as a lookup."""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and entry[0] == signature
+
+    def get(self, key, signature, build, background=False):
+        """Spec for `key`, converting build()'s Altair chart only on a miss.
+
+        background=True marks a build nobody is waiting for yet, which
+        wait_idle() does not wait on.
+        """
+        with self._lock:
+            spec = self._lookup(key, signature)
+            if spec is not None:
+                return spec
+            key_lock = self._building.setdefault(key, threading.Lock())
+            if not background:
+                self._foreground += 1
+
+        try:
+            # One build per key: a rerun asking for a spec that is being built,
+            # for instance speculatively, waits for it instead of building it again
+            with key_lock:
+                with self._lock:
+                    spec = self._lookup(key, signature)
+                    if spec is not None:
+                        return spec
+                    self._misses += 1
+                try:
+                    return self._build(key, signature, build)
+                finally:
+                    with self._lock:
+                        self._building.pop(key, None)
+        finally:
+            if not background:
+                with self._lock:
+                    self._foreground -= 1
+                    if not self._foreground:
+                        self._idle.notify_all()
+
+    def wait_idle(self, timeout=None):
+        """Wait until no foreground get() is building or waiting for a spec; False on timeout."""
+        with self._lock:
+            return self._idle.wait_for(lambda: not self._foreground, timeout)
+
+    def _build(self, key, signature, build):
+        name = key[0]
+        with profiling.phase('build', name):
+            chart = build()
+        with profiling.phase('serialize', name) as timed:
+            spec, saved = payload.optimize(vega_lite_spec(chart))
+            size = spec_size(spec)
+            timed.set(bytes=size, saved=saved)
+        logger.info("%s: %d bytes, %d saved by the payload guard", name, size, saved)
+        with self._lock:
+            self._payload[name] = {'bytes': size, 'saved': saved}
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+            # A spec larger than the whole budget is returned but not kept
+            if size <= self.max_bytes:
+                self._entries[key] = (signature, spec, size)
+                self._bytes += size
+                self._evict()
+        return spec
+
+    def payload_report(self):
+        """Bytes of the last spec built for each chart and the bytes its payload guard saved."""
+        with self._lock:
+            return {name: dict(sizes) for name, sizes in self._payload.items()}
+
+    def resize(self, capacity=None, max_bytes=None):
+        with self._lock:
+            if capacity is not None:
+                self.capacity = capacity
+            if max_bytes is not None:
+                self.max_bytes = max_bytes
+            self._evict()
+
+    def info(self):
+        """Return hit/miss counts, hit rate, evictions and current size."""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': round(self._hits / lookups, 4) if lookups else 0.0,
+                'evictions': self._evictions,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'capacity': self.capacity,
+                'max_bytes': self.max_bytes
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._hits = self._misses = self._evictions = 0
+            self._payload.clear()
+
+
+specs = ChartSpecCache()
+
+
+def altair_chart(name, selection, signature, build, cache=None, **kwargs):
+    """st.altair_chart(build(), **kwargs), served from the spec cache."""
+    spec = (cache or specs).get((name,) + tuple(selection), signature, build)
+    return _draw(st, name, spec, **kwargs)
+
+
+def _draw(target, name, spec, **kwargs):
+    with profiling.phase('draw', name) as timed:
+        element = target.vega_lite_chart(spec=spec, **kwargs)
+        if profiling.current() is not None:
+            timed.set(bytes=spec_size(spec))
+        return element
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _pool():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = concurrent.futures.ThreadPoolExecutor(BUILD_WORKERS, thread_name_prefix='chart-build')
+        return _executor
+
+
+def altair_charts(charts, signature, cache=None, **kwargs):
+    """Draw a series of charts, each as soon as its spec is ready.
+
+    `charts` is a list of (name, selection, build). Every chart gets a
+    placeholder up front so the page keeps their order; specs missing from
+    the cache are built and serialized on a shared thread pool and drawn in
+    the order they finish.
+    """
+    cache = cache or specs
+    slots = [st.empty() for _ in charts]
+    get = profiling.bind(cache.get)
+    futures = {
+        _pool().submit(get, (name,) + tuple(selection), signature, build): (name, slot)
+        for (name, selection, build), slot in zip(charts, slots)
+    }
+    # Streamlit elements are only written from the script thread
+    for future in concurrent.futures.as_completed(futures):
+        name, slot = futures[future]
+        _draw(slot, name, future.result(), **kwargs)
@@ -0,0 +1,243 @@
+import argparse
+import concurrent.futures
+import multiprocessing
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+import aggregates
+import data_loader
+
+# County socioeconomic analytics.
+# The incident files report the attributes of each incident's county (crime
+# rate, unemployment, cost of living, median income, the party that won the
+# popular vote, diversity ranks, population); data_loader parses them into
+# numbers as it loads the incident store. county_features() turns them into
+# one numeric row per county and county_outcomes() adds the county's
+# shootings and victims in a year range, per million residents.
+#
+# analyze() relates the two for every outcome and feature at once:
+#
+#   Pearson      correlation over the counties that have both values
+#   Spearman     the same on ranks, robust to a few very large counties
+#   Coefficient  multiple regression of the per-million rate on all
+#                features (standardized, so a coefficient is the change in
+#                the rate for one standard deviation of the feature, the
+#                others held fixed), weighted by population, as small
+#                counties have the noisiest rates
+#
+# The statistics are computed with masked matrix products in NumPy over
+# batches of resampled counties, so a batch of bootstrap samples costs a few
+# matrix products. Bootstrap confidence intervals resample counties
+# BOOTSTRAP_SAMPLES times in batches spread across a pool of worker
+# processes; every batch has its own seed, so the intervals are the same for
+# any number of workers. Results are cached per year range and dataset
+# version.
+#
+#   correlations.analyze(2019, 2024)
+#   python correlations.py --years 2019 2024 --samples 2000
+#
+# Only counties with at least one incident carry attributes, so the analysis
+# describes where shootings happen, not their likelihood across all
+# counties; the correlations are associations, not causes.
+
+# Feature -> source column; 'Republican Vote' is 1 where the county's
+# popular vote went Republican, 'Log Population' is log10 of the population
+FEATURES = {
+    'Crime Rate': 'Crime Rate',
+    'Unemployment': 'Unemployment',
+    'Cost of Living': 'Cost of Living',
+    'Median Income': 'Median Income',
+    'Republican Vote': 'PopulrVoteParty',
+    'Diversity Rank (Race)': 'Diversity Rank (Race)',
+    'Diversity Rank (Gender)': 'Diversity Rank (Gender)',
+    'Log Population': 'Population'
+}
+OUTCOMES = ['Shootings', 'Total Victims', 'Victims Killed']
+
+BOOTSTRAP_SAMPLES = 1000
+BATCH_SAMPLES = 100         # bootstrap samples per task
+CONFIDENCE = 0.95
+MIN_COUNTIES = 10           # fewer pairs than this give no correlation
+WORKERS = int(os.environ.get('SHOOTINGS_BOOTSTRAP_WORKERS', os.cpu_count() or 1))
+
+
+def county_features():
+    """One row per county FIPS: State, Population and the FEATURES as floats (NaN where unknown)."""
+    def build():
+        incidents = data_loader.load_dataset(data_loader.INCIDENTS)
+        incidents = incidents[incidents['FIPS'] != 0]
+        # Attributes repeat on every incident of a county; take the first reported
+        columns = ['State'] + list(dict.fromkeys(FEATURES.values()))
+        counties = incidents.groupby('FIPS', sort=True)[columns].first()
+        features = pd.DataFrame({'State': counties['State'], 'Population': counties['Population']}, index=counties.index)
+        for feature, column in FEATURES.items():
+            values = counties[column]
+            if feature == 'Republican Vote':
+                values = (values == 'R').astype('float64').where(values.notna())
+            elif feature == 'Log Population':
+                values = np.log10(values.where(values > 0))
+            features[feature] = values.astype('float64')
+        return features
+
+    return data_loader.cached(('county_features',), data_loader.dataset_signature(data_loader.INCIDENTS), build,
+                              'county features')
+
+
+def county_outcomes(first_year, last_year):
+    """OUTCOMES totals of each county of county_features() in the year range, with their per-million rates."""
+    cube = aggregates.load_cube()
+    features = county_features()
+    outcomes = pd.DataFrame(index=features.index)
+    for outcome in OUTCOMES:
+        totals = pd.Series(cube.county_totals(outcome, first_year, last_year), index=cube.counties['FIPS'].to_numpy())
+        outcomes[outcome] = totals.groupby(level=0).sum().reindex(features.index, fill_value=0)
+        outcomes[f'{outcome} per Million'] = outcomes[outcome] / features['Population'] * 1_000_000
+    return outcomes
+
+
+# Statistics, batched over any leading axes of (..., counties, columns) arrays
+
+def _transposed(values):
+    return np.swapaxes(values, -1, -2)
+
+
+def pearson(x, y):
+    """Pearson r of every column of x with every column of y, and the number of
+    counties each pair has; NaN marks a missing value."""
+    x = x - np.nanmean(x, axis=-2, keepdims=True)
+    y = y - np.nanmean(y, axis=-2, keepdims=True)
+    has_x, has_y = ~np.isnan(x), ~np.isnan(y)
+    x, y = np.where(has_x, x, 0.0), np.where(has_y, y, 0.0)
+    has_x, has_y = has_x.astype(np.float64), has_y.astype(np.float64)
+    n = _transposed(has_x) @ has_y
+    sum_x, sum_y = _transposed(x) @ has_y, _transposed(has_x) @ y
+    sum_xx, sum_yy = _transposed(x * x) @ has_y, _transposed(has_x) @ (y * y)
+    covariance = n * (_transposed(x) @ y) - sum_x * sum_y
+    variance = (n * sum_xx - sum_x ** 2) * (n * sum_yy - sum_y ** 2)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        r = covariance / np.sqrt(variance)
+    return np.where(n >= MIN_COUNTIES, r, np.nan), n
+
+
+def spearman(x, y):
+    """pearson() of the ranks of x and y, each ranked over its known values."""
+    def ranks(values):
+        return pd.DataFrame(values).rank().to_numpy()
+    return pearson(ranks(x), ranks(y))
+
+
+def regression(x, y, weights):
+    """Weighted least squares coefficients of each column of y on all columns
+    of x plus an intercept, over the counties with every value; (..., p, q)
+    without the intercept."""
+    complete = ~np.isnan(x).any(axis=-1) & ~np.isnan(y).any(axis=-1) & ~np.isnan(weights)
+    weights = np.where(complete, weights, 0.0)[..., None]
+    design = np.concatenate([np.ones(x.shape[:-1] + (1,)), np.where(complete[..., None], x, 0.0)], axis=-1)
+    y = np.where(complete[..., None], y, 0.0)
+    gram = _transposed(design) @ (weights * design)
+    # pinv rather than solve, so a degenerate resample gives numbers, not an error
+    return (np.linalg.pinv(gram) @ (_transposed(design) @ (weights * y)))[..., 1:, :]
+
+
+def _bootstrap(x, y, weights, seed, samples):
+    """Pearson r and regression coefficients of `samples` resamples of the counties."""
+    rows = np.random.default_rng(seed).integers(0, len(x), size=(samples, len(x)))
+    r, _ = pearson(x[rows], y[rows])
+    return r, regression(x[rows], y[rows], weights[rows])
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _executor():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Spawned, not forked: the dashboards call this from threads
+            _pool = concurrent.futures.ProcessPoolExecutor(WORKERS, mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+
+def bootstrap(x, y, weights, samples=BOOTSTRAP_SAMPLES, seed=0, workers=WORKERS):
+    """(r, coefficients) of every resample, stacked on a leading axis; batches
+    run on the process pool, or here with workers=0."""
+    seeds = np.random.SeedSequence(seed).spawn(-(-samples // BATCH_SAMPLES))
+    sizes = [min(BATCH_SAMPLES, samples - i * BATCH_SAMPLES) for i in range(len(seeds))]
+    if workers > 0:
+        # The module is imported by name so spawned workers can find _bootstrap
+        import correlations as module
+        pool = _executor()
+        results = list(pool.map(module._bootstrap, *zip(*[(x, y, weights, seed, size) for seed, size in zip(seeds, sizes)])))
+    else:
+        results = [_bootstrap(x, y, weights, seed, size) for seed, size in zip(seeds, sizes)]
+    return np.concatenate([r for r, _ in results]), np.concatenate([coefficients for _, coefficients in results])
+
+
+def _interval(values):
+    tail = (1 - CONFIDENCE) / 2 * 100
+    with np.errstate(invalid='ignore'):
+        return np.nanpercentile(values, [tail, 100 - tail], axis=0)
+
+
+def analyze(first_year, last_year, samples=BOOTSTRAP_SAMPLES, seed=0):
+    """One row per outcome and feature: counties, Pearson and Spearman correlations
+    and the regression coefficient, with bootstrap confidence intervals."""
+    def build():
+        features = county_features()
+        outcomes = county_outcomes(first_year, last_year)
+        rates = [f'{outcome} per Million' for outcome in OUTCOMES]
+        x = features[list(FEATURES)].to_numpy()
+        y = outcomes[rates].to_numpy()
+        weights = features['Population'].to_numpy(dtype=np.float64)
+        standardized = (x - np.nanmean(x, axis=0)) / np.nanstd(x, axis=0)
+
+        r, n = pearson(x, y)
+        rho, _ = spearman(x, y)
+        coefficients = regression(standardized, y, weights)
+        sampled_r, sampled_coefficients = bootstrap(standardized, y, weights, samples, seed)
+        r_low, r_high = _interval(sampled_r)
+        coefficient_low, coefficient_high = _interval(sampled_coefficients)
+
+        def column(values):
+            # (feature, outcome) matrices -> outcome-major rows
+            return values.T.ravel()
+
+        return pd.DataFrame({
+            'Outcome': np.repeat(rates, len(FEATURES)),
+            'Feature': np.tile(list(FEATURES), len(rates)),
+            'Counties': column(n).astype(np.int64),
+            'Pearson': column(r),
+            'Pearson Low': column(r_low),
+            'Pearson High': column(r_high),
+            'Spearman': column(rho),
+            'Coefficient': column(coefficients),
+            'Coefficient Low': column(coefficient_low),
+            'Coefficient High': column(coefficient_high)
+        }).round(4)
+
+    key = ('correlations', first_year, last_year, samples, seed)
+    return data_loader.cached(key, data_loader.dataset_signature(data_loader.INCIDENTS), build,
+                              f'correlations {first_year}-{last_year}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Correlate county shootings with county attributes.")
+    parser.add_argument('--years', type=int, nargs=2, metavar=('FIRST', 'LAST'), default=None,
+                        help="year range (default: every year)")
+    parser.add_argument('--samples', type=int, default=BOOTSTRAP_SAMPLES, help="bootstrap samples (default: %(default)s)")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    cube = aggregates.load_cube()
+    first_year, last_year = args.years or (cube.first_year, cube.last_year)
+    result = analyze(first_year, last_year, args.samples, args.seed)
+    print(f"{first_year}-{last_year}, {args.samples} bootstrap samples, {CONFIDENCE:.0%} intervals")
+    with pd.option_context('display.width', 200, 'display.max_columns', None):
+        print(result.to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
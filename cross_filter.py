@@ -0,0 +1,114 @@
+import altair as alt
+
+import aggregates
+import geo
+
+# Cross-filter view of the interactive dashboard.
+# One Vega-Lite spec over the Year x State totals of every metric
+# (queries.state_year_table, a few hundred rows), shipped once and then
+# filtered entirely in the browser:
+#
+#   - brushing years on the regional line filters the map, the state trends
+#     and the state ranking to those years;
+#   - clicking states on the map (shift-click for more) filters the regional
+#     line to them and draws their trends;
+#   - the metric dropdown under the charts switches every chart.
+#
+# None of these interactions reruns the script, so they cost no server CPU.
+# The selections live in the one spec, so all charts are drawn as a single
+# concatenated chart.
+#
+#   chart = cross_filter.chart(queries.state_year_table(), region_palette)
+
+WIDTH = 500
+HEIGHT = 300
+TOP_STATES = 15
+
+
+def chart(table, region_palette, metric=aggregates.METRICS[0]):
+    """Concatenated, cross-filtered chart of `table` (see queries.state_year_table)."""
+    years = alt.selection_interval(name='years', encodings=['x'])
+    states = alt.selection_point(name='states', fields=['State'], on='click')
+    selected_metric = alt.param(
+        name='metric', value=metric,
+        bind=alt.binding_select(options=list(aggregates.METRICS), name="Metric ")
+    )
+
+    # The selected metric's column as 'Value'
+    base = alt.Chart(table).transform_calculate(Value=f'datum[{selected_metric.name}]')
+    def title(text, subtitle):
+        # `text` is a Vega expression, so titles follow the selected metric
+        return alt.Title(alt.ExprRef(expr=text), subtitle=subtitle)
+
+    region_line = base.transform_filter(states).transform_aggregate(
+        Value='sum(Value)', groupby=['Year', 'Region']
+    ).mark_line(point=True).encode(
+        x=alt.X('Year:Q', axis=alt.Axis(format='d', tickMinStep=1)),
+        y=alt.Y('Value:Q', title=None),
+        color=alt.Color('Region:N', scale=region_palette, legend=None),
+        tooltip=['Year:Q', 'Region:N', alt.Tooltip('Value:Q', title="Total")]
+    ).add_params(
+        years, selected_metric
+    ).properties(
+        title=title(f"'Total ' + {selected_metric.name} + ' by Region Over Time'", "Drag to select years"),
+        width=WIDTH,
+        height=HEIGHT
+    )
+
+    state_map = base.transform_filter(years).transform_aggregate(
+        Value='sum(Value)', groupby=['State', 'Region', 'FIPS_State']
+    ).transform_lookup(
+        lookup='FIPS_State',
+        from_=alt.LookupData(geo.features('states'), 'id'),
+        as_='geo'
+    ).mark_geoshape(
+        stroke='white'
+    ).encode(
+        shape='geo:G',
+        color=alt.Color('Region:N', scale=region_palette, legend=alt.Legend(title="Region")),
+        fillOpacity=alt.FillOpacity('Value:Q', scale=alt.Scale(range=[0.3, 1]), legend=None),
+        strokeWidth=alt.condition(states, alt.value(2), alt.value(0.5), empty=False),
+        tooltip=['State:N', 'Region:N', alt.Tooltip('Value:Q', title="Total")]
+    ).add_params(
+        states
+    ).project(
+        type='albersUsa'
+    ).properties(
+        title=title(f"{selected_metric.name} + ' by State in the Selected Years'", "Click to select states, shift-click for more"),
+        width=WIDTH,
+        height=HEIGHT
+    )
+
+    state_line = base.transform_filter(years).transform_filter({'param': states.name, 'empty': False}).mark_line(point=True).encode(
+        x=alt.X('Year:Q', axis=alt.Axis(format='d', tickMinStep=1)),
+        y=alt.Y('Value:Q', title=None),
+        color=alt.Color('State:N', legend=alt.Legend(title="States")),
+        tooltip=['Year:Q', 'State:N', alt.Tooltip('Value:Q', title="Total")]
+    ).properties(
+        title=title(f"{selected_metric.name} + ' Trend for Selected States'", "States selected on the map"),
+        width=WIDTH,
+        height=HEIGHT
+    )
+
+    state_ranking = base.transform_filter(years).transform_aggregate(
+        Value='sum(Value)', groupby=['State', 'Region']
+    ).transform_window(
+        Rank='rank()', sort=[alt.SortField('Value', order='descending')]
+    ).transform_filter(
+        alt.datum.Rank <= TOP_STATES
+    ).mark_bar().encode(
+        x=alt.X('Value:Q', title=None),
+        y=alt.Y('State:N', sort='-x', title=None),
+        color=alt.Color('Region:N', scale=region_palette, legend=None),
+        opacity=alt.condition(states, alt.value(1), alt.value(0.4)),
+        tooltip=['State:N', 'Region:N', alt.Tooltip('Value:Q', title="Total")]
+    ).properties(
+        title=title(f"'Top {TOP_STATES} States by ' + {selected_metric.name}", "In the selected years"),
+        width=WIDTH,
+        height=HEIGHT
+    )
+
+    return alt.vconcat(
+        alt.hconcat(region_line, state_map),
+        alt.hconcat(state_line, state_ranking)
+    ).resolve_scale(color='independent')
@@ -0,0 +1,652 @@
+import json
+import logging
+import os
+import threading
+import time
+
+import pandas as pd
+
+import dimensions
+import incidents
+import profiling
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+except ImportError:  # snapshots are optional, the CSV sources always work
+    pa = None
+
+# Shared data loading for both dashboards.
+# Every source file is parsed once per process and the parsed frame is handed
+# to every Streamlit session. The cache is keyed on the file path plus its
+# modification time and size, so an updated CSV is picked up on the next rerun
+# without restarting the server.
+#
+# load_dataset() returns typed frames. It memory-maps the Arrow IPC snapshot
+# written by ingest.py and falls back to parsing the CSV/XLSX source when the
+# snapshot is missing or older than its source.
+#
+# The three incident files hold the same incidents with different columns.
+# They are reconciled into one canonical store keyed by (File, Incident ID)
+# (see incidents.py), which the dashboards read as load_dataset('incidents');
+# the source frames are only read to build it and are not kept.
+#
+# New incidents arrive as append-only batches (ingest.py --append) in
+# appends/. The incident datasets are their source plus every batch; a new
+# batch is parsed and concatenated onto the cached frame on the next rerun,
+# and derived objects registered with cached_incremental() are updated from
+# the appended rows instead of being rebuilt.
+#
+# The State, Region and File columns of every dataset share one integer code
+# per value (see dimensions.py): load_dimensions() collects the values of all
+# datasets and load_dataset() recodes each frame onto them.
+#
+# With SHOOTINGS_SHARED_DIR set, the process is a serving worker: datasets,
+# dimensions and the aggregate cube are attached read-only from the files a
+# shared.py publisher keeps in that directory, instead of being loaded here.
+#
+# With SHOOTINGS_AGGREGATES_DIR set, the incident aggregates (the cube and
+# the per-cell totals the overview groups) come from the directory
+# streaming.py publishes for feeds larger than memory; see load_streamed().
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'snapshots')
+APPEND_DIR = os.path.join(os.path.dirname(SNAPSHOT_DIR), 'appends')
+SHARED_DIR = os.environ.get('SHOOTINGS_SHARED_DIR')
+SHARED_MANIFEST = 'current.json'
+AGGREGATES_DIR = os.environ.get('SHOOTINGS_AGGREGATES_DIR')
+
+# Sessions receive shallow copies of the cached frames. With copy-on-write a
+# session can add or replace columns without touching the shared original.
+if int(pd.__version__.split('.')[0]) < 3:
+    try:
+        pd.set_option('mode.copy_on_write', True)
+    except (KeyError, pd.errors.OptionError):
+        pass
+
+_lock = threading.Lock()
+_entries = {}       # cache key -> (signature, frame or derived object)
+_key_locks = {}     # cache key -> lock held while parsing
+_stats = {
+    'hits': 0,
+    'misses': 0,
+    'load_seconds': 0.0,
+    'files': {}
+}
+
+
+def _file_signature(path):
+    info = os.stat(path)
+    return info.st_mtime_ns, info.st_size
+
+
+def _freeze(kwargs):
+    return tuple(sorted((name, repr(value)) for name, value in kwargs.items()))
+
+
+def _share(value):
+    if isinstance(value, pd.DataFrame):
+        return value.copy(deep=False)
+    return value
+
+
+def _load(key, signature, reader, label):
+    with _lock:
+        entry = _entries.get(key)
+        if entry is not None and entry[0] == signature:
+            _stats['hits'] += 1
+            return _share(entry[1])
+        key_lock = _key_locks.setdefault(key, threading.Lock())
+
+    # Only one session parses a given file; the others wait and then hit.
+    with key_lock:
+        with _lock:
+            entry = _entries.get(key)
+            if entry is not None and entry[0] == signature:
+                _stats['hits'] += 1
+                return _share(entry[1])
+
+        start = time.perf_counter()
+        with profiling.phase('compute' if key[0] == 'derived' else 'load', label):
+            value = reader()
+        elapsed = time.perf_counter() - start
+
+        with _lock:
+            _entries[key] = (signature, value)
+            _stats['misses'] += 1
+            _stats['load_seconds'] += elapsed
+            file_stats = _stats['files'].setdefault(label, {'loads': 0, 'last_load_seconds': 0.0})
+            file_stats['loads'] += 1
+            file_stats['last_load_seconds'] = elapsed
+        logger.info("Loaded %s in %.3fs", label, elapsed)
+        return _share(value)
+
+
+def _cached_entry(key):
+    with _lock:
+        return _entries.get(key)
+
+
+def read_csv(path, **kwargs):
+    """Cached equivalent of pd.read_csv. Treat the result as read-only."""
+    path = os.path.abspath(path)
+    return _load(('csv', path, _freeze(kwargs)), _file_signature(path),
+                 lambda: pd.read_csv(path, **kwargs), os.path.basename(path))
+
+
+def read_excel(path, **kwargs):
+    """Cached equivalent of pd.read_excel. Treat the result as read-only."""
+    path = os.path.abspath(path)
+    return _load(('excel', path, _freeze(kwargs)), _file_signature(path),
+                 lambda: pd.read_excel(path, **kwargs), os.path.basename(path))
+
+
+# Typed datasets
+
+# Bump when a typing step changes so existing snapshots are treated as stale
+SNAPSHOT_VERSION = 3
+
+METRIC_COLUMNS = ['Victims Killed', 'Victims Injured', 'Total Victims',
+                  'Suspects Killed', 'Suspects Injured', 'Suspects Arrested']
+MONEY_COLUMNS = ['Cost of Living', 'Median Income']
+
+# Placeholder MassShootingCounty2.csv has for counties the others leave empty
+# or name
+MISSING_COUNTY = 'County not found'
+
+# Column types of the incident tables, applied in a single astype pass.
+# Columns missing from a given source are skipped.
+INCIDENT_SCHEMA = {
+    'File': 'category',
+    'State': 'category',
+    'Region': 'category',
+    'PopulrVoteParty': 'category',
+    'Year': 'int16',
+    'Month': pd.CategoricalDtype(range(1, 13), ordered=True),
+    'Day': 'int8',
+    'FIPS': 'int32',
+    'FIPS_State': 'int8',
+    **{column: 'int32' for column in METRIC_COLUMNS}
+}
+
+
+def _parse_money(values):
+    return pd.to_numeric(values.str.replace('$', '', regex=False).str.replace(',', '', regex=False))
+
+
+def _prepare_incidents(frame):
+    frame = frame.copy()
+    dates = pd.to_datetime(frame['Incident Date'], format='ISO8601', utc=True).dt.tz_convert(None)
+    frame['Incident Date'] = dates
+    for part in ['Year', 'Month', 'Day']:
+        if part not in frame.columns:
+            frame[part] = getattr(dates.dt, part.lower())
+    if 'FIPS' in frame.columns:
+        frame['FIPS'] = frame['FIPS'].fillna(0)
+    if 'County' in frame.columns:
+        frame['County'] = frame['County'].mask(frame['County'] == MISSING_COUNTY)
+    for column in MONEY_COLUMNS:
+        if column in frame.columns:
+            frame[column] = _parse_money(frame[column])
+    if 'Crime Rate' in frame.columns:
+        rate = frame['Crime Rate'].str.split('/', expand=True)
+        frame['Crime Rate'] = pd.to_numeric(rate[0]) / pd.to_numeric(rate[1])
+    if 'Unemployment' in frame.columns:
+        frame['Unemployment'] = pd.to_numeric(frame['Unemployment'].str.rstrip('%')) / 100
+    return frame.astype({column: dtype for column, dtype in INCIDENT_SCHEMA.items() if column in frame.columns})
+
+
+def _prepare_fips(frame):
+    frame = frame.copy()
+    frame['State'] = frame['State'].astype('category')
+    frame['FIPS'] = frame['FIPS'].astype('int32')
+    return frame
+
+
+def _prepare_population(frame):
+    # population.xlsx: one column per year, state names prefixed with '.'
+    frame = frame.dropna(subset=['State']).copy()
+    frame.columns = frame.columns.astype(str)
+    frame['State'] = frame['State'].str.replace('.', '', regex=False)
+    frame['Population'] = frame['2023']
+    return frame
+
+
+def _prepare_populations(frame):
+    frame = frame.copy()
+    frame['Population'] = frame['Population'].astype('int64')
+    return frame
+
+
+def _unchanged(frame):
+    return frame
+
+
+# Datasets holding the incidents; appended batches are added to all three.
+# In order of precedence for the incident store: mass-shootings-csv.csv has
+# every column and its county names match FIPS.csv
+INCIDENT_DATASETS = ['mass_shootings', 'mass_school_shootings', 'counties']
+
+# The canonical incident store reconciled from INCIDENT_DATASETS
+INCIDENTS = 'incidents'
+
+
+DATASETS = {
+    'mass_shootings': ('mass-shootings-csv.csv', {}, _prepare_incidents),
+    'mass_school_shootings': ('MassShootingCounty2.csv', {}, _prepare_incidents),
+    'counties': ('FIPSCounties2.csv', {'delimiter': ';'}, _prepare_incidents),
+    'fips': ('FIPS.csv', {}, _prepare_fips),
+    'state_coord': ('2019USCensus.csv', {'delimiter': ';'}, _unchanged),
+    'population': ('population.xlsx', {}, _prepare_population),
+    'populations': ('populations-csv.csv', {}, _prepare_populations),
+}
+
+# What the dashboards read: the incident store in place of its sources
+SERVED_DATASETS = [INCIDENTS] + [name for name in DATASETS if name not in INCIDENT_DATASETS]
+
+
+def source_path(name):
+    return os.path.join(os.path.dirname(SNAPSHOT_DIR), DATASETS[name][0])
+
+
+def set_data_root(root):
+    """Read the sources, snapshots/ and appends/ under `root` instead of next to
+    this module; bench.py points it at copies of the data at larger scales."""
+    global SNAPSHOT_DIR, APPEND_DIR
+    SNAPSHOT_DIR = os.path.join(root, 'snapshots')
+    APPEND_DIR = os.path.join(root, 'appends')
+
+
+def source_paths(name):
+    """Source files of a dataset or of the incident store."""
+    return [source_path(source) for source in INCIDENT_DATASETS] if name == INCIDENTS else [source_path(name)]
+
+
+def _label(name):
+    return DATASETS[name][0] if name in DATASETS else name
+
+
+def snapshot_path(name, snapshot_dir=None):
+    return os.path.join(snapshot_dir or SNAPSHOT_DIR, f'{name}.arrow')
+
+
+def parse_source(name, path=None):
+    """Parse a dataset from its CSV/XLSX source and apply its typing step.
+
+    `path` reads a file with the same layout instead of the shipped source.
+    """
+    source, read_kwargs, prepare = DATASETS[name]
+    path = path or source_path(name)
+    if source.endswith('.xlsx'):
+        raw = pd.read_excel(path, **read_kwargs)
+    else:
+        raw = pd.read_csv(path, **read_kwargs)
+    return prepare(raw)
+
+
+def snapshot_is_current(name, snapshot_dir=None):
+    if pa is None:
+        return False
+    path = snapshot_path(name, snapshot_dir)
+    if not os.path.exists(path):
+        return False
+    with pa.memory_map(path, 'r') as source:
+        metadata = pa.ipc.open_file(source).schema.metadata or {}
+    mtime, size = _file_signature(source_path(name))
+    return (metadata.get(b'source_mtime_ns') == str(mtime).encode()
+            and metadata.get(b'source_size') == str(size).encode()
+            and metadata.get(b'snapshot_version') == str(SNAPSHOT_VERSION).encode())
+
+
+def read_arrow(path):
+    source = pa.memory_map(path, 'r')
+    table = pa.ipc.open_file(source).read_all()
+    # split_blocks lets numeric columns stay backed by the mapped buffers
+    return table.to_pandas(split_blocks=True)
+
+
+def write_arrow(frame, path, metadata=None):
+    """Write a frame as an uncompressed Arrow IPC file, atomically."""
+    if pa is None:
+        raise RuntimeError("pyarrow is required to write Arrow files")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # One record batch, so readers can map every column without concatenating
+    table = pa.Table.from_pandas(frame, preserve_index=False).combine_chunks()
+    for i, name in enumerate(table.column_names):
+        # NaN is stored as a float value rather than a null, which readers
+        # would have to copy the column to turn back into NaN
+        if pa.types.is_floating(table.schema.field(i).type) and table.column(i).null_count:
+            table = table.set_column(i, table.schema.field(i), pa.array(frame[name].to_numpy(), from_pandas=False))
+    if metadata:
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}), **metadata})
+    tmp_path = path + '.tmp'
+    with pa.OSFile(tmp_path, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)
+    return path
+
+
+def write_snapshot(name, frame, snapshot_dir=None):
+    """Write a typed frame as an uncompressed Arrow IPC file tagged with its source signature."""
+    mtime, size = _file_signature(source_path(name))
+    return write_arrow(frame, snapshot_path(name, snapshot_dir), {
+        b'source_mtime_ns': str(mtime).encode(),
+        b'source_size': str(size).encode(),
+        b'snapshot_version': str(SNAPSHOT_VERSION).encode()
+    })
+
+
+def _read_source(name):
+    """Typed frame of one dataset, from its current snapshot or its source, uncached."""
+    return read_arrow(snapshot_path(name)) if snapshot_is_current(name) else parse_source(name)
+
+
+def reconcile_incidents(frames):
+    """(store, conflicts) of the incident datasets in `frames` (see incidents.reconcile)."""
+    return incidents.reconcile({name: frames[name] for name in INCIDENT_DATASETS})
+
+
+def _reconciled():
+    signature = dataset_signature(INCIDENTS)[:2]
+    # The sources are dropped once reconciled; only the store is cached
+    return _load(('dataset', INCIDENTS), signature,
+                 lambda: reconcile_incidents({name: _read_source(name) for name in INCIDENT_DATASETS}),
+                 'incident store')
+
+
+def incident_conflicts():
+    """Values the incident sources disagree on, one row per incident, column and
+    source; the store keeps the value of the earliest of INCIDENT_DATASETS."""
+    if SHARED_DIR:
+        return _load(('shared', 'incident_conflicts'), dataset_signature(INCIDENTS),
+                     lambda: read_arrow(shared_path('incident_conflicts.arrow')), 'incident conflicts (shared)')
+    return _reconciled()[1].copy(deep=False)
+
+
+def _load_source(name):
+    if name == INCIDENTS:
+        return _reconciled()[0].copy(deep=False)
+    source = source_path(name)
+    snapshot = snapshot_path(name)
+    use_snapshot = snapshot_is_current(name)
+    signature = (_file_signature(source), _file_signature(snapshot) if use_snapshot else None)
+    if use_snapshot:
+        return _load(('dataset', name), signature, lambda: read_arrow(snapshot), os.path.basename(snapshot))
+    if pa is not None and os.path.exists(snapshot):
+        logger.warning("Snapshot %s is stale, parsing %s instead; rerun ingest.py", snapshot, DATASETS[name][0])
+    return _load(('dataset', name), signature, lambda: parse_source(name), DATASETS[name][0])
+
+
+# Appended batches
+
+def appended_batches():
+    """Paths of the appended incident batches, oldest first."""
+    if not os.path.isdir(APPEND_DIR):
+        return []
+    return [os.path.join(APPEND_DIR, name) for name in sorted(os.listdir(APPEND_DIR)) if name.endswith('.csv')]
+
+
+def source_columns(name):
+    """Columns of a dataset's source file, in file order."""
+    if name == INCIDENTS:
+        # The store has the columns of its widest source
+        name = INCIDENT_DATASETS[0]
+    _, read_kwargs, _ = DATASETS[name]
+    return list(read_csv(source_path(name), nrows=0, **read_kwargs).columns)
+
+
+def read_batch(name, path):
+    """Typed rows of one appended batch, in the columns of dataset `name`."""
+    # Batches are stored in the mass-shootings-csv.csv layout, a superset of
+    # the other incident files
+    raw = read_csv(path)
+    return _prepare_incidents(raw[source_columns(name)])
+
+
+def _append_rows(frame, rows):
+    """frame followed by rows, skipping (File, Incident ID) pairs it already holds."""
+    if 'File' in frame.columns:
+        known = pd.MultiIndex.from_frame(frame[['File', 'Incident ID']].astype({'File': str}))
+        new = ~pd.MultiIndex.from_frame(rows[['File', 'Incident ID']].astype({'File': str})).isin(known)
+    else:
+        new = ~rows['Incident ID'].isin(frame['Incident ID'])
+    rows = rows[new]
+    if rows.empty:
+        return frame
+    dtypes = {}
+    for column, dtype in frame.dtypes.items():
+        if isinstance(dtype, pd.CategoricalDtype) and column in rows.columns:
+            # Categories grow with the batch; Month keeps its fixed categories
+            categories = dtype.categories.union(rows[column].astype(dtype.categories.dtype).dropna().unique(), sort=False)
+            dtypes[column] = pd.CategoricalDtype(categories, ordered=dtype.ordered)
+        else:
+            dtypes[column] = dtype
+    return pd.concat([frame, rows], ignore_index=True).astype(dtypes)
+
+
+def _extends(old_signature, new_signature):
+    """True when new_signature is old_signature plus more appended batches."""
+    return (old_signature[:2] == new_signature[:2]
+            and new_signature[2][:len(old_signature[2])] == old_signature[2])
+
+
+def _load_appended(name):
+    """Typed frame of dataset `name` with its appended batches, in its own categories."""
+    frame = _load_source(name)
+    if name not in INCIDENT_DATASETS + [INCIDENTS]:
+        return frame
+    signature = dataset_signature(name)
+    if not signature[2]:
+        return frame
+    key = ('appended', name)
+
+    def build():
+        # Only batches newer than the cached frame are parsed
+        previous = _cached_entry(key)
+        if previous is not None and _extends(previous[0], signature):
+            combined, batches = previous[1], previous[0][2]
+        else:
+            combined, batches = frame, ()
+        for batch in signature[2][len(batches):]:
+            combined = _append_rows(combined, read_batch(name, os.path.join(APPEND_DIR, batch)))
+        return combined
+
+    return _load(key, signature, build, f'{_label(name)} + {len(signature[2])} appended batches')
+
+
+def load_dataset(name):
+    """Typed, cached frame for one of DATASETS or the INCIDENTS store, its
+    dimension columns coded by load_dimensions(). Treat the result as read-only."""
+    if SHARED_DIR:
+        return _load(('shared', name), dataset_signature(name),
+                     lambda: read_arrow(shared_path(f'{name}.arrow')), f'{name} (shared)')
+    frame = _load_appended(name)
+    if name not in DIMENSION_DATASETS:
+        return frame
+    columns = [column for column in DIMENSION_COLUMNS if column in frame.columns]
+    registry = load_dimensions()
+    return _load(('coded', name), (dataset_signature(name), _dimension_signature()),
+                 lambda: frame.astype({column: registry.dtype(column) for column in columns}),
+                 f'{_label(name)} coded')
+
+
+# Dimensions
+
+# Columns coded by the shared dimensions, and the datasets that hold them
+DIMENSION_COLUMNS = ['State', 'Region', 'File']
+DIMENSION_DATASETS = [INCIDENTS, 'fips']
+
+
+def _dimension_signature():
+    return tuple(dataset_signature(name) for name in DIMENSION_DATASETS)
+
+
+def _build_dimensions():
+    sources = [_load_source(name) for name in DIMENSION_DATASETS]
+    frames = [_load_appended(name) for name in DIMENSION_DATASETS]
+    if AGGREGATES_DIR:
+        # Values of the streamed feed get codes after the shipped ones
+        frames.append(_streamed_frame('cells'))
+
+    def values(frames, column):
+        return [value for frame in frames if column in frame.columns for value in frame[column].dropna().unique()]
+
+    built = []
+    for column in DIMENSION_COLUMNS:
+        # Shipped values in sorted order, then values first seen in appended
+        # batches in arrival order, so existing codes never move
+        dimension = dimensions.Dimension(column, sorted(set(values(sources, column))))
+        built.append(dimension.extended(values(frames, column)))
+    county = dimensions.Dimension('FIPS', sorted({int(value) for value in values(frames, 'FIPS')} - {0}))
+    registry = dimensions.Registry(built + [county])
+
+    for frame in frames:
+        if 'Region' in frame.columns:
+            pairs = frame[['State', 'Region']].dropna().drop_duplicates()
+            registry.state_region[registry.codes('State', pairs['State'])] = registry.codes('Region', pairs['Region'])
+    return registry
+
+
+def load_dimensions():
+    """The dimensions.Registry of State, Region, File and county FIPS codes,
+    rebuilt whenever a dataset holding them changes."""
+    if SHARED_DIR:
+        return _load(('dimensions',), dataset_signature('fips'),
+                     lambda: dimensions.Registry.from_dict(shared_manifest()['dimensions']), 'dimensions (shared)')
+    return _load(('dimensions',), _dimension_signature(), _build_dimensions, 'dimensions')
+
+
+def dataset_signature(name):
+    """Changes whenever the dataset's source or snapshot file changes or a batch is appended."""
+    if SHARED_DIR:
+        # Each publication replaces every dataset at once
+        return ('shared', shared_manifest()['generation']), None, ()
+    if name == INCIDENTS:
+        sources = [dataset_signature(source) for source in INCIDENT_DATASETS]
+        # Streamed aggregates stand in for the store's, so they version it too
+        streamed = (streamed_signature(),) if AGGREGATES_DIR else ()
+        return tuple(source[0] for source in sources) + streamed, tuple(source[1] for source in sources), sources[0][2]
+    snapshot = snapshot_path(name)
+    snapshot_signature = _file_signature(snapshot) if os.path.exists(snapshot) else None
+    batches = tuple(os.path.basename(path) for path in appended_batches()) if name in INCIDENT_DATASETS else ()
+    return _file_signature(source_path(name)), snapshot_signature, batches
+
+
+# Serving mode
+
+def _manifest(directory, label):
+    path = os.path.join(directory, SHARED_MANIFEST)
+
+    def read():
+        with open(path) as source:
+            return json.load(source)
+
+    return _load((label,), _file_signature(path), read, label)
+
+
+def shared_manifest():
+    """Manifest of the current publication in SHARED_DIR (see shared.py)."""
+    return _manifest(SHARED_DIR, 'shared manifest')
+
+
+def shared_path(*parts):
+    """Path of a file in the current publication in SHARED_DIR."""
+    return os.path.join(SHARED_DIR, shared_manifest()['generation'], *parts)
+
+
+# Streamed aggregates
+
+def streamed_manifest():
+    """Manifest of the current publication in AGGREGATES_DIR (see streaming.py)."""
+    return _manifest(AGGREGATES_DIR, 'streamed manifest')
+
+
+def streamed_path(*parts):
+    """Path of a file in the current publication in AGGREGATES_DIR."""
+    return os.path.join(AGGREGATES_DIR, streamed_manifest()['generation'], *parts)
+
+
+def streamed_signature():
+    """Changes with every publication in AGGREGATES_DIR; None without one."""
+    return ('streamed', streamed_manifest()['generation']) if AGGREGATES_DIR else None
+
+
+def _streamed_frame(name):
+    return _load(('streamed', name), streamed_signature(), lambda: read_arrow(streamed_path(f'{name}.arrow')),
+                 f'{name} (streamed)')
+
+
+def load_streamed(name):
+    """Frame `name` of the current streamed publication, its dimension columns
+    coded by load_dimensions(). Treat the result as read-only."""
+    frame = _streamed_frame(name)
+    columns = [column for column in DIMENSION_COLUMNS if column in frame.columns]
+    registry = load_dimensions()
+    return _load(('streamed coded', name), (streamed_signature(), _dimension_signature()),
+                 lambda: frame.astype({column: registry.dtype(column) for column in columns}),
+                 f'{name} (streamed) coded')
+
+
+def cached(key, signature, build, label=None):
+    """Process-wide cache for objects derived from the datasets.
+
+    build() runs once per signature; pass dataset_signature() of the inputs so
+    the result is rebuilt when they change.
+    """
+    return _load(('derived',) + tuple(key), signature, build, label or str(key))
+
+
+def cached_incremental(key, name, build, update, label=None):
+    """cached() for objects derived from an incident dataset that can absorb new rows.
+
+    build(frame) makes the object from the whole dataset. When only batches
+    were appended since the cached object was made, update(previous, rows) is
+    called with the appended rows instead; it returns the updated object
+    (without modifying `previous`, which other sessions may hold) or None to
+    rebuild from scratch.
+    """
+    signature = dataset_signature(name)
+    key = ('derived',) + tuple(key)
+
+    def make():
+        frame = load_dataset(name)
+        previous = _cached_entry(key)
+        if previous is not None and _extends(previous[0], signature):
+            value, rows = previous[1]
+            if rows == len(frame):
+                return value, rows
+            # Frames only grow at the end while the source is unchanged
+            value = update(value, frame.iloc[rows:])
+            if value is not None:
+                return value, len(frame)
+        return build(frame), len(frame)
+
+    return _load(key, signature, make, label or str(key))[0]
+
+
+def cache_info():
+    """Return hit/miss counts, total load time and per-file load times."""
+    with _lock:
+        files = {path: dict(info) for path, info in _stats['files'].items()}
+        return {
+            'hits': _stats['hits'],
+            'misses': _stats['misses'],
+            'load_seconds': round(_stats['load_seconds'], 4),
+            'cached_frames': len(_entries),
+            'files': files
+        }
+
+
+def clear_cache(*prefixes):
+    """Drop every cached entry, or only those whose key starts with one of
+    `prefixes`, e.g. ('derived', 'query') for the query results."""
+    with _lock:
+        if prefixes:
+            for key in [key for key in _entries if any(key[:len(prefix)] == prefix for prefix in prefixes)]:
+                del _entries[key]
+            return
+        _entries.clear()
+        _key_locks.clear()
+        _stats.update(hits=0, misses=0, load_seconds=0.0, files={})
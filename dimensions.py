@@ -0,0 +1,137 @@
+import numpy as np
+import pandas as pd
+
+import profiling
+
+# Dense integer codes for the dimensions the dashboards join, filter and
+# group on: State, Region, File and county FIPS.
+# Each Dimension fixes the order of its values once, so a value has the same
+# code in every frame. data_loader types the State/Region/File columns of the
+# incident and FIPS datasets with the dimension's CategoricalDtype, so their
+# .cat.codes are those codes, and joins become array indexing into small
+# lookup tables instead of hashing strings. Codes are append-only: a value first seen in a
+# later batch gets the next free code and existing codes never move.
+#
+#   registry = data_loader.load_dimensions()
+#   registry.codes('State', frame['State'])          # int codes, -1 if unknown
+#   registry.join(frame, population, on='State')     # left join by array indexing
+#   registry.merge(left, right, on=['State', 'FIPS'])
+
+
+class Dimension:
+    """Values of one dimension in code order, with their display names."""
+
+    def __init__(self, name, values):
+        self.name = name
+        values = pd.Index(values).dropna().unique()
+        self.dtype = pd.CategoricalDtype(values)
+        self.names = values.to_numpy()
+
+    def __len__(self):
+        return len(self.names)
+
+    def extended(self, values):
+        """Dimension with the unseen `values` appended after the current ones."""
+        values = pd.Index(values).dropna().unique()
+        new = values[self.dtype.categories.get_indexer(values) < 0]
+        return self if len(new) == 0 else Dimension(self.name, self.dtype.categories.append(new))
+
+    def codes(self, values):
+        """Integer code of each value; -1 for missing or unknown values."""
+        if isinstance(values, pd.Series) and values.dtype == self.dtype:
+            return values.cat.codes.to_numpy()
+        if isinstance(values, pd.Series) and isinstance(values.dtype, pd.CategoricalDtype):
+            # Categories of another frame: translate them once, then index
+            translated = np.r_[self.dtype.categories.get_indexer(values.cat.categories), -1]
+            return translated[values.cat.codes.to_numpy()]
+        return self.dtype.categories.get_indexer(pd.Index(values))
+
+    def decode(self, codes):
+        """Display names of `codes`; -1 gives NaN."""
+        codes = np.asarray(codes)
+        return np.where(codes >= 0, self.names[np.maximum(codes, 0)] if len(self) else None, np.nan)
+
+    def positions(self, table, on):
+        """Row of `table` holding each code, -1 where it has none; the last
+        entry is -1 so that code -1 also finds nothing."""
+        positions = np.full(len(self) + 1, -1, dtype=np.int64)
+        codes = self.codes(table[on])
+        known = codes >= 0
+        positions[codes[known]] = np.flatnonzero(known)
+        return positions
+
+    def map(self, values, mapping):
+        """Values of a {name: value} mapping for `values`, through a dense per-code table."""
+        table = np.array([mapping.get(name, np.nan) for name in self.names] + [np.nan], dtype=object)
+        return table[self.codes(values)]
+
+
+class Registry:
+    """The dimension tables, plus the region of each state."""
+
+    def __init__(self, dimensions, state_region=None):
+        self.dimensions = {dimension.name: dimension for dimension in dimensions}
+        # Region code of each State code, -1 when unknown
+        self.state_region = state_region if state_region is not None else np.full(len(self['State']), -1)
+
+    def __getitem__(self, name):
+        return self.dimensions[name]
+
+    def to_dict(self):
+        """JSON-serializable form, read back by Registry.from_dict()."""
+        return {
+            'dimensions': {name: dimension.names.tolist() for name, dimension in self.dimensions.items()},
+            'state_region': self.state_region.tolist()
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        dimensions = [Dimension(name, values) for name, values in data['dimensions'].items()]
+        return cls(dimensions, np.array(data['state_region'], dtype=np.int64))
+
+    def dtype(self, column):
+        return self.dimensions[column].dtype if column in self.dimensions else None
+
+    def codes(self, column, values):
+        return self.dimensions[column].codes(values)
+
+    def decode(self, column, codes):
+        return self.dimensions[column].decode(codes)
+
+    def isin(self, column, values, selected):
+        """Boolean mask of `values` in `selected`, compared on codes."""
+        return np.isin(self.codes(column, values), self.codes(column, selected))
+
+    def region_of(self, state):
+        """Region name of one state."""
+        code = self.state_region[self.codes('State', [state])[0]]
+        return self['Region'].names[code] if code >= 0 else None
+
+    def join(self, frame, table, on, columns=None):
+        """Left join of `table`'s `columns` onto `frame` on one dimension
+        column, by array indexing. `table` must hold each value at most once."""
+        columns = [column for column in (columns or table.columns) if column != on]
+        overlap = set(columns) & set(frame.columns)
+        if overlap:
+            raise ValueError(f"columns {sorted(overlap)} are in both frames")
+        with profiling.phase('join', f'{on}: {", ".join(map(str, columns))}', rows=len(frame)):
+            dimension = self.dimensions[on]
+            rows = dimension.positions(table, on)[dimension.codes(frame[on])]
+            result = frame.copy()
+            for column in columns:
+                # Missing rows become NaN; fully matched integer columns keep their type
+                result[column] = pd.api.extensions.take(table[column].array, rows, allow_fill=True)
+            return result
+
+    def merge(self, left, right, on, how='left'):
+        """pd.merge on `on`, comparing dimension columns by their integer codes."""
+        keys = [f'_{column}_code' if column in self.dimensions else column for column in on]
+
+        def coded(frame):
+            return frame.assign(**{
+                key: self.codes(column, frame[column]) for key, column in zip(keys, on) if key != column
+            })
+
+        with profiling.phase('merge', ', '.join(on), rows=len(left)):
+            merged = pd.merge(coded(left), coded(right).drop(columns=[c for c in on if c in self.dimensions]), on=keys, how=how)
+            return merged.drop(columns=[key for key, column in zip(keys, on) if key != column])
@@ -0,0 +1,330 @@
+import argparse
+import hashlib
+import json
+import logging
+import math
+import os
+import urllib.request
+
+import altair as alt
+import numpy as np
+from vega_datasets import data
+
+import data_loader
+
+# Local, pre-simplified map geometry for the choropleths.
+# geo/ ships the us-10m TopoJSON (the us-atlas 10m counties and states on the
+# quantization grid of vega-datasets' us-10m.json, taken from bqplot's map
+# data, Apache-2.0) and its default simplified levels, so the maps draw from
+# disk with no network access.
+# Each map draws one payload per object and level: only the TopoJSON object
+# it draws, simplified for the chart size. A simplified level smooths every
+# shared border once (Douglas-Peucker), snaps it to a coarser grid and drops
+# islands and holes too small to see; each ring is then written as a single
+# arc, which at these sizes is smaller than sharing arcs between features and
+# still draws neighbouring borders identically. Payloads are written to
+# static/geo/ once, under a content hash, and served by Streamlit's static
+# file serving (.streamlit/config.toml), so every view shares them and the
+# browser caches each one. A view's metrics travel inline in its spec and are
+# joined to the features by FIPS id with a lookup, so a cached spec never
+# points at a file that has been replaced.
+# Without the local copy the charts fall back to the CDN URL.
+#
+#   python geo.py              # rebuild every level from geo/us-10m.json
+#   python geo.py --refetch    # replace geo/us-10m.json with the CDN copy first
+
+logger = logging.getLogger(__name__)
+
+GEO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'geo')
+US_10M_URL = data.us_10m.url
+US_10M_PATH = os.path.join(GEO_DIR, 'us-10m.json')
+STATIC_DIR = os.path.join(os.path.dirname(GEO_DIR), 'static', 'geo')
+STATIC_URL = 'app/static/geo'
+
+# Level name -> (Douglas-Peucker tolerance, quantization grid), both in
+# degrees; a pixel of the 500-800 px wide US maps spans about 0.07-0.12
+# degrees. 'full' keeps the source geometry untouched.
+LEVELS = {
+    'full': (0.0, 0.0),
+    'medium': (0.08, 0.05),
+    'low': (0.15, 0.1)
+}
+# Rings under this many cells of a level's grid are dropped, except the
+# largest polygon of each feature
+MIN_RING_CELLS = 4
+# States are drawn small and bold; counties need more detail to stay readable
+DEFAULT_LEVELS = {'states': 'low', 'counties': 'medium'}
+
+
+def fetch(url=US_10M_URL, path=US_10M_PATH):
+    """Download the source TopoJSON once."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with urllib.request.urlopen(url, timeout=60) as response, open(tmp_path, 'wb') as out:
+        out.write(response.read())
+    os.replace(tmp_path, path)
+    return path
+
+
+def level_path(object_name, level):
+    return os.path.join(GEO_DIR, f'us-10m-{object_name}-{level}.json')
+
+
+def available():
+    return os.path.exists(US_10M_PATH)
+
+
+def signature():
+    """Changes when the local geometry appears, disappears or is refetched."""
+    return os.stat(US_10M_PATH).st_mtime_ns if available() else None
+
+
+# TopoJSON arc handling
+
+def _decode_arcs(topology):
+    if 'transform' not in topology:
+        raise ValueError("only quantized TopoJSON is supported")
+    return [np.cumsum(np.asarray(arc, dtype=np.int64).reshape(-1, 2), axis=0) for arc in topology['arcs']]
+
+
+def _encode_arc(points):
+    return np.vstack([points[:1], np.diff(points, axis=0)]).tolist()
+
+
+def _douglas_peucker(points, tolerance):
+    """Indices of the points kept when simplifying an open polyline."""
+    keep = np.zeros(len(points), dtype=bool)
+    keep[[0, -1]] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        segment = points[end] - points[start]
+        inner = points[start + 1:end] - points[start]
+        length = math.hypot(*segment)
+        if length == 0:
+            distances = np.hypot(inner[:, 0], inner[:, 1])
+        else:
+            distances = np.abs(segment[0] * inner[:, 1] - segment[1] * inner[:, 0]) / length
+        farthest = int(distances.argmax())
+        if distances[farthest] > tolerance:
+            index = start + 1 + farthest
+            keep[index] = True
+            stack.extend([(start, index), (index, end)])
+    return keep
+
+
+def _simplify_arc(points, scale, tolerance, factor):
+    """Arc simplified within `tolerance` degrees and snapped to a grid
+    `factor` times coarser than the source's."""
+    degrees = points * scale
+    if len(points) > 2:
+        closed = (points[0] == points[-1]).all()
+        if closed:
+            # Split a ring at its farthest point so it cannot collapse to a line
+            split = int(np.hypot(*(degrees - degrees[0]).T).argmax())
+            keep = np.r_[_douglas_peucker(degrees[:split + 1], tolerance)[:-1],
+                         _douglas_peucker(degrees[split:], tolerance)]
+        else:
+            keep = _douglas_peucker(degrees, tolerance)
+        points = points[keep]
+    return np.rint(points / factor).astype(np.int64)
+
+
+def _ring(arcs, references):
+    """Points of a ring made of `references` to simplified arcs, without repeats."""
+    parts = [arcs[index] if index >= 0 else arcs[~index][::-1] for index in references]
+    points = np.vstack([parts[0]] + [part[1:] for part in parts[1:]])
+    moved = np.r_[True, (np.diff(points, axis=0) != 0).any(axis=1)]
+    return points[moved]
+
+
+def _area(points):
+    x, y = points[:, 0].astype(np.float64), points[:, 1].astype(np.float64)
+    return abs(np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1))) / 2
+
+
+def _remap_arcs(arcs, mapping):
+    if isinstance(arcs, int):
+        return mapping[arcs] if arcs >= 0 else ~mapping[~arcs]
+    return [_remap_arcs(part, mapping) for part in arcs]
+
+
+def _collect_arcs(arcs, used):
+    if isinstance(arcs, int):
+        used.add(arcs if arcs >= 0 else ~arcs)
+    else:
+        for part in arcs:
+            _collect_arcs(part, used)
+
+
+def _topology(topology, object_name, geometries, arcs, scale):
+    return {
+        'type': 'Topology',
+        'transform': {'scale': list(scale), 'translate': topology['transform']['translate']},
+        'objects': {object_name: {'type': 'GeometryCollection', 'geometries': geometries}},
+        'arcs': arcs
+    }
+
+
+def simplify(topology, object_name, level):
+    """New topology holding only `object_name`, simplified to `level`."""
+    tolerance, grid = LEVELS[level]
+    scale = np.asarray(topology['transform']['scale'])
+    geometries = topology['objects'][object_name]['geometries']
+    used = set()
+    for geometry in geometries:
+        _collect_arcs(geometry.get('arcs', []), used)
+    used = sorted(used)
+    decoded = _decode_arcs(topology)
+
+    if not grid:
+        mapping = {old: new for new, old in enumerate(used)}
+        return _topology(topology, object_name, [
+            {key: (_remap_arcs(value, mapping) if key == 'arcs' else value) for key, value in geometry.items()}
+            for geometry in geometries
+        ], [_encode_arc(decoded[index]) for index in used], scale)
+
+    # Shared borders are simplified once, so both sides stay identical
+    factor = np.maximum(1, np.rint(grid / scale)).astype(np.int64)
+    simplified = {index: _simplify_arc(decoded[index], scale, tolerance, factor) for index in used}
+
+    arcs, simplified_geometries = [], []
+    for geometry in geometries:
+        if geometry['type'] not in ('Polygon', 'MultiPolygon'):
+            simplified_geometries.append(geometry)
+            continue
+        polygons = geometry['arcs'] if geometry['type'] == 'MultiPolygon' else [geometry['arcs']]
+        rings = [[_ring(simplified, ring) for ring in polygon] for polygon in polygons]
+        largest = max(range(len(rings)), key=lambda i: _area(rings[i][0]))
+        kept = []
+        for i, polygon in enumerate(rings):
+            if i != largest and (len(polygon[0]) < 4 or _area(polygon[0]) < MIN_RING_CELLS):
+                continue
+            references = []
+            for j, ring in enumerate(polygon):
+                if j > 0 and (len(ring) < 4 or _area(ring) < MIN_RING_CELLS):
+                    continue
+                references.append([len(arcs)])
+                arcs.append(_encode_arc(ring))
+            kept.append(references)
+        simplified_geometries.append({
+            **geometry,
+            'type': 'MultiPolygon' if len(kept) > 1 else 'Polygon',
+            'arcs': kept if len(kept) > 1 else kept[0]
+        })
+    return _topology(topology, object_name, simplified_geometries, arcs, scale * factor)
+
+
+def load_object(object_name, level=None):
+    """Simplified topology of one object, from geo/ or built from us-10m.json."""
+    level = level or DEFAULT_LEVELS.get(object_name, 'full')
+    path = level_path(object_name, level)
+
+    def build():
+        if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(US_10M_PATH):
+            with open(path) as source:
+                return json.load(source)
+        with open(US_10M_PATH) as source:
+            return simplify(json.load(source), object_name, level)
+
+    return data_loader.cached(('geometry', object_name, level), os.stat(US_10M_PATH).st_mtime_ns, build, f'{object_name} geometry ({level})')
+
+
+def _key(value):
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return value
+
+
+def _json_value(value):
+    if isinstance(value, (np.integer,)):
+        return int(value)
+    if isinstance(value, (float, np.floating)):
+        return None if math.isnan(value) else float(value)
+    if hasattr(value, 'item'):
+        return value.item()
+    return value
+
+
+def lookup_data(frame, key, fields):
+    """alt.LookupData of `fields` of `frame` by `key`, as inline JSON records.
+
+    Inline records rather than the frame itself: Altair validates a frame
+    through the global data transformer as soon as the LookupData is made,
+    which would have to be serialized with Streamlit's own conversions.
+    """
+    fields = list(fields)
+    records = frame.dropna(subset=[key]).drop_duplicates(key)[[key] + fields]
+    values = [
+        {key: _key(row[0]), **{field: _json_value(value) for field, value in zip(fields, row[1:])}}
+        for row in records.itertuples(index=False, name=None)
+    ]
+    return alt.LookupData(alt.InlineData(values=values), key, fields)
+
+
+def publish(topology, name):
+    """Write a payload to static/geo/ under its content hash and return its URL."""
+    payload = json.dumps(topology, separators=(',', ':')).encode()
+    filename = f'{name}-{hashlib.sha1(payload).hexdigest()[:16]}.json'
+    path = os.path.join(STATIC_DIR, filename)
+    if not os.path.exists(path):
+        os.makedirs(STATIC_DIR, exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as out:
+            out.write(payload)
+        os.replace(tmp_path, path)
+    return f'{STATIC_URL}/{filename}'
+
+
+def features(object_name, level=None):
+    """Data source of the map features of one object."""
+    if not available():
+        logger.info("No local geometry in %s, using %s", GEO_DIR, US_10M_URL)
+        return alt.topo_feature(US_10M_URL, feature=object_name)
+    level = level or DEFAULT_LEVELS.get(object_name, 'full')
+
+    def build():
+        return publish(load_object(object_name, level), f'{object_name}-{level}')
+
+    url = data_loader.cached(('geometry_url', object_name, level), signature(), build, f'{object_name} payload ({level})')
+    return alt.topo_feature(url, feature=object_name)
+
+
+def choropleth(object_name, frame, key, fields, level=None):
+    """Base chart of map features carrying `fields` of `frame`, matched on feature id.
+
+    Drop-in replacement for alt.Chart(alt.topo_feature(...)).transform_lookup(...):
+    the fields end up as top-level datum fields, so encodings stay the same
+    whether the local geometry is available or not.
+    """
+    return alt.Chart(features(object_name, level)).transform_lookup(
+        lookup='id',
+        from_=lookup_data(frame, key, fields)
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prebuild simplified levels of the us-10m TopoJSON.")
+    parser.add_argument('--refetch', action='store_true', help="download us-10m.json from the CDN even if present")
+    args = parser.parse_args()
+    if args.refetch or not available():
+        print(f"Fetching {US_10M_URL}")
+        fetch()
+    with open(US_10M_PATH) as source:
+        topology = json.load(source)
+    for object_name in DEFAULT_LEVELS:
+        for level in LEVELS:
+            path = level_path(object_name, level)
+            with open(path, 'w') as out:
+                json.dump(simplify(topology, object_name, level), out, separators=(',', ':'))
+            # 'full' comes first, so every other level is compared with it
+            full_size = os.path.getsize(level_path(object_name, 'full'))
+            print(f"{os.path.relpath(path)}: {os.path.getsize(path) / 1024:.0f} KiB "
+                  f"({os.path.getsize(path) / full_size:.0%} of {object_name} at full detail)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+import argparse
+import logging
+
+import numpy as np
+import pandas as pd
+
+# Canonical incident store.
+# mass-shootings-csv.csv, MassShootingCounty2.csv and FIPSCounties2.csv hold
+# the same incidents with different column subsets. reconcile() merges the
+# typed source frames into one frame with a row per (File, Incident ID) and
+# the union of their columns, and reports every value the sources disagree
+# on. Rows are matched on a 64-bit hash of the key, so the sources are
+# aligned with one vectorized lookup instead of a merge per column.
+#
+# Sources are passed in order of precedence: a value from an earlier source
+# wins a conflict, and later sources only fill in missing values, columns and
+# incidents. data_loader builds the store once per version of the sources and
+# both dashboards read it as load_dataset('incidents').
+#
+#   store, conflicts = incidents.reconcile({'mass_shootings': ms, 'counties': counties})
+#   python incidents.py                       # conflicts between the shipped sources
+#   python incidents.py --output conflicts.csv
+
+logger = logging.getLogger(__name__)
+
+# Incident IDs are only unique within one incident family
+KEY = ['File', 'Incident ID']
+
+# Columns of the conflict report; Kept and Value hold the values as text, as
+# conflicts in columns of every type share them
+CONFLICT_COLUMNS = KEY + ['Column', 'Kept', 'Kept From', 'Value', 'Source']
+
+
+def key_hashes(frame):
+    """uint64 hash of each row's (File, Incident ID)."""
+    return pd.util.hash_pandas_object(frame[KEY].astype({'File': str}), index=False).to_numpy()
+
+
+def _values(series):
+    # Categories differ between sources, so compare the values themselves
+    if isinstance(series.dtype, pd.CategoricalDtype) or not isinstance(series.dtype, np.dtype):
+        return series.to_numpy(dtype=object, na_value=np.nan)
+    return series.to_numpy()
+
+
+def _check_keys(store, frame, positions):
+    # A hash match must be a key match; 64-bit collisions are not expected
+    for column in KEY:
+        if not (_values(store[column])[positions] == _values(frame[column])).all():
+            raise ValueError(f"hash collision on {'/'.join(KEY)}; cannot reconcile")
+
+
+def _unique(name, frame, hashes):
+    duplicated = pd.Index(hashes).duplicated()
+    if duplicated.any():
+        logger.warning("%s: dropped %d repeated %s rows", name, duplicated.sum(), '/'.join(KEY))
+        return frame[~duplicated].reset_index(drop=True), hashes[~duplicated]
+    return frame.reset_index(drop=True), hashes
+
+
+def _combine(kept, incoming, fill):
+    """kept with the rows in `fill` taken from incoming, in kept's dtype where it can hold them."""
+    values = np.where(fill, _values(incoming), _values(kept))
+    dtype = kept.dtype
+    if isinstance(dtype, pd.CategoricalDtype):
+        dtype = pd.CategoricalDtype(dtype.categories.union(pd.Index(values[fill]).unique(), sort=False), ordered=dtype.ordered)
+    elif dtype.kind in 'iub' and pd.isna(values).any():
+        dtype = 'float64'
+    return pd.Series(values, index=kept.index, name=kept.name).astype(dtype)
+
+
+def reconcile(sources):
+    """(store, conflicts) of {name: typed frame}, earlier sources taking precedence.
+
+    The store keeps the columns and dtypes of the first source, followed by
+    columns only later sources have. conflicts has one row per incident,
+    column and source whose value differs from the one kept.
+    """
+    names = list(sources)
+    store, hashes = _unique(names[0], sources[names[0]], key_hashes(sources[names[0]]))
+    origin = {column: np.full(len(store), names[0], dtype=object) for column in store.columns}
+    conflicts = []
+
+    for name in names[1:]:
+        frame, frame_hashes = _unique(name, sources[name], key_hashes(sources[name]))
+        positions = pd.Index(hashes).get_indexer(frame_hashes)
+        matched = positions >= 0
+        _check_keys(store, frame[matched], positions[matched])
+
+        # Incidents only this source has are appended, missing the columns it lacks
+        if not matched.all():
+            store = pd.concat([store, frame[~matched]], ignore_index=True)
+            hashes = np.concatenate([hashes, frame_hashes[~matched]])
+            positions[~matched] = np.arange(len(store) - (~matched).sum(), len(store))
+            for column in origin:
+                origin[column] = np.concatenate([origin[column], np.full((~matched).sum(), name if column in frame.columns else None, dtype=object)])
+
+        # Row of this source behind each store row, -1 where it has none
+        rows = np.full(len(store), -1)
+        rows[positions] = np.arange(len(frame))
+        for column in frame.columns:
+            incoming = pd.Series(pd.api.extensions.take(frame[column].array, rows, allow_fill=True), index=store.index, name=column)
+            if column not in origin:
+                store[column] = incoming
+                origin[column] = np.where(incoming.notna(), name, None)
+                continue
+            kept = _values(store[column])
+            kept_missing, incoming_missing = pd.isna(kept), incoming.isna().to_numpy()
+            differs = ~kept_missing & ~incoming_missing & (kept != _values(incoming))
+            if differs.any():
+                at = np.flatnonzero(differs)
+                conflicts.append(pd.DataFrame({
+                    'File': _values(store['File'])[at],
+                    'Incident ID': _values(store['Incident ID'])[at],
+                    'Column': column,
+                    'Kept': kept[at].astype(str),
+                    'Kept From': origin[column][at],
+                    # From the source frame: filling rows it lacks may have made incoming float
+                    'Value': _values(frame[column])[rows[at]].astype(str),
+                    'Source': name
+                }))
+            fill = kept_missing & ~incoming_missing
+            if fill.any():
+                store[column] = _combine(store[column], incoming, fill)
+                origin[column] = np.where(fill, name, origin[column])
+
+    conflicts = pd.concat(conflicts, ignore_index=True) if conflicts else pd.DataFrame(columns=CONFLICT_COLUMNS, dtype=str)
+    if len(conflicts):
+        logger.warning("Reconciled %d incidents from %s: %d conflicting values (%s)", len(store), ', '.join(names),
+                       len(conflicts), ', '.join(f'{column}: {count}' for column, count in conflicts['Column'].value_counts().items()))
+    return store, conflicts
+
+
+def main():
+    import data_loader
+
+    parser = argparse.ArgumentParser(description="Report the values the incident sources disagree on.")
+    parser.add_argument('--output', default=None, help="write every conflict to this CSV")
+    args = parser.parse_args()
+    store = data_loader.load_dataset(data_loader.INCIDENTS)
+    conflicts = data_loader.incident_conflicts()
+    print(f"{len(store)} incidents from {', '.join(data_loader.INCIDENT_DATASETS)}; {len(conflicts)} conflicting values")
+    if len(conflicts):
+        print(conflicts.groupby(['Column', 'Kept From', 'Source']).size().rename('values').to_string())
+    if args.output:
+        conflicts.to_csv(args.output, index=False)
+        print(f"-> {args.output}")
+
+
+if __name__ == '__main__':
+    main()
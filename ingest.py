@@ -0,0 +1,157 @@
+import argparse
+import collections
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+import data_loader
+
+# One-time ingest: converts the CSV/XLSX sources into typed Arrow IPC snapshots
+# that the dashboards memory-map on start-up.
+#
+#   python ingest.py                 # refresh missing or stale snapshots
+#   python ingest.py --force         # rebuild everything
+#   python ingest.py counties fips   # only the named datasets
+#
+# Incremental ingest: batches of new incidents in the mass-shootings-csv.csv
+# layout are validated, deduplicated and stored as append-only files in
+# appends/. Running dashboards pick them up on their next rerun and update
+# their aggregates by delta (see data_loader.load_dataset).
+#
+#   python ingest.py --append new-incidents.csv [more.csv ...]
+#   python ingest.py --append feed.csv --rejects rejected.csv
+
+
+def ingest(names=None, force=False, snapshot_dir=None):
+    written = []
+    for name in names or list(data_loader.DATASETS):
+        if not force and data_loader.snapshot_is_current(name, snapshot_dir):
+            print(f"{name}: up to date")
+            continue
+        start = time.perf_counter()
+        frame = data_loader.parse_source(name)
+        path = data_loader.write_snapshot(name, frame, snapshot_dir)
+        elapsed = time.perf_counter() - start
+        print(f"{name}: {len(frame)} rows -> {os.path.relpath(path)} "
+              f"({os.path.getsize(path) / 1024:.0f} KiB, {elapsed:.2f}s)")
+        written.append(path)
+    return written
+
+
+# Incremental ingest
+
+def _known_incidents():
+    """(File, Incident ID) pairs already ingested, from the source and earlier batches."""
+    frame = data_loader.load_dataset(data_loader.INCIDENTS)
+    return pd.MultiIndex.from_frame(frame[['File', 'Incident ID']].astype({'File': str}))
+
+
+def validate(raw, known=None):
+    """Split a raw batch into valid rows and rejected rows.
+
+    Rows need an integer Incident ID not ingested before for the same File,
+    an ISO date whose Year/Month/Day columns agree with it, a known state with
+    its FIPS_State code and Region, and non-negative integer counts whose
+    victims add up to Total Victims.
+    Returns (accepted, rejected); rejected carries a 'Reason' column.
+    """
+    columns = data_loader.source_columns('mass_shootings')
+    missing = [column for column in columns if column not in raw.columns]
+    if missing:
+        raise ValueError(f"batch is missing column(s): {', '.join(missing)}")
+    raw = raw[columns]
+    known = _known_incidents() if known is None else known
+    states = set(data_loader.load_dataset('fips')['State'].astype(str))
+
+    reason = pd.Series(None, index=raw.index, dtype=object)
+
+    def reject(mask, text):
+        reason[mask & reason.isna()] = text
+
+    incident_id = pd.to_numeric(raw['Incident ID'], errors='coerce')
+    reject(incident_id.isna() | (incident_id % 1 != 0), 'invalid Incident ID')
+    reject(~raw['File'].isin(['MS', 'SS']), 'invalid File')
+    dates = pd.to_datetime(raw['Incident Date'], format='ISO8601', utc=True, errors='coerce')
+    reject(dates.isna(), 'invalid Incident Date')
+    parts = {part: pd.to_numeric(raw[part], errors='coerce') for part in ['Year', 'Month', 'Day']}
+    reject((parts['Year'] != dates.dt.year) | (parts['Month'] != dates.dt.month) | (parts['Day'] != dates.dt.day),
+           'Year/Month/Day do not match Incident Date')
+    reject(~raw['State'].isin(states), 'unknown State')
+    counts = raw[data_loader.METRIC_COLUMNS].apply(pd.to_numeric, errors='coerce')
+    reject((counts.isna() | (counts < 0) | (counts % 1 != 0)).any(axis=1), 'invalid victim or suspect count')
+    reject(counts['Total Victims'] != counts['Victims Killed'] + counts['Victims Injured'],
+           'Total Victims is not Victims Killed + Victims Injured')
+    # FIPS may be empty (county unknown); the state's code and region may not
+    fips = pd.to_numeric(raw['FIPS'], errors='coerce')
+    reject((fips.isna() & raw['FIPS'].notna()) | (fips < 0) | (fips % 1 > 0), 'invalid FIPS')
+    fips_state = pd.to_numeric(raw['FIPS_State'], errors='coerce')
+    reject(raw['FIPS_State'].isna(), 'missing FIPS_State')
+    # State codes run from 1 (Alabama) to 56 (Wyoming)
+    reject(fips_state.isna() | (fips_state < 1) | (fips_state > 56) | (fips_state % 1 != 0), 'invalid FIPS_State')
+    reject(raw['Region'].isna() | (raw['Region'].str.strip() == ''), 'missing Region')
+
+    keys = pd.MultiIndex.from_arrays([raw['File'].astype(str), incident_id.fillna(-1).astype(np.int64)])
+    reject(pd.Series(keys.isin(known), index=raw.index), 'Incident ID already ingested')
+    reject(pd.Series(keys.duplicated(), index=raw.index), 'duplicate Incident ID in batch')
+
+    return raw[reason.isna()], raw[reason.notna()].assign(Reason=reason[reason.notna()])
+
+
+def _next_batch_path():
+    existing = [os.path.basename(path) for path in data_loader.appended_batches()]
+    number = int(existing[-1].split('-')[1]) + 1 if existing else 1
+    return os.path.join(data_loader.APPEND_DIR, f'batch-{number:06d}-{time.strftime("%Y%m%dT%H%M%S")}.csv')
+
+
+def append(path, rejects=None):
+    """Validate one batch and store its new incidents in appends/. Returns the stored path or None."""
+    start = time.perf_counter()
+    raw = pd.read_csv(path, dtype=str, keep_default_na=False, na_values=[''])
+    accepted, rejected = validate(raw)
+    reasons = collections.Counter(rejected['Reason'])
+    summary = ', '.join(f'{count} {text}' for text, count in reasons.most_common())
+    print(f"{os.path.basename(path)}: {len(accepted)} of {len(raw)} rows accepted"
+          + (f"; rejected: {summary}" if summary else ''))
+    if rejects is not None and len(rejected):
+        rejected.to_csv(rejects, mode='a', header=not os.path.exists(rejects), index=False)
+    if accepted.empty:
+        return None
+    os.makedirs(data_loader.APPEND_DIR, exist_ok=True)
+    target = _next_batch_path()
+    tmp_path = target + '.tmp'
+    accepted.to_csv(tmp_path, index=False)
+    try:
+        # The stored batch must load the way the dashboards will read it
+        for name in data_loader.INCIDENT_DATASETS:
+            data_loader.read_batch(name, tmp_path)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, target)
+    print(f"  -> {os.path.relpath(target)} ({time.perf_counter() - start:.2f}s)")
+    return target
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build typed Arrow snapshots of the dashboard datasets.")
+    parser.add_argument('datasets', nargs='*', metavar='dataset',
+                        help="datasets to ingest (default: all of %s)" % ', '.join(data_loader.DATASETS))
+    parser.add_argument('--force', action='store_true', help="rebuild snapshots even if they are current")
+    parser.add_argument('--output', default=None, help="snapshot directory (default: ./snapshots)")
+    parser.add_argument('--append', nargs='+', metavar='CSV', help="append batches of new incidents instead")
+    parser.add_argument('--rejects', default=None, help="with --append, also write rejected rows to this CSV")
+    args = parser.parse_args()
+    if args.append:
+        for path in args.append:
+            append(path, args.rejects)
+        return
+    unknown = [name for name in args.datasets if name not in data_loader.DATASETS]
+    if unknown:
+        parser.error(f"unknown dataset(s): {', '.join(unknown)}")
+    ingest(args.datasets, force=args.force, snapshot_dir=args.output)
+
+
+if __name__ == '__main__':
+    main()
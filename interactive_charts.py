@@ -0,0 +1,273 @@
+import functools
+
+import altair as alt
+
+import geo
+import query_service
+import timeseries
+
+# Charts of the interactive dashboard (shootings_dashboard_interactive.py).
+# chart_builders() returns the function building each chart of one
+# selection; the dashboard draws them through chart_cache, speculation.py
+# precomputes the neighbouring selections with them and bench.py times them.
+#
+#   builders = interactive_charts.chart_builders('Shootings', (2019, 2024), ['Ohio', 'Texas'])
+#   chart = builders['county_heatmap']('Ohio')
+
+region_state_palettes = {
+    'Midwest': ['#1f77b4', '#aec7e8', '#17becf', '#9edae5'],
+    'Southeast': ['#ff7f0e', '#ffbb78', '#ff9896', '#ff7c7c'],
+    'Northeast': ['#2ca02c', '#98df8a', '#b5cf6b', '#cedb9c'],
+    'Southwest': ['#d62728', '#ff9896', '#e377c2', '#f7b6d2'],
+    'West': ['#9467bd', '#c5b0d5', '#8c564b', '#c49c94']
+}
+
+region_colors = {
+    'Midwest': '#1f77b4',
+    'Southeast': '#ff7f0e',
+    'Northeast': '#2ca02c',
+    'Southwest': '#d62728',
+    'West': '#9467bd'
+}
+
+region_palette = alt.Scale(domain=list(region_colors.keys()), range=list(region_colors.values()))
+region_palette_schema = {
+    'Midwest': alt.Scale(scheme='blues'),
+    'Southeast': alt.Scale(scheme='oranges'),
+    'Northeast': alt.Scale(scheme='greens'),
+    'Southwest': alt.Scale(scheme='reds'),
+    'West': alt.Scale(scheme='purples')
+}
+
+state_colors = {
+    'Alabama': '#ff7f0e',
+    'Alaska': '#9b59b6',
+    'Arizona': '#e74c3c',
+    'Arkansas': '#ff5722',
+    'California': '#8e44ad',
+    'Colorado': '#9c27b0',
+    'Connecticut': '#388e3c',
+    'District of Columbia': '#ff8c00',
+    'Delaware': '#66bb6a',
+    'Florida': '#ff7043',
+    'Georgia': '#f4511e',
+    'Hawaii': '#7e57c2',
+    'Idaho': '#6a4f98',
+    'Illinois': '#3498db',
+    'Indiana': '#1e88e5',
+    'Iowa': '#1976d2',
+    'Kansas': '#1565c0',
+    'Kentucky': '#f4511e',
+    'Louisiana': '#ff7043',
+    'Maine': '#388e3c',
+    'Maryland': '#ff9800',
+    'Massachusetts': '#43a047',
+    'Michigan': '#2980b9',
+    'Minnesota': '#1e88e5',
+    'Mississippi': '#ff7043',
+    'Missouri': '#3498db',
+    'Montana': '#8e44ad',
+    'Nebraska': '#1976d2',
+    'Nevada': '#9b59b6',
+    'New Hampshire': '#43a047',
+    'New Jersey': '#66bb6a',
+    'New Mexico': '#c0392b',
+    'New York': '#2e7d32',
+    'North Carolina': '#ff7043',
+    'North Dakota': '#3498db',
+    'Ohio': '#1e88e5',
+    'Oklahoma': '#c0392b',
+    'Oregon': '#7e57c2',
+    'Pennsylvania': '#43a047',
+    'Rhode Island': '#66bb6a',
+    'South Carolina': '#ff7043',
+    'South Dakota': '#1565c0',
+    'Tennessee': '#ff5722',
+    'Texas': '#c0392b',
+    'Utah': '#7e57c2',
+    'Vermont': '#43a047',
+    'Virginia': '#f4511e',
+    'Washington': '#8e44ad',
+    'West Virginia': '#ff7043',
+    'Wisconsin': '#3498db',
+    'Wyoming': '#7e57c2'
+}
+
+# Line charts keep at most one point per pixel of width for each series
+# (see timeseries.py); a few decades of years stay well under that
+LINE_WIDTH = 500
+
+
+def chart_builders(selected_metric, year_range, chart_states):
+    """Chart name -> function building its Altair chart for one selection.
+
+    The charts of the current selection are built from it, and so are those
+    of the selections speculation.py precomputes in the background.
+    """
+    first_year, last_year = year_range
+    colors = {state: state_colors[state] for state in chart_states if state in state_colors}
+    state_palette = alt.Scale(domain=list(colors.keys()), range=list(colors.values()))
+
+    # Every frame comes from the query layer (see query_service.py),
+    # in-process or from the query service
+    def region_year_data():
+        return query_service.query('region_year', metric=selected_metric, first_year=first_year, last_year=last_year)
+
+    def region_line():
+        grouped_data_region = timeseries.downsample(region_year_data(), 'Year', selected_metric, LINE_WIDTH, by='Region')
+        return alt.Chart(grouped_data_region).mark_line(point=True).encode(
+            x='Year:O',
+            y=f'{selected_metric}:Q',
+            color=alt.Color('Region:N', scale=region_palette, legend=None),
+            tooltip=['Year', 'Region', f'{selected_metric}']
+        ).properties(
+            title=f"Total {selected_metric} by Region Over Time",
+            width=LINE_WIDTH,
+            height=400
+        )
+
+    def region_slope():
+        grouped_data_region = region_year_data()
+        slope_data_region = grouped_data_region[grouped_data_region['Year'].isin([first_year, last_year])].reset_index(drop=True)
+        slope_data_region['Year'] = slope_data_region['Year'].astype(str)
+        return alt.Chart(slope_data_region).mark_line(point=True).encode(
+            x='Year:O',
+            y=f'{selected_metric} per Million:Q',
+            color=alt.Color('Region:N', scale=region_palette, legend=None),
+            tooltip=['Year', 'Region', f'{selected_metric} per Million']
+        ).properties(
+            title=f"Regional {selected_metric} per Million",
+            width=500,
+            height=400
+        )
+
+    def global_choropleth():
+        grouped_data_state = query_service.query('state_map', metric=selected_metric, first_year=first_year, last_year=last_year)
+        return geo.choropleth(
+            'states', grouped_data_state, 'FIPS_State', ['State', 'Region', selected_metric]
+        ).mark_geoshape(
+            stroke='white',
+            strokeWidth=0.5
+        ).encode(
+            color=alt.Color(
+                'Region:N',
+                scale=region_palette,
+                legend=alt.Legend(title="Region")
+            ),
+            fillOpacity=alt.FillOpacity(
+                f'{selected_metric}:Q',
+                scale=alt.Scale(range=[0.3, 1])
+            ),
+            tooltip=[
+                alt.Tooltip('State:N'),
+                alt.Tooltip('Region:N'),
+                alt.Tooltip(f'{selected_metric}:Q', title=selected_metric)
+            ]
+        ).project(
+            type='albersUsa'
+        ).properties(
+            title=f"{selected_metric} by State and Region",
+            width=800,
+            height=500
+        )
+
+    def state_year_data():
+        return query_service.query('state_year', metric=selected_metric, first_year=first_year, last_year=last_year, states=chart_states)
+
+    def state_line():
+        grouped_data_state_year = timeseries.downsample(state_year_data(), 'Year', selected_metric, LINE_WIDTH, by='State')
+        return alt.Chart(grouped_data_state_year).mark_line(point=True).encode(
+            x='Year:O',
+            y=f'{selected_metric}:Q',
+            color=alt.Color('State:N', scale=state_palette, legend=None),
+            tooltip=['Year', 'State', f'{selected_metric}']
+        ).properties(
+            title=f"{selected_metric} Trend for Selected States",
+            width=LINE_WIDTH,
+            height=400
+        )
+
+    def state_slope():
+        grouped_data_state_year = state_year_data()
+        slope_data_state = grouped_data_state_year[grouped_data_state_year['Year'].isin([first_year, last_year])].copy()
+        slope_data_state['Year'] = slope_data_state['Year'].astype(str)
+
+        return alt.Chart(slope_data_state).mark_line(point=True).encode(
+            x='Year:O',
+            y=f'{selected_metric} per Million:Q',
+            color=alt.Color('State:N', scale=state_palette, legend=alt.Legend(title="States")),
+            tooltip=['Year', 'State', f'{selected_metric} per Million']
+        ).properties(
+            title=f"State-Level {selected_metric} per Million Trends",
+            width=500,
+            height=400
+        )
+
+    def county_choropleth():
+        grouped_data_county = query_service.query('county_map', metric=selected_metric, first_year=first_year, last_year=last_year, states=chart_states)
+
+        counties = geo.choropleth(
+            'counties', grouped_data_county, 'FIPS', ['County2', 'State', selected_metric, 'Region']
+        ).mark_geoshape().encode(
+            color=alt.Color(
+                'State:N',
+                scale=state_palette,
+                legend=alt.Legend(title="State")
+            ),
+            fillOpacity=alt.FillOpacity(
+                f'{selected_metric}:Q',
+                scale=alt.Scale(range=[0.3, 1])
+            ),
+            tooltip=['State:N', 'County2:N', f'{selected_metric}:Q'] 
+        )
+
+        return (counties).project(
+            type='albersUsa'
+        ).properties(
+            title=f"County-Level {selected_metric} in Selected State(s)",
+            width=800,
+            height=500
+        )
+
+    def state_regions():
+        return query_service.query('states').set_index('State')['Region'].to_dict()
+
+    # The County x Year grids of all selected states come from one pass over
+    # the cube, made when the first missing heatmap spec is built
+    @functools.cache
+    def county_year_frames():
+        grid = query_service.query('county_year', metric=selected_metric, first_year=first_year, last_year=last_year, states=chart_states)
+        parts = dict(tuple(grid.groupby('State', sort=False)))
+        return {
+            state: parts.get(state, grid.iloc[:0]).drop(columns='State').reset_index(drop=True)
+            for state in chart_states
+        }
+
+    def county_heatmap(state):
+        region = state_regions()[state]
+        complete_county_data = county_year_frames()[state]
+
+        return alt.Chart(complete_county_data).mark_rect().encode(
+            x=alt.X('Year:O', title="Year"),
+            y=alt.Y('County:N', title="County"),
+            color=alt.Color(
+                f'{selected_metric}:Q',
+                scale=region_palette_schema[region],
+                legend=alt.Legend(title=selected_metric)
+            ),
+        tooltip=['Year', 'County', f'{selected_metric}']
+        ).properties(
+            title=f"{state} County-Level Heatmap of {selected_metric}",
+            width=700,
+            height=400
+        )
+
+    return {
+        'region_line': region_line,
+        'region_slope': region_slope,
+        'global_choropleth': global_choropleth,
+        'state_line': state_line,
+        'state_slope': state_slope,
+        'county_choropleth': county_choropleth,
+        'county_heatmap': county_heatmap
+    }
@@ -0,0 +1,87 @@
+import inspect
+
+import data_loader
+
+# Lazy dependency graph of derived frames and charts for a dashboard script.
+# Every node is a function whose parameter names are the nodes it needs, so a
+# view only computes what its charts actually use. Frame nodes are memoized
+# process-wide in data_loader's cache under the graph's dataset signature, so
+# a node computed by one session is reused by every other session until the
+# data changes; chart nodes are recomputed on demand only, since their
+# finished specs are cached by chart_cache.
+#
+#   graph = lazy.Graph('overview', signature)
+#
+#   @graph.node
+#   def state(state_by_file, population):
+#       return pd.merge(state_by_file['MS'], population, on='State', how='left')
+#
+#   graph.input('bucket', selected_bucket)   # per-rerun selections
+#   graph['state']                           # computes state and what it needs
+#
+# Node values are shared between sessions: treat them as read-only and copy
+# before adding columns.
+
+
+class Graph:
+    def __init__(self, name, signature):
+        self.name = name
+        self.signature = signature
+        self._nodes = {}    # name -> (function, dependencies, memoize)
+        self._inputs = {}
+        self._values = {}   # values computed during this run
+
+    def node(self, function=None, memoize=True):
+        """Register `function` as a node named after it; usable as a decorator."""
+        def register(function):
+            dependencies = list(inspect.signature(function).parameters)
+            self._nodes[function.__name__] = (function, dependencies, memoize)
+            return function
+        return register(function) if function is not None else register
+
+    def chart(self, function):
+        """Register a chart node: computed on demand, never memoized here."""
+        return self.node(function, memoize=False)
+
+    def input(self, name, value):
+        """Set a per-rerun value, such as a widget selection, that nodes can depend on."""
+        self._inputs[name] = value
+        self._values.clear()
+
+    def requires(self, name):
+        """Names of every node and input `name` depends on, directly or not."""
+        if name in self._inputs:
+            return set()
+        if name not in self._nodes:
+            raise KeyError(f"{self.name} has no node or input named {name!r}")
+        required = set()
+        for dependency in self._nodes[name][1]:
+            required.add(dependency)
+            required |= self.requires(dependency)
+        return required
+
+    def inputs(self, name):
+        """Inputs `name` depends on, with their current values."""
+        required = self.requires(name) | {name}
+        return {input_name: value for input_name, value in self._inputs.items() if input_name in required}
+
+    def __getitem__(self, name):
+        if name in self._inputs:
+            return self._inputs[name]
+        if name in self._values:
+            return self._values[name]
+        if name not in self._nodes:
+            raise KeyError(f"{self.name} has no node or input named {name!r}")
+        function, dependencies, memoize = self._nodes[name]
+
+        def compute():
+            return function(*(self[dependency] for dependency in dependencies))
+
+        if memoize:
+            # Inputs the node depends on are part of its key
+            key = (self.name, name) + tuple(sorted(self.inputs(name).items()))
+            value = data_loader.cached(key, self.signature, compute, f'{self.name}: {name}')
+        else:
+            value = compute()
+        self._values[name] = value
+        return value
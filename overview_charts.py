@@ -0,0 +1,333 @@
+import altair as alt
+
+import geo
+import lazy
+import query_service
+import timeseries
+
+# Frames and charts of the overview dashboard (shootings_dashboard.py).
+# They are plain functions whose parameter names are the frames they need;
+# graph() wires them into a lazy.Graph for one dataset version, so the
+# dashboard computes only what the charts of its view use, and bench.py
+# times the same builders the dashboard draws.
+#
+#   graph = overview_charts.graph(signature)
+#   graph.input('bucket', 'Month')
+#   chart = graph['chart3']
+
+# Views that draw the temporal charts, and so offer a choice of time bucket
+BUCKET_VIEWS = ("Overview Dashboard", "Temporal Analysis")
+
+# Set consistent color scheme
+MAIN_COLOR = "#1f77b4"  # Primary blue
+COLOR_SCHEME = "blues"   # Consistent color scheme for maps
+BACKGROUND_COLOR = "#ffffff"
+ACCENT_COLOR = "#9eb8da"  # For secondary lines/elements
+MAP_ZERO_COLOR = '#eef1f7'  # For counties with index zero
+
+
+# Frames behind the charts come from the query layer (see queries.py and
+# query_service.py), in-process or from the query service, so with
+# SHOOTINGS_QUERY_URL set the groupbys run there and not in this process.
+# The File column tells the incident families apart: MS mass shootings, SS
+# school shootings. Columns are already typed (see
+# data_loader.INCIDENT_SCHEMA) and 'Shootings' counts incidents.
+
+# Per-state totals behind the top-states, map and income charts
+def state():
+    return query_service.query('state_totals')
+
+
+def state_year():
+    return query_service.query('state_year_totals', file='MS')
+
+
+def year():
+    return query_service.query('year_totals', file='MS')
+
+
+# Preprocessing for Mass Shootings (COUNTY)
+def county():
+    return query_service.query('county_totals', file='MS')
+
+
+# Preprocessing for School Incidents (STATE)
+def school_state():
+    return query_service.query('state_totals', file='SS')
+
+
+def school_state_year():
+    return query_service.query('state_year_totals', file='SS')
+
+
+def school_year():
+    return query_service.query('year_totals', file='SS')
+
+
+# Preprocessing for School Incidents (COUNTY)
+def school_county():
+    return query_service.query('county_totals', file='SS')
+
+
+# Preprocessing for income (STATES)
+def income_state():
+    return query_service.query('income_state')
+
+
+# Trend series on a datetime axis per bucket; each line keeps at most one
+# point per pixel of its chart (see timeseries.py)
+TREND_WIDTH = 500
+
+
+def buckets():
+    """Time buckets the trend charts can be drawn in."""
+    return query_service.query('buckets')['Bucket'].tolist()
+
+
+def trend(file, y, bucket):
+    series = query_service.query('trend_series', file=file, bucket=bucket)
+    return timeseries.downsample(series, 'Date', y, TREND_WIDTH)
+
+# Enhanced visualizations with consistent styling
+# Each chart is a graph node that only runs when its spec is not cached yet
+# (see chart_cache.py)
+
+# Chart 1: Top 5 States by Shootings
+def chart1():
+    top_5_states = query_service.query('top_states', by='Shootings per Citizen', count=5)
+    return alt.Chart(top_5_states).mark_bar(color=MAIN_COLOR).encode(
+        alt.Y('State:N', sort='-x'),
+        alt.X('Shootings per Million:Q', title='Shootings per Million Citizen'),
+        tooltip=['State:N', 'Shootings per Citizen:Q', 'Shootings per Million:Q']
+    ).properties(
+        title=alt.TitleParams(
+            text='Top 5 States by Shootings per Citizen',
+            fontSize=16
+        ),
+        width=500,
+        height=300
+    )
+
+
+# Chart 2: Top 5 States by Victims
+def chart2():
+    top_5_states = query_service.query('top_states', by='Victims per Million', count=5)
+
+    top_5_states_victims = top_5_states.melt(
+        id_vars='State', 
+        value_vars=['Victims Injured', 'Victims Killed'],
+        var_name='Category', 
+        value_name='Count'
+    )
+    return alt.Chart(top_5_states_victims).mark_bar().encode(
+        alt.X('Count:Q', title='Number of Victims'),
+        alt.Y('State:N', title='State', sort='-x'),
+        alt.Color('Category:N', title='Category', scale=alt.Scale(scheme='blues')), 
+        alt.Order('Category:N', sort='descending'),
+        tooltip=[
+            alt.Tooltip('State:N', title='State'),
+            alt.Tooltip('Category:N', title='Category'),
+            alt.Tooltip('Count:Q', title='Count')
+        ]
+    ).properties(
+        title='Top 5 States with the Most Mass Shooting Victims',
+        width=500,
+        height=300
+    )
+
+
+# Chart 3: State Map
+def chart3(state):
+    # Maps draw local, simplified geometry with their metrics looked up by FIPS (see geo.py)
+    return geo.choropleth(
+        'states', state, 'id', ['State', 'Shootings per Million', 'Shootings', 'Population']
+    ).mark_geoshape().encode(
+        alt.Color('Shootings per Million:Q', 
+                  scale=alt.Scale(scheme=COLOR_SCHEME),
+                  legend=alt.Legend(title="Shootings per Million")),
+        tooltip=['State:N', 'Shootings per Million:Q', 'Shootings:Q', 'Population:Q']
+    ).project(
+        type='albersUsa'
+    ).properties(
+        title=alt.TitleParams(text="Shootings per Million Citizen by State", fontSize=16),
+        width=500,
+        height=300
+    )
+
+
+# Chart 4: County Map
+def chart4(county):
+    # Both layers share one geometry payload
+    county_base = geo.choropleth(
+        'counties', county, 'FIPS', ['Shootings per Million', 'County', 'State', 'Shootings', 'Population']
+    )
+    map_layer = county_base.mark_geoshape().encode(
+        color=alt.value(MAP_ZERO_COLOR)  # Light blue for base map (as a zero)
+    ).project(
+        type='albersUsa'
+    )
+
+    shootings_layer = county_base.mark_geoshape().encode(
+        color=alt.Color('Shootings per Million:Q',
+                       scale=alt.Scale(scheme=COLOR_SCHEME),
+                       legend=alt.Legend(title="Shootings per Million")),
+        tooltip=['County:N', 'State:N', 'Shootings per Million:Q', 'Shootings:Q', 'Population:Q']
+    )
+
+    return (map_layer + shootings_layer).properties(
+        title=alt.TitleParams(
+            text="Mass Shootings per Million Citizen by County",
+            fontSize=16
+        ),
+        width=500,
+        height=300
+    )
+
+
+# Chart 5: School Shootings State Map
+def chart5(school_state):
+    return geo.choropleth(
+        'states', school_state, 'id', ['State', 'Shootings per Million', 'Shootings', 'Population']
+    ).mark_geoshape().encode(
+        alt.Color('Shootings per Million:Q',
+                  scale=alt.Scale(scheme=COLOR_SCHEME),
+                  legend=alt.Legend(title="Shootings per Million")),
+        tooltip=['State:N', 'Shootings per Million:Q', 'Shootings:Q', 'Population:Q']
+    ).project(
+        type='albersUsa'
+    ).properties(
+        title=alt.TitleParams(
+            text="School Shootings per Million Citizen by State",
+            fontSize=16
+        ),
+        width=500,
+        height=300
+    )
+
+
+# Chart 6: School Shootings County Map
+def chart6(school_county):
+    school_county_base = geo.choropleth(
+        'counties', school_county, 'FIPS', ['Shootings per Million', 'County', 'State', 'Shootings', 'Population']
+    )
+    map_layer2 = school_county_base.mark_geoshape().encode(
+        color=alt.value(MAP_ZERO_COLOR)
+    ).project(
+        type='albersUsa'
+    )
+
+    shootings_layer2 = school_county_base.mark_geoshape().encode(
+        color=alt.Color('Shootings per Million:Q',
+                       scale=alt.Scale(scheme=COLOR_SCHEME),
+                       legend=alt.Legend(title="Shootings per Million")),
+        tooltip=['County:N', 'State:N', 'Shootings per Million:Q', 'Shootings:Q', 'Population:Q']
+    )
+
+    return (map_layer2 + shootings_layer2).properties(
+        title=alt.TitleParams(
+            text="School Shootings per Million Citizen by County",
+            fontSize=16
+        ),
+        width=500,
+        height=300
+    )
+
+
+# Chart 7: Time Evolution Line Chart
+def chart7(bucket):
+    month = trend('MS', 'Total Victims', bucket)
+    return alt.Chart(month).mark_line(
+        color=MAIN_COLOR
+    ).encode(
+        x=alt.X('Date:T', title=f'{bucket}'),
+        y=alt.Y('Total Victims:Q', title='Number of Shootings'),
+        tooltip=['Shootings']
+    ).properties(
+        title=alt.TitleParams(
+            text="Time Evolution of Mass Shootings",
+            fontSize=16
+        ),
+        width=TREND_WIDTH,
+        height=300
+    )
+
+
+# Chart 8: Mass Shootings vs School Shootings Time Evolution
+def chart8(bucket):
+    # Each line is downsampled on its own, so the layers carry their own data
+    month = trend('MS', 'Shootings', bucket)
+    school_month = trend('SS', 'Shootings', bucket).rename(columns={'Shootings': 'School_Shootings'})
+
+    line1 = alt.Chart(month).mark_line(color=MAIN_COLOR).encode(
+        x=alt.X('Date:T', title=f'{bucket}'),
+        y=alt.Y('Shootings:Q', title='Number of Shootings'),
+        tooltip=['Shootings']
+    )
+
+    line2 = alt.Chart(school_month).mark_line(color=ACCENT_COLOR).encode(
+        x=alt.X('Date:T', title=f'{bucket}'),
+        y=alt.Y('School_Shootings:Q'),
+        tooltip=['School_Shootings']
+    )
+
+    legend = alt.Chart({
+        'values': [
+            {'category': 'Mass Shootings', 'color': MAIN_COLOR},
+            {'category': 'School Shootings', 'color': ACCENT_COLOR}
+        ]
+    }).mark_point().encode(
+        y=alt.Y('category:N', title=None),
+        color=alt.Color('color:N', title=None)
+    )
+
+    return (line1 + line2 ).properties(
+        title=alt.TitleParams(
+            text="Time Evolution of Mass Shootings and School Shootings",
+            fontSize=16
+        ),
+        width=TREND_WIDTH,
+        height=300
+    )
+
+
+# Chart 9: Income Graph
+def chart9(income_state):
+    base_map = geo.choropleth(
+        'states', income_state, 'id', ['State', 'Shootings per Million', 'Population', 'Income']
+    ).mark_geoshape(tooltip=True).encode(
+        color=alt.Color('Income:Q',
+                       scale=alt.Scale(scheme=COLOR_SCHEME),
+                       legend=alt.Legend(title="County's income")),
+        tooltip =['State:N', 'Income:Q', 'Shootings per Million:Q', 'Population:Q'] 
+    ).project(
+        type ='albersUsa' 
+    )
+
+    shootings_circles = alt.Chart(income_state).mark_circle(color='red').encode(
+        longitude='long:Q',  
+        latitude='lat:Q',   
+        size='Shootings:Q', 
+        tooltip=['State:N', 'Shootings:Q']  
+    ).properties(
+        width=500,   
+        height=300   
+    )
+
+    return base_map + shootings_circles
+
+
+
+
+# Frames of the query layer, which caches them per dataset version itself
+FRAMES = [state, state_year, year, county, school_state, school_state_year, school_year, school_county, income_state]
+CHARTS = [chart1, chart2, chart3, chart4, chart5, chart6, chart7, chart8, chart9]
+
+
+def graph(signature):
+    """lazy.Graph of the overview's frames and charts under `signature`."""
+    graph = lazy.Graph('overview', signature)
+    for node in FRAMES:
+        graph.node(node, memoize=False)
+    for chart in CHARTS:
+        graph.chart(chart)
+    return graph
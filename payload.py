@@ -0,0 +1,135 @@
+import hashlib
+import math
+
+import pyarrow as pa
+import pyarrow.ipc
+from streamlit import dataframe_util
+
+# Payload guard for what the dashboards send to the browser.
+# Charts are built from frames that often carry more than they draw: lookup
+# tables with every column of the state or county frame, index columns,
+# repeated rows. optimize() rewrites a finished Vega-Lite spec (the dict
+# chart_cache caches, with Arrow-serialized datasets) so that each dataset
+# keeps only the fields the spec references, drops its index and, when it is
+# only a lookup table, its repeated rows. The rendered chart is unchanged.
+# chart_cache reports the bytes saved per chart.
+#
+#   spec, saved = payload.optimize(spec)
+#   payload.paginate(frame, 'state_rows')    # large tables, one page at a time
+#   payload.paginate_rows(rows, fetch, 'state_rows')   # pages fetched on demand
+#
+# A spec whose marks show every field of a datum (tooltip: true) or that
+# looks up every field of a dataset is left as it is.
+
+# Rows per page of paginate()
+PAGE_SIZE = 100
+
+
+class _References:
+    """Field names, expressions and datasets a spec refers to."""
+
+    def __init__(self, spec):
+        self.strings = set()
+        self.expressions = []
+        self.data = set()           # datasets drawn or transformed
+        self.lookups = set()        # datasets used as lookup tables
+        self.keep_all = set()       # datasets whose every field is used
+        self.all_fields = False     # some mark shows every field
+        self._visit(spec)
+
+    def _visit(self, node):
+        if isinstance(node, dict):
+            tooltip = node.get('tooltip')
+            if tooltip is True or (isinstance(tooltip, dict) and tooltip.get('content') == 'data'):
+                self.all_fields = True
+            source = node.get('from')
+            if 'lookup' in node and isinstance(source, dict):
+                name = (source.get('data') or {}).get('name')
+                self.lookups.add(name)
+                if 'fields' not in source:
+                    self.keep_all.add(name)
+                node = {**node, 'from': {key: value for key, value in source.items() if key != 'data'}}
+            elif isinstance(node.get('data'), dict) and 'name' in node['data']:
+                self.data.add(node['data']['name'])
+            for key, value in node.items():
+                if key != 'datasets':
+                    self._visit(value)
+        elif isinstance(node, list):
+            for value in node:
+                self._visit(value)
+        elif isinstance(node, str):
+            if 'datum' in node:
+                self.expressions.append(node)
+            self.strings.add(node.replace('\\', ''))
+
+    def uses(self, field):
+        return field in self.strings or any(field in expression for expression in self.expressions)
+
+
+def _rename(node, names):
+    if isinstance(node, dict):
+        return {
+            key: names.get(value, value) if key == 'name' and isinstance(value, str) else _rename(value, names)
+            for key, value in node.items()
+        }
+    if isinstance(node, list):
+        return [_rename(value, names) for value in node]
+    return node
+
+
+def optimize(spec):
+    """(spec, bytes saved): `spec` with each Arrow dataset cut down to what the spec uses."""
+    datasets = spec.get('datasets')
+    if not datasets:
+        return spec, 0
+    references = _References(spec)
+    if references.all_fields:
+        return spec, 0
+
+    names, kept, saved = {}, {}, 0
+    for name, data in datasets.items():
+        if not isinstance(data, bytes) or name in references.keep_all:
+            kept[name] = data
+            continue
+        frame = pa.ipc.open_stream(data).read_pandas()
+        frame = frame[[column for column in frame.columns if references.uses(str(column))]].reset_index(drop=True)
+        if name in references.lookups and name not in references.data:
+            # A lookup matches one row per key; repeated rows add nothing
+            frame = frame.drop_duplicates(ignore_index=True)
+        smaller = dataframe_util.convert_anything_to_arrow_bytes(frame)
+        if len(smaller) >= len(data):
+            kept[name] = data
+            continue
+        # Datasets are named after their content, like Streamlit names them
+        new_name = hashlib.md5(smaller).hexdigest()
+        names[name] = new_name
+        kept[new_name] = smaller
+        saved += len(data) - len(smaller)
+
+    if not names:
+        return spec, 0
+    optimized = _rename({key: value for key, value in spec.items() if key != 'datasets'}, names)
+    optimized['datasets'] = kept
+    return optimized, saved
+
+
+def paginate(frame, key, page_size=PAGE_SIZE):
+    """st.dataframe of one page of `frame`, with a page selector when it spans several."""
+    return paginate_rows(len(frame), lambda start, stop: frame.iloc[start:stop], key, page_size)
+
+
+def paginate_rows(rows, fetch, key, page_size=PAGE_SIZE):
+    """paginate() of a table of `rows` rows held elsewhere; fetch(start, stop)
+    returns the rows of the page shown, so only that page is ever read."""
+    import streamlit as st
+
+    pages = max(1, math.ceil(rows / page_size))
+    page = 1
+    if pages > 1:
+        # The page count is part of the key, so a shorter table starts on page 1
+        page = st.number_input(
+            f"Page (of {pages}, {rows} rows)", min_value=1, max_value=pages, value=1, step=1,
+            key=f'{key}-{pages}'
+        )
+    start = (page - 1) * page_size
+    return st.dataframe(fetch(start, start + page_size))
@@ -0,0 +1,329 @@
+import collections
+import html
+import json
+import os
+import sys
+import threading
+import time
+
+# Opt-in per-rerun profiling for both dashboards.
+# Enable it for every session with SHOOTINGS_PROFILE=1, or for one browser tab
+# by opening the dashboard with ?profile=1. Each rerun then records its named
+# phases: dataset loads and derived-frame builds (data_loader), graph nodes
+# (lazy.py), queries, dimension joins, filters, Altair chart builds, spec
+# serialization with payload bytes and drawing (chart_cache). The phases are
+# shown in a collapsible sidebar panel and appended as one JSON record per
+# rerun to profiles/reruns.jsonl.
+#
+# The panel also has a toggle that samples the next rerun's stacks every few
+# milliseconds and writes a flame graph of it (profiles/flame-*.svg, with the
+# folded stacks next to it for flamegraph.pl or speedscope).
+#
+#   profiling.start('interactive')
+#   try:
+#       with profiling.phase('filter', 'state rows'):
+#           ...
+#   finally:
+#       profiling.finish()
+#
+# finish() runs in a finally block so that reruns cut short by st.rerun(),
+# st.stop() or an exception still write their record and stop their sampler.
+#
+# When profiling is off, phase() returns a shared no-op context manager.
+
+PROFILE_DIR = os.environ.get(
+    'SHOOTINGS_PROFILE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'profiles')
+)
+SAMPLE_INTERVAL = 0.005     # seconds between stack samples
+
+_local = threading.local()
+
+
+def _enabled():
+    if os.environ.get('SHOOTINGS_PROFILE', '') not in ('', '0'):
+        return True
+    import streamlit as st
+    return st.query_params.get('profile', '') not in ('', '0')
+
+
+class Recorder:
+    """Phases timed during one rerun; shared with the threads it is bound to."""
+
+    def __init__(self, dashboard):
+        self.dashboard = dashboard
+        self.started = time.time()
+        self.origin = time.perf_counter()
+        self.phases = []
+        self.context = {}
+        self.threads = {threading.get_ident()}
+        self.sampler = None
+        self._lock = threading.Lock()
+
+    def add(self, category, name, start, end, **fields):
+        record = {
+            'category': category,
+            'name': name,
+            'start_ms': round((start - self.origin) * 1000, 3),
+            'ms': round((end - start) * 1000, 3),
+            'thread': threading.current_thread().name,
+            **fields
+        }
+        with self._lock:
+            self.phases.append(record)
+
+    def record(self):
+        """The JSON-serializable record of this rerun."""
+        with self._lock:
+            phases = sorted(self.phases, key=lambda phase: phase['start_ms'])
+        return {
+            'dashboard': self.dashboard,
+            'started': self.started,
+            'total_ms': round((time.perf_counter() - self.origin) * 1000, 3),
+            'context': self.context,
+            'phases': phases
+        }
+
+
+class _Phase:
+    __slots__ = ('recorder', 'category', 'name', 'fields', 'start')
+
+    def __init__(self, recorder, category, name, fields):
+        self.recorder = recorder
+        self.category = category
+        self.name = name
+        self.fields = fields
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.recorder.add(self.category, self.name, self.start, time.perf_counter(), **self.fields)
+        return False
+
+    def set(self, **fields):
+        """Attach values known only at the end of the phase, such as payload bytes."""
+        self.fields.update(fields)
+
+
+class _NoPhase:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def set(self, **fields):
+        pass
+
+
+_NO_PHASE = _NoPhase()
+
+
+def current():
+    """Recorder of the rerun running on this thread, or None."""
+    return getattr(_local, 'recorder', None)
+
+
+def phase(category, name, **fields):
+    """Context manager timing one named phase of the current rerun."""
+    recorder = current()
+    if recorder is None:
+        return _NO_PHASE
+    return _Phase(recorder, category, str(name), fields)
+
+
+def note(**context):
+    """Attach selections or other context to the current rerun's record."""
+    recorder = current()
+    if recorder is not None:
+        recorder.context.update(context)
+
+
+def bind(function):
+    """function, run with the current rerun's recorder on whichever thread calls it."""
+    recorder = current()
+    if recorder is None:
+        return function
+
+    def bound(*args, **kwargs):
+        previous = current()
+        _local.recorder = recorder
+        thread = threading.get_ident()
+        recorder.threads.add(thread)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            recorder.threads.discard(thread)
+            _local.recorder = previous
+
+    return bound
+
+
+# Sampling profiler
+
+class Sampler(threading.Thread):
+    """Samples the stacks of a recorder's threads until stopped."""
+
+    def __init__(self, recorder, interval=SAMPLE_INTERVAL):
+        super().__init__(name='profile-sampler', daemon=True)
+        self.recorder = recorder
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.wait(self.interval):
+            frames = sys._current_frames()
+            for thread in list(self.recorder.threads):
+                frame = frames.get(thread)
+                if frame is not None:
+                    self.stacks[_fold(frame)] += 1
+
+    def stop(self):
+        self._done.set()
+        self.join()
+        return self.stacks
+
+
+def _fold(frame):
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f'{code.co_name} ({os.path.basename(code.co_filename)})')
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+def flame_graph_svg(stacks, title, width=1200, row_height=16):
+    """Self-contained SVG flame graph of folded stacks {"a;b;c": samples}."""
+    root = {'children': {}, 'count': 0}
+    for stack, count in stacks.items():
+        node = root
+        node['count'] += count
+        for name in stack.split(';'):
+            node = node['children'].setdefault(name, {'children': {}, 'count': 0})
+            node['count'] += count
+
+    total = max(root['count'], 1)
+    rects = []
+    depth = 0
+
+    def draw(node, name, x, level):
+        nonlocal depth
+        depth = max(depth, level)
+        w = node['count'] / total * width
+        if w >= 0.5:
+            label = html.escape(name)
+            hue = 20 + sum(map(ord, name)) % 40
+            text = label if w > 7 * len(name) else (html.escape(name[:int(w / 7) - 2]) + '..' if w > 30 else '')
+            rects.append((level, x, w, label, node['count'], hue, text))
+        child_x = x
+        for child_name, child in sorted(node['children'].items()):
+            draw(child, child_name, child_x, level + 1)
+            child_x += child['count'] / total * width
+
+    x = 0.0
+    for name, child in sorted(root['children'].items()):
+        draw(child, name, x, 0)
+        x += child['count'] / total * width
+
+    height = (depth + 2) * row_height + 24
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" font-family="monospace" font-size="11">',
+        f'<text x="4" y="14">{html.escape(title)} ({total} samples)</text>'
+    ]
+    for level, x, w, label, count, hue, text in rects:
+        y = height - (level + 1) * row_height
+        parts.append(
+            f'<g><title>{label} ({count} samples, {count / total:.1%})</title>'
+            f'<rect x="{x:.1f}" y="{y}" width="{w:.1f}" height="{row_height - 1}" fill="hsl({hue},90%,60%)"/>'
+            f'<text x="{x + 3:.1f}" y="{y + row_height - 4}">{text}</text></g>'
+        )
+    parts.append('</svg>')
+    return '\n'.join(parts)
+
+
+# Rerun lifecycle
+
+def start(dashboard):
+    """Begin recording this rerun if profiling is enabled; returns the Recorder or None."""
+    # A rerun that never reached finish() leaves its sampler running
+    previous = current()
+    _local.recorder = None
+    if previous is not None and previous.sampler is not None:
+        previous.sampler.stop()
+        previous.sampler = None
+    if not _enabled():
+        return None
+    import streamlit as st
+    recorder = Recorder(dashboard)
+    _local.recorder = recorder
+    if st.session_state.get('profiling_sample'):
+        recorder.sampler = Sampler(recorder)
+        recorder.sampler.start()
+    return recorder
+
+
+def _write(record, stacks):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    with open(os.path.join(PROFILE_DIR, 'reruns.jsonl'), 'a') as sink:
+        sink.write(json.dumps(record, default=str) + '\n')
+    if stacks is None:
+        return None
+    stamp = time.strftime('%Y%m%d-%H%M%S', time.localtime(record['started']))
+    base = os.path.join(PROFILE_DIR, f"flame-{record['dashboard']}-{stamp}")
+    with open(base + '.folded', 'w') as sink:
+        sink.writelines(f'{stack} {count}\n' for stack, count in stacks.items())
+    with open(base + '.svg', 'w') as sink:
+        sink.write(flame_graph_svg(stacks, f"{record['dashboard']} rerun {stamp}"))
+    return base + '.svg'
+
+
+def summary(record):
+    """Phases of a record grouped by category and name, slowest first."""
+    groups = {}
+    for item in record['phases']:
+        group = groups.setdefault((item['category'], item['name']), {
+            'category': item['category'], 'phase': item['name'], 'calls': 0, 'ms': 0.0, 'bytes': 0, 'saved': 0
+        })
+        group['calls'] += 1
+        group['ms'] += item['ms']
+        group['bytes'] += item.get('bytes', 0)
+        group['saved'] += item.get('saved', 0)
+    return sorted(groups.values(), key=lambda group: group['ms'], reverse=True)
+
+
+def finish():
+    """Stop recording, write the rerun's record and show the sidebar panel.
+
+    Safe to call from a finally block: the record is written before the panel
+    is drawn, and calling it again after the first call does nothing.
+    """
+    recorder = current()
+    _local.recorder = None
+    if recorder is None:
+        return None
+    import pandas as pd
+    import streamlit as st
+
+    sampler, recorder.sampler = recorder.sampler, None
+    stacks = sampler.stop() if sampler is not None else None
+    record = recorder.record()
+    flame_graph = _write(record, stacks)
+
+    with st.sidebar.expander(f"Profiling: {record['total_ms']:.0f} ms", expanded=False):
+        rows = summary(record)
+        if rows:
+            table = pd.DataFrame(rows)
+            table['ms'] = table['ms'].round(1)
+            st.dataframe(table, hide_index=True, use_container_width=True)
+        st.caption(f"{len(record['phases'])} phases recorded to {os.path.join(PROFILE_DIR, 'reruns.jsonl')}")
+        if flame_graph is not None:
+            st.caption(f"Flame graph of this rerun: {flame_graph}")
+            with open(flame_graph, 'rb') as source:
+                st.download_button("Download flame graph", source.read(), os.path.basename(flame_graph), 'image/svg+xml')
+            # Sampling covers a single rerun
+            st.session_state['profiling_sample'] = False
+        st.checkbox("Sample the next rerun for a flame graph", key='profiling_sample')
+    return record
@@ -0,0 +1,298 @@
+import numpy as np
+import pandas as pd
+
+import aggregates
+import correlations
+import data_loader
+import timeseries
+
+# Chart-ready aggregations shared by both dashboards and query_service.py.
+# Each query returns a DataFrame and is cached process-wide per version of the
+# datasets, keyed on its parameters. The dashboards run them through
+# query_service.query(), which calls them here or, when SHOOTINGS_QUERY_URL is
+# set, asks the query service for them, so the pandas work can run in a
+# separate process. Results are shared: treat them as read-only.
+#
+#   queries.region_year('Shootings', 2014, 2024)
+#   queries.top_states('Shootings per Citizen', 5)
+#   queries.incident_page('Ohio', 2019, 2024, offset=0, limit=1000)
+#
+# With SHOOTINGS_QUERY_URL set the dashboards read everything through these
+# queries and never load the incident store or the cube themselves.
+
+# Metrics summed per state for the overview ('Shootings' counts incidents)
+METRIC_COLUMNS = ['Shootings'] + data_loader.METRIC_COLUMNS
+
+# FIPS codes of the states, as the ids of the state map geometry
+STATE_FIPS = {
+    'Alabama': '1', 'Alaska': '2', 'Arizona': '4', 'Arkansas': '5', 'California': '6', 'Colorado': '8', 'Connecticut': '9',
+    'Delaware': '10', 'Florida': '12', 'Georgia': '13', 'Hawaii': '15', 'Idaho': '16', 'Illinois': '17', 'Indiana': '18',
+    'Iowa': '19', 'Kansas': '20', 'Kentucky': '21', 'Louisiana': '22', 'Maine': '23', 'Maryland': '24', 'Massachusetts': '25',
+    'Michigan': '26', 'Minnesota': '27', 'Mississippi': '28', 'Missouri': '29', 'Montana': '30', 'Nebraska': '31', 'Nevada': '32',
+    'New Hampshire': '33', 'New Jersey': '34', 'New Mexico': '35', 'New York': '36', 'North Carolina': '37', 'North Dakota': '38',
+    'Ohio': '39', 'Oklahoma': '40', 'Oregon': '41', 'Pennsylvania': '42', 'Rhode Island': '44', 'South Carolina': '45',
+    'South Dakota': '46', 'Tennessee': '47', 'Texas': '48', 'Utah': '49', 'Vermont': '50', 'Virginia': '51', 'Washington': '53',
+    'West Virginia': '54', 'Wisconsin': '55', 'Wyoming': '56'
+}
+
+
+def signature():
+    """Version of every dataset the queries read."""
+    return tuple(data_loader.dataset_signature(name) for name in data_loader.SERVED_DATASETS)
+
+
+def _cached(name, params, build):
+    key = ('query', name) + tuple(sorted(params.items()))
+    return data_loader.cached(key, signature(), build, f'query {name}')
+
+
+def _per_million(frame, metric):
+    frame[f'{metric} per Million'] = round(frame[metric] / frame['Population'] * 1_000_000, 2)
+    return frame
+
+
+# Interactive dashboard
+
+def years():
+    """Incidents and the US total of every metric per year, for the year slider
+    and the sidebar totals."""
+    def build():
+        cube = aggregates.load_cube()
+        frame = pd.DataFrame({'Year': cube.years, 'Incidents': cube.incidents_per_year})
+        totals = cube.state_values.sum(axis=2)
+        for i, metric in enumerate(cube.metrics):
+            frame[metric] = totals[i]
+        return frame
+
+    return _cached('years', {}, build)
+
+
+def states():
+    """State, FIPS_State and Region of every state with incidents."""
+    return _cached('states', {}, lambda: aggregates.load_cube().states.copy())
+
+
+def states_with_incidents(first_year, last_year):
+    """States with incidents in the range, in order of first appearance."""
+    return _cached('states_with_incidents', dict(first_year=first_year, last_year=last_year),
+                   lambda: pd.DataFrame({'State': aggregates.load_cube().states_with_incidents(first_year, last_year)}))
+
+
+def region_year(metric, first_year, last_year):
+    """Region x Year totals of `metric` with population and per-million rates."""
+    def build():
+        frame = aggregates.load_cube().region_year_frame(metric, first_year, last_year)
+        frame = data_loader.load_dimensions().join(frame, data_loader.load_dataset('populations'), on='Region', columns=['Population'])
+        return _per_million(frame, metric)
+
+    return _cached('region_year', dict(metric=metric, first_year=first_year, last_year=last_year), build)
+
+
+def state_year(metric, first_year, last_year, states):
+    """State x Year totals of `metric` for `states` with population and per-million rates."""
+    states = tuple(states)
+
+    def build():
+        frame = aggregates.load_cube().state_year_frame(metric, first_year, last_year, states)
+        frame = data_loader.load_dimensions().join(frame, data_loader.load_dataset('populations'), on='State', columns=['Population'])
+        return _per_million(frame, metric)
+
+    return _cached('state_year', dict(metric=metric, first_year=first_year, last_year=last_year, states=states), build)
+
+
+def county_year(metric, first_year, last_year, states):
+    """County x Year grid of `metric` for each of `states`, stacked with a State column.
+
+    Only counties with incidents in the range are included.
+    """
+    states = tuple(states)
+
+    def build():
+        frames = aggregates.load_cube().county_year_frames(metric, first_year, last_year, states)
+        return pd.concat([frame.assign(State=state) for state, frame in frames.items()], ignore_index=True)
+
+    return _cached('county_year', dict(metric=metric, first_year=first_year, last_year=last_year, states=states), build)
+
+
+def state_map(metric, first_year, last_year):
+    """Per-state totals of `metric` in the range with FIPS_State and Region, for the US map."""
+    return _cached('state_map', dict(metric=metric, first_year=first_year, last_year=last_year),
+                   lambda: aggregates.load_cube().state_frame(metric, first_year, last_year))
+
+
+def county_map(metric, first_year, last_year, states):
+    """Totals of `metric` in the range for every county of `states` in FIPS.csv,
+    0 where it had no incidents, for the county map."""
+    states = tuple(states)
+
+    def build():
+        counties_fips = data_loader.load_dataset('fips')
+        dimensions = data_loader.load_dimensions()
+        selected_counties = counties_fips[dimensions.isin('State', counties_fips['State'], states)]
+        frame = aggregates.load_cube().county_frame(metric, first_year, last_year, states)
+        frame = dimensions.merge(selected_counties, frame, on=['State', 'FIPS'])
+        return frame.fillna({metric: 0})
+
+    return _cached('county_map', dict(metric=metric, first_year=first_year, last_year=last_year, states=states), build)
+
+
+def _state_rows(state, first_year, last_year):
+    """Positions in the incident store of the incidents of `state` in the range."""
+    def build():
+        incidents = data_loader.load_dataset(data_loader.INCIDENTS)
+        dimensions = data_loader.load_dimensions()
+        return np.flatnonzero(
+            (dimensions.codes('State', incidents['State']) == dimensions.codes('State', [state])[0]) &
+            (incidents['Year'] >= first_year) &
+            (incidents['Year'] <= last_year)
+        )
+
+    return _cached('state_rows', dict(state=state, first_year=first_year, last_year=last_year), build)
+
+
+def incident_count(state, first_year, last_year):
+    """Number of incidents of `state` in the range, as a one-row 'Rows' frame."""
+    return pd.DataFrame({'Rows': [len(_state_rows(state, first_year, last_year))]})
+
+
+def incident_page(state, first_year, last_year, offset, limit):
+    """Up to `limit` incidents of `state` in the range from the `offset`-th on,
+    so the table only ever moves one page of rows. Not cached: the query
+    service keeps recent responses."""
+    rows = _state_rows(state, first_year, last_year)[offset:offset + limit]
+    page = data_loader.load_dataset(data_loader.INCIDENTS).iloc[rows]
+    return page.assign(Shootings=1)
+
+
+def state_year_table():
+    """Year x State totals of every metric over all years, for the cross-filter view."""
+    return _cached('state_year_table', {}, lambda: aggregates.load_cube().state_year_table())
+
+
+# Overview dashboard
+# Incident families are told apart by File: MS mass shootings, SS school shootings
+
+def state_totals(file='MS'):
+    """Totals of one incident family per state with population, per-capita rates and map ids."""
+    def build():
+        by_state = aggregates.load_groups_by_file(data_loader.INCIDENTS, ['State'], METRIC_COLUMNS)[file]
+        dimensions = data_loader.load_dimensions()
+        state = dimensions.join(by_state, data_loader.load_dataset('population'), on='State')
+
+        state['Shootings per Citizen'] = (state['Shootings'] / state['Population'])
+        state['Shootings per Million'] = (state['Shootings'] / state['Population']) * 1_000_000
+        state['Victims per Citizen'] = (state['Total Victims'] / state['Population'])
+        state['Victims per Million'] = (state['Total Victims']/ state['Population']) * 1_000_000
+
+        state['id'] = dimensions['State'].map(state['State'], STATE_FIPS)
+        return state
+
+    return _cached('state_totals', dict(file=file), build)
+
+
+def state_year_totals(file):
+    """State x Year totals of one incident family with the state populations."""
+    def build():
+        by_state_year = aggregates.load_groups_by_file(data_loader.INCIDENTS, ['State', 'Year'], METRIC_COLUMNS)[file]
+        return data_loader.load_dimensions().join(by_state_year, data_loader.load_dataset('population'), on='State')
+
+    return _cached('state_year_totals', dict(file=file), build)
+
+
+def year_totals(file):
+    """Yearly totals of one incident family."""
+    return _cached('year_totals', dict(file=file),
+                   lambda: aggregates.load_groups_by_file(data_loader.INCIDENTS, ['Year'], METRIC_COLUMNS)[file])
+
+
+def county_totals(file):
+    """Per-county shootings, victims and per-capita rates of one incident family,
+    with the first County, State and Population reported for each FIPS."""
+    def build():
+        grouped = aggregates.load_groups_by_file(
+            data_loader.INCIDENTS, ['FIPS'],
+            Total_Victims=('Total Victims', 'sum'),
+            Shootings=('Shootings', 'sum'),
+            Population=('Population', 'first'),
+            County=('County', 'first'),
+            State=('State', 'first')
+        )
+        # FIPS is already filled with 0 where missing at ingest
+        county = grouped[file]
+        county = county[county['FIPS'] != 0].reset_index(drop=True)
+        county['Shootings per Citizen'] = (county['Shootings'] / county['Population'])
+        county['Shootings per Million'] = (county['Shootings'] / county['Population']) * 1_000_000
+        return county
+
+    return _cached('county_totals', dict(file=file), build)
+
+
+def buckets():
+    """Time buckets trend_series() can cut the incidents into, as a 'Bucket' column."""
+    return pd.DataFrame({'Bucket': timeseries.buckets(data_loader.INCIDENTS)})
+
+
+def trend_series(file, bucket):
+    """Incidents and every metric of one incident family per time bucket, on a
+    'Date' axis with empty buckets set to zero (see timeseries.py)."""
+    return _cached('trend_series', dict(file=file, bucket=bucket),
+                   lambda: timeseries.load_series(data_loader.INCIDENTS, bucket, METRIC_COLUMNS)[file])
+
+
+def top_states(by, count):
+    """The `count` states with the highest `by`, a column of state_totals()."""
+    return _cached('top_states', dict(by=by, count=count),
+                   lambda: state_totals().sort_values(by=by, ascending=False).head(count))
+
+
+def income_state():
+    """state_totals() with the mean county median income and the coordinates of each state."""
+    def build():
+        # Median income is reported per county alongside each incident
+        counties = data_loader.load_dataset(data_loader.INCIDENTS)
+        fips = counties.drop_duplicates('FIPS')
+        fips = fips[fips['FIPS'] != 0]
+        fips['counties'] = fips['Median Income'].notna().astype(int)
+
+        state_income = fips.groupby('State', observed=True).agg(
+            Income=('Median Income', 'sum'),
+            Counties=('counties', 'sum')
+        ).reset_index()
+
+        state_income['Income'] = state_income['Income'] / state_income['Counties']
+        dimensions = data_loader.load_dimensions()
+        income = dimensions.join(state_totals(), state_income, on='State')
+        return dimensions.join(income, data_loader.load_dataset('state_coord'), on='State')
+
+    return _cached('income_state', {}, build)
+
+
+def socioeconomic(first_year, last_year):
+    """Correlations and per-capita regressions of county shootings and victims
+    against county attributes, with bootstrap intervals (see correlations.py)."""
+    return correlations.analyze(first_year, last_year)
+
+
+# Name -> query, as served by query_service.py
+QUERIES = {
+    'years': years,
+    'states': states,
+    'states_with_incidents': states_with_incidents,
+    'region_year': region_year,
+    'state_year': state_year,
+    'county_year': county_year,
+    'state_map': state_map,
+    'county_map': county_map,
+    'incident_count': incident_count,
+    'incident_page': incident_page,
+    'state_year_table': state_year_table,
+    'state_totals': state_totals,
+    'state_year_totals': state_year_totals,
+    'year_totals': year_totals,
+    'county_totals': county_totals,
+    'buckets': buckets,
+    'trend_series': trend_series,
+    'top_states': top_states,
+    'income_state': income_state,
+    'socioeconomic': socioeconomic
+}
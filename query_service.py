@@ -0,0 +1,220 @@
+import argparse
+import collections
+import hashlib
+import io
+import os
+import threading
+import urllib.parse
+
+import pyarrow as pa
+import pyarrow.ipc
+import urllib3
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+import profiling
+import queries
+
+# Local query service for the dashboard aggregations.
+# Serves the queries of queries.py over HTTP, so the pandas work runs in its
+# own process (or several, with --workers) instead of in the Streamlit
+# request threads:
+#
+#   python query_service.py --port 8600
+#   SHOOTINGS_QUERY_URL=http://127.0.0.1:8600 streamlit run shootings_dashboard.py
+#
+#   GET /queries/region_year?metric=Shootings&first_year=2014&last_year=2024
+#   GET /queries/state_year?metric=Shootings&first_year=2014&last_year=2024&states=Ohio&states=Texas
+#   GET /queries/top_states?by=Shootings%20per%20Citizen&count=5
+#   GET /queries/county_totals?file=SS
+#   GET /queries/incident_page?state=Ohio&first_year=2019&last_year=2024&offset=0&limit=1000
+#
+# Responses are Arrow IPC streams when the request accepts
+# application/vnd.apache.arrow.stream (or passes format=arrow), JSON records
+# otherwise. Requests are handled asynchronously and the queries run on a
+# thread pool. Each response carries an ETag derived from the dataset versions
+# and the query, so a client revalidating with If-None-Match gets a 304 without
+# any pandas work; encoded bodies are also kept in an LRU cache.
+#
+# The dashboards call query(), which goes through a pooled QueryClient when
+# SHOOTINGS_QUERY_URL is set and runs the query in-process otherwise. Every
+# frame they draw or list comes from a query, so with the service in place
+# the Streamlit process holds neither the incident store nor the cube.
+
+ARROW = 'application/vnd.apache.arrow.stream'
+QUERY_URL = os.environ.get('SHOOTINGS_QUERY_URL')
+
+# Type of each query parameter; lists are repeated in the query string
+PARAMETERS = {
+    'metric': str,
+    'first_year': int,
+    'last_year': int,
+    'states': list,
+    'state': str,
+    'file': str,
+    'bucket': str,
+    'by': str,
+    'count': int,
+    'offset': int,
+    'limit': int
+}
+
+RESPONSE_CACHE_SIZE = 256
+
+
+class QueryError(RuntimeError):
+    pass
+
+
+def _parse(query_params):
+    params = {}
+    for name, values in query_params.items():
+        kind = PARAMETERS.get(name)
+        if kind is None:
+            raise QueryError(f"unknown parameter {name!r}")
+        params[name] = values if kind is list else kind(values[-1])
+    return params
+
+
+def _encode(frame, fmt):
+    if fmt == 'arrow':
+        table = pa.Table.from_pandas(frame)
+        sink = io.BytesIO()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue()
+    return frame.to_json(orient='records', date_format='iso').encode()
+
+
+# Server
+
+_responses = collections.OrderedDict()   # ETag -> encoded body
+_responses_lock = threading.Lock()
+
+
+def _etag(name, params, fmt):
+    key = repr((queries.signature(), name, sorted(params.items()), fmt)).encode()
+    return '"' + hashlib.sha1(key).hexdigest() + '"'
+
+
+def _respond(name, params, fmt, if_none_match):
+    """(status, ETag, body) of one query; runs on the thread pool."""
+    etag = _etag(name, params, fmt)
+    if etag == if_none_match:
+        return 304, etag, b''
+    with _responses_lock:
+        body = _responses.get(etag)
+        if body is not None:
+            _responses.move_to_end(etag)
+    if body is None:
+        body = _encode(queries.QUERIES[name](**params), fmt)
+        with _responses_lock:
+            _responses[etag] = body
+            while len(_responses) > RESPONSE_CACHE_SIZE:
+                _responses.popitem(last=False)
+    return 200, etag, body
+
+
+async def run_query(request):
+    name = request.path_params['name']
+    if name not in queries.QUERIES:
+        return JSONResponse({'error': f"unknown query {name!r}", 'queries': list(queries.QUERIES)}, status_code=404)
+    query_params = {key: request.query_params.getlist(key) for key in request.query_params if key != 'format'}
+    fmt = request.query_params.get('format') or ('arrow' if ARROW in request.headers.get('accept', '') else 'json')
+    try:
+        params = _parse(query_params)
+        status, etag, body = await run_in_threadpool(_respond, name, params, fmt, request.headers.get('if-none-match'))
+    except (QueryError, TypeError, ValueError) as error:
+        return JSONResponse({'error': str(error)}, status_code=400)
+    headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+    if status == 304:
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type=ARROW if fmt == 'arrow' else 'application/json', headers=headers)
+
+
+async def list_queries(request):
+    return JSONResponse({'queries': list(queries.QUERIES)})
+
+
+app = Starlette(routes=[
+    Route('/queries', list_queries),
+    Route('/queries/{name}', run_query)
+])
+
+
+# Client
+
+class QueryClient:
+    """Pooled HTTP client for the query service.
+
+    Responses are decoded from Arrow and kept with their ETag; repeated
+    queries are revalidated with If-None-Match and reuse the kept frame on a
+    304. Frames are shared between callers: treat them as read-only.
+    """
+
+    def __init__(self, url, pool_size=8, timeout=30.0, cache_size=RESPONSE_CACHE_SIZE):
+        self.url = url.rstrip('/')
+        self.http = urllib3.PoolManager(maxsize=pool_size, timeout=timeout, retries=urllib3.Retry(2, backoff_factor=0.1))
+        self.cache_size = cache_size
+        self._frames = collections.OrderedDict()   # URL -> (ETag, frame)
+        self._lock = threading.Lock()
+
+    def get(self, name, **params):
+        query = urllib.parse.urlencode(params, doseq=True)
+        url = f'{self.url}/queries/{name}' + (f'?{query}' if query else '')
+        headers = {'Accept': ARROW}
+        with self._lock:
+            cached = self._frames.get(url)
+        if cached is not None:
+            headers['If-None-Match'] = cached[0]
+        response = self.http.request('GET', url, headers=headers)
+        if response.status == 304 and cached is not None:
+            return cached[1]
+        if response.status != 200:
+            raise QueryError(f"{name}: HTTP {response.status}: {response.data[:200].decode(errors='replace')}")
+        frame = pa.ipc.open_stream(response.data).read_pandas()
+        with self._lock:
+            self._frames[url] = (response.headers.get('ETag'), frame)
+            self._frames.move_to_end(url)
+            while len(self._frames) > self.cache_size:
+                self._frames.popitem(last=False)
+        return frame
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def client(url=None):
+    """Process-wide QueryClient for `url` (default SHOOTINGS_QUERY_URL)."""
+    url = url or QUERY_URL
+    with _clients_lock:
+        if url not in _clients:
+            _clients[url] = QueryClient(url)
+        return _clients[url]
+
+
+def query(name, **params):
+    """Result of queries.QUERIES[name], from the query service when
+    SHOOTINGS_QUERY_URL is set and computed in-process otherwise."""
+    with profiling.phase('query', name, remote=bool(QUERY_URL)):
+        if QUERY_URL:
+            return client().get(name, **params)
+        return queries.QUERIES[name](**params)
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Serve the dashboard aggregations over HTTP.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8600)
+    parser.add_argument('--workers', type=int, default=1, help="worker processes")
+    args = parser.parse_args()
+    uvicorn.run('query_service:app', host=args.host, port=args.port, workers=args.workers, log_level='warning')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,434 @@
+import argparse
+import concurrent.futures
+import hashlib
+import html
+import json
+import logging
+import multiprocessing
+import os
+import re
+import shutil
+import sys
+import time
+
+import altair as alt
+import pyarrow as pa
+import pyarrow.ipc
+
+import aggregates
+import data_loader
+import geo
+import overview_charts
+import timeseries
+
+# Headless batch renderer for a static deployment of both dashboards.
+# Every dashboard view is run through Streamlit's AppTest, so the charts come
+# from the dashboard scripts themselves, and the resulting Vega-Lite specs are
+# written as static files:
+#
+#   dist/manifest.json                    pages, their selection and inputs
+#   dist/index.html                       links to every page
+#   dist/<dashboard>/<selection>.html     one page per selection
+#   dist/specs/<hash>.vl.json             chart specs with their data inlined,
+#                                         shared by every page that shows them
+#   dist/geo/<hash>.json                  map geometry payloads (see geo.py)
+#
+# Combinations are spread over a process pool. A page is skipped when the
+# dashboard code, its source data and its selection are unchanged since the
+# last run. A page that fails is kept in the manifest with its error, left out
+# of the index and rendered again on the next run. Pages of selections no
+# longer rendered (a state without incidents in a year range any more, a
+# removed view) leave the manifest, and every page, spec and geometry file
+# the manifest does not refer to is deleted.
+#
+#   python render.py                      # every view of both dashboards
+#   python render.py interactive --jobs 4
+#   python render.py --force              # re-render everything
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+OUTPUT_DIR = os.path.join(ROOT, 'dist')
+MANIFEST_VERSION = 2
+# Pages rendered between two writes of the manifest
+MANIFEST_EVERY = 10
+
+# Dashboard name -> (script, datasets it reads)
+DASHBOARDS = {
+    'overview': ('shootings_dashboard.py', [data_loader.INCIDENTS, 'state_coord', 'population']),
+    'interactive': ('shootings_dashboard_interactive.py', [data_loader.INCIDENTS, 'populations', 'fips'])
+}
+
+# Sidebar widget labels, as defined in the dashboard scripts
+VIEW_LABEL = "Select View"
+BUCKET_LABEL = "Time Bucket:"
+YEAR_RANGE_LABEL = "Select Year Range:"
+METRIC_LABEL = "Select Metric to Display:"
+STATES_LABEL = "Select States:"
+
+PAGE_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<script src="https://cdn.jsdelivr.net/npm/vega@{vega}"></script>
+<script src="https://cdn.jsdelivr.net/npm/vega-lite@{vegalite}"></script>
+<script src="https://cdn.jsdelivr.net/npm/vega-embed@{vegaembed}"></script>
+<style>
+  body {{ font-family: sans-serif; margin: 2em; }}
+  .chart {{ margin-bottom: 2em; }}
+</style>
+</head>
+<body>
+<p><a href="../index.html">All views</a></p>
+<h1>{title}</h1>
+{charts}
+<script>
+{embeds}
+</script>
+</body>
+</html>
+"""
+
+INDEX_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>US Mass Shootings Dashboard</title>
+<style>body {{ font-family: sans-serif; margin: 2em; }}</style>
+</head>
+<body>
+<h1>US Mass Shootings Dashboard</h1>
+{sections}
+</body>
+</html>
+"""
+
+
+def _slug(value):
+    return re.sub(r'[^a-z0-9]+', '-', str(value).lower()).strip('-')
+
+
+def _digest(paths):
+    digest = hashlib.sha1()
+    for path in sorted(paths):
+        digest.update(os.path.basename(path).encode())
+        with open(path, 'rb') as source:
+            digest.update(hashlib.sha1(source.read()).digest())
+    return digest.hexdigest()
+
+
+def input_digest(dashboard):
+    """Hash of the code and source data behind one dashboard's pages."""
+    code = [os.path.join(ROOT, name) for name in os.listdir(ROOT) if name.endswith('.py')]
+    data = [path for name in DASHBOARDS[dashboard][1] for path in data_loader.source_paths(name)]
+    if data_loader.INCIDENTS in DASHBOARDS[dashboard][1]:
+        data.extend(data_loader.appended_batches())
+    if geo.available():
+        data.append(geo.US_10M_PATH)
+    return _digest(code + data)
+
+
+# Combinations
+
+def common_year_ranges(first_year, last_year):
+    """Full range, last three years and last year."""
+    ranges = [(first_year, last_year), (max(first_year, last_year - 2), last_year), (last_year, last_year)]
+    return list(dict.fromkeys(ranges))
+
+
+def combinations(dashboard):
+    """Selections to render: every overview view (in every time bucket where
+    it has temporal charts), and every metric x common year range x state
+    with incidents in that range for the interactive one."""
+    if dashboard == 'overview':
+        # View names come from the script's own radio options
+        views = _widget(_app('overview').sidebar.radio, VIEW_LABEL).options
+        jobs = []
+        for view in views:
+            if view in overview_charts.BUCKET_VIEWS:
+                jobs += [{'view': view, 'bucket': bucket} for bucket in timeseries.buckets(data_loader.INCIDENTS)]
+            else:
+                jobs.append({'view': view})
+        return jobs
+
+    cube = aggregates.load_cube()
+    jobs = []
+    for metric in aggregates.METRICS:
+        for first_year, last_year in common_year_ranges(cube.first_year, cube.last_year):
+            for state in cube.states_with_incidents(first_year, last_year):
+                jobs.append({'metric': metric, 'year_range': [first_year, last_year], 'states': [state]})
+    return jobs
+
+
+def page_path(dashboard, selection):
+    if dashboard == 'overview':
+        name = _slug(selection['view']) + (f"_{_slug(selection['bucket'])}" if 'bucket' in selection else '')
+    else:
+        first_year, last_year = selection['year_range']
+        name = f"{_slug(selection['metric'])}_{first_year}-{last_year}_{'_'.join(_slug(state) for state in selection['states'])}"
+    return f'{dashboard}/{name}.html'
+
+
+def page_title(dashboard, selection):
+    if dashboard == 'overview':
+        return selection['view'] + (f" by {selection['bucket']}" if 'bucket' in selection else '')
+    first_year, last_year = selection['year_range']
+    return f"{selection['metric']} in {', '.join(selection['states'])} ({first_year} to {last_year})"
+
+
+# Rendering (runs in the worker processes)
+
+_apps = {}
+
+
+def _app(dashboard):
+    import streamlit.logger
+    from streamlit.testing.v1 import AppTest
+
+    app = _apps.get(dashboard)
+    if app is None:
+        # Deprecation notices from the scripts would repeat for every page
+        streamlit.logger.set_log_level(logging.ERROR)
+        app = AppTest.from_file(os.path.join(ROOT, DASHBOARDS[dashboard][0]), default_timeout=600)
+        _run(app)
+        _apps[dashboard] = app
+    return app
+
+
+def _run(app):
+    app.run()
+    if app.exception:
+        raise RuntimeError(app.exception[0].value)
+
+
+def _widget(widgets, label):
+    for widget in widgets:
+        if widget.label == label:
+            return widget
+    raise LookupError(f"no widget labelled {label!r}")
+
+
+def _select(app, dashboard, selection):
+    if dashboard == 'overview':
+        _widget(app.sidebar.radio, VIEW_LABEL).set_value(selection['view'])
+        if 'bucket' in selection:
+            # The bucket selectbox only appears in views with temporal charts
+            _run(app)
+            _widget(app.sidebar.selectbox, BUCKET_LABEL).set_value(selection['bucket'])
+    else:
+        # State options depend on the year range, so that is applied first
+        _widget(app.sidebar.slider, YEAR_RANGE_LABEL).set_value(tuple(selection['year_range']))
+        _widget(app.sidebar.selectbox, METRIC_LABEL).set_value(selection['metric'])
+        _run(app)
+        _widget(app.sidebar.multiselect, STATES_LABEL).set_value(selection['states'])
+    _run(app)
+
+
+def _records(data):
+    frame = pa.ipc.open_stream(data).read_all().to_pandas()
+    return json.loads(frame.to_json(orient='records', date_format='iso'))
+
+
+def _publish_geometry(spec, output_dir, published):
+    """Copy served map payloads next to the pages and point the spec at them;
+    adds their paths to `published`."""
+    if isinstance(spec, dict):
+        url = spec.get('url')
+        if isinstance(url, str) and url.startswith(geo.STATIC_URL + '/'):
+            name = url[len(geo.STATIC_URL) + 1:]
+            target = os.path.join(output_dir, 'geo', name)
+            if not os.path.exists(target):
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                shutil.copyfile(os.path.join(geo.STATIC_DIR, name), target)
+            spec['url'] = f'../geo/{name}'
+            published.add(f'geo/{name}')
+        for value in spec.values():
+            _publish_geometry(value, output_dir, published)
+    elif isinstance(spec, list):
+        for value in spec:
+            _publish_geometry(value, output_dir, published)
+
+
+def _static_spec(chart, output_dir, published):
+    """Self-contained spec of a rendered chart element, data inlined."""
+    spec = json.loads(chart.proto.spec)
+    if chart.proto.datasets:
+        spec['datasets'] = {dataset.name: _records(dataset.data.data) for dataset in chart.proto.datasets}
+    if chart.proto.data.data:
+        spec['data'] = {'values': _records(chart.proto.data.data)}
+    _publish_geometry(spec, output_dir, published)
+    return spec
+
+
+def _write_spec(spec, output_dir):
+    content = json.dumps(spec, sort_keys=True, separators=(',', ':')).encode()
+    path = f'specs/{hashlib.sha1(content).hexdigest()[:16]}.vl.json'
+    target = os.path.join(output_dir, path)
+    if not os.path.exists(target):
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp_path = f'{target}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as out:
+            out.write(content)
+        os.replace(tmp_path, target)
+    return path
+
+
+def _write_page(path, title, charts, output_dir):
+    target = os.path.join(output_dir, path)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    divs = '\n'.join(f'<div class="chart" id="chart{i}"></div>' for i in range(len(charts)))
+    embeds = '\n'.join(f'vegaEmbed("#chart{i}", "../{chart}");' for i, chart in enumerate(charts))
+    with open(target, 'w') as out:
+        out.write(PAGE_TEMPLATE.format(
+            title=html.escape(title), charts=divs, embeds=embeds,
+            vega=alt.VEGA_VERSION, vegalite=alt.VEGALITE_VERSION, vegaembed=alt.VEGAEMBED_VERSION
+        ))
+
+
+def render(dashboard, selection, output_dir):
+    """Render one selection of a dashboard; returns the paths of its chart specs
+    and of the geometry files they load."""
+    app = _app(dashboard)
+    _select(app, dashboard, selection)
+    geometry = set()
+    charts = [_write_spec(_static_spec(chart, output_dir, geometry), output_dir) for chart in app.get('vega_lite_chart')]
+    _write_page(page_path(dashboard, selection), page_title(dashboard, selection), charts, output_dir)
+    return charts, sorted(geometry)
+
+
+# Driver
+
+def load_manifest(output_dir):
+    path = os.path.join(output_dir, 'manifest.json')
+    if not os.path.exists(path):
+        return {}
+    with open(path) as source:
+        manifest = json.load(source)
+    return manifest.get('pages', {}) if manifest.get('version') == MANIFEST_VERSION else {}
+
+
+def write_manifest(pages, output_dir):
+    path = os.path.join(output_dir, 'manifest.json')
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as out:
+        json.dump({'version': MANIFEST_VERSION, 'pages': pages}, out, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+    sections = []
+    for dashboard in DASHBOARDS:
+        links = [f'<li><a href="{html.escape(path)}">{html.escape(page["title"])}</a></li>'
+                 for path, page in sorted(pages.items()) if page['dashboard'] == dashboard and 'error' not in page]
+        if links:
+            sections.append(f'<h2>{dashboard.title()}</h2>\n<ul>\n' + '\n'.join(links) + '\n</ul>')
+    with open(os.path.join(output_dir, 'index.html'), 'w') as out:
+        out.write(INDEX_TEMPLATE.format(sections='\n'.join(sections)))
+
+
+def _files(page):
+    return [page['path']] + page['charts'] + page['geometry']
+
+
+def is_current(page, inputs, output_dir):
+    return (page is not None and page['inputs'] == inputs and 'error' not in page
+            and all(os.path.exists(os.path.join(output_dir, path)) for path in _files(page)))
+
+
+def prune(pages, output_dir):
+    """Delete the pages, specs and geometry files no page of the manifest refers to; returns their number.
+
+    A failed page refers to nothing: it is left out of the index and its
+    previous output may be for other inputs.
+    """
+    referenced = {path for page in pages.values() if 'error' not in page for path in _files(page)}
+    removed = 0
+    for directory in list(DASHBOARDS) + ['specs', 'geo']:
+        if not os.path.isdir(os.path.join(output_dir, directory)):
+            continue
+        for name in os.listdir(os.path.join(output_dir, directory)):
+            if f'{directory}/{name}' not in referenced:
+                os.remove(os.path.join(output_dir, directory, name))
+                removed += 1
+    return removed
+
+
+def render_all(dashboards=None, output_dir=None, jobs=None, force=False):
+    output_dir = output_dir or OUTPUT_DIR
+    os.makedirs(output_dir, exist_ok=True)
+    previous = load_manifest(output_dir)
+    pages = dict(previous)
+    pending = {}
+    dashboards = dashboards or list(DASHBOARDS)
+    wanted = set()
+    for dashboard in dashboards:
+        digest = input_digest(dashboard)
+        for selection in combinations(dashboard):
+            path = page_path(dashboard, selection)
+            wanted.add(path)
+            inputs = hashlib.sha1(json.dumps([digest, selection], sort_keys=True).encode()).hexdigest()
+            if not force and is_current(previous.get(path), inputs, output_dir):
+                continue
+            pending[path] = {
+                'dashboard': dashboard, 'selection': selection, 'title': page_title(dashboard, selection),
+                'path': path, 'inputs': inputs, 'charts': [], 'geometry': []
+            }
+    # Pages of the dashboards rendered now whose selection is no longer rendered
+    stale = [path for path, page in pages.items() if page['dashboard'] in dashboards and path not in wanted]
+    for path in stale:
+        del pages[path]
+    if stale:
+        print(f"{len(stale)} pages no longer rendered")
+
+    print(f"{len(pending)} of {len(pages.keys() | pending.keys())} pages to render")
+    start = time.perf_counter()
+    # AppTest runs the scripts in threads, so workers are spawned, not forked.
+    # It also replaces __main__ while a script runs, so the worker function is
+    # taken from this module's importable name.
+    import render as module
+    context = multiprocessing.get_context('spawn')
+    failed = 0
+    # A page enters the manifest once it is rendered, or with its error if it
+    # failed; the manifest is written as pages finish and whatever happens, so
+    # an interrupted or failing run keeps the pages it did render
+    try:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs, mp_context=context) as pool:
+            futures = {
+                pool.submit(module.render, page['dashboard'], page['selection'], output_dir): path
+                for path, page in pending.items()
+            }
+            for done, future in enumerate(concurrent.futures.as_completed(futures), 1):
+                path = futures[future]
+                try:
+                    charts, geometry = future.result()
+                    pages[path] = dict(pending[path], charts=charts, geometry=geometry)
+                    print(f"[{done}/{len(pending)}] {path}")
+                except Exception as error:
+                    pages[path] = dict(pending[path], error=f'{type(error).__name__}: {error}')
+                    failed += 1
+                    print(f"[{done}/{len(pending)}] {path} failed: {pages[path]['error']}")
+                if done % MANIFEST_EVERY == 0:
+                    write_manifest(pages, output_dir)
+    finally:
+        write_manifest(pages, output_dir)
+    removed = prune(pages, output_dir)
+    print(f"Rendered {len(pending) - failed} pages in {time.perf_counter() - start:.1f}s to {os.path.relpath(output_dir)}"
+          + (f", {failed} failed" if failed else "") + (f", {removed} unused files deleted" if removed else ""))
+    return pages
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render every dashboard view to static Vega-Lite pages.")
+    parser.add_argument('dashboards', nargs='*', metavar='dashboard',
+                        help=f"dashboards to render (default: all of {', '.join(DASHBOARDS)})")
+    parser.add_argument('--output', help=f"output directory (default: {os.path.relpath(OUTPUT_DIR)})")
+    parser.add_argument('--jobs', type=int, help="worker processes (default: one per CPU)")
+    parser.add_argument('--force', action='store_true', help="render pages even if their inputs are unchanged")
+    args = parser.parse_args()
+    unknown = [name for name in args.dashboards if name not in DASHBOARDS]
+    if unknown:
+        parser.error(f"unknown dashboard(s): {', '.join(unknown)}")
+    pages = render_all(args.dashboards or None, args.output, args.jobs, args.force)
+    if any('error' in page for page in pages.values()):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+import argparse
+import json
+import os
+import shutil
+import time
+
+import aggregates
+import data_loader
+
+# Multi-process serving mode.
+# One publisher process loads the typed datasets, the dimension codes and the
+# aggregate cube once and writes them to a directory, ideally on a
+# memory-backed filesystem such as /dev/shm, as single-batch Arrow IPC files
+# and .npy arrays. Dashboard workers started with SHOOTINGS_SHARED_DIR set to
+# that directory memory-map the files read-only instead of loading and
+# aggregating the data themselves (see data_loader.load_dataset and
+# aggregates.load_cube). Every worker maps the same pages, so the data is held
+# once however many workers run; what each worker adds is its per-session
+# state and the small frames derived for the charts.
+#
+#   python shared.py /dev/shm/shootings               # publish once
+#   python shared.py /dev/shm/shootings --watch 5     # republish when the data changes
+#   SHOOTINGS_SHARED_DIR=/dev/shm/shootings streamlit run shootings_dashboard_interactive.py
+#
+# Each publication goes to a new generation-* directory and becomes current
+# when current.json is replaced, so workers never see a half-written one.
+# Workers pick up a new generation on their next rerun; the previous one is
+# kept for workers still reading it and older ones are removed.
+
+
+def _signature():
+    return tuple(data_loader.dataset_signature(name) for name in data_loader.SERVED_DATASETS)
+
+
+def publish(directory):
+    """Write the current datasets and cube to a new generation in `directory`."""
+    if data_loader.SHARED_DIR:
+        raise RuntimeError("the publisher must run without SHOOTINGS_SHARED_DIR")
+    start = time.perf_counter()
+    signature = _signature()
+    generation = f'generation-{time.time_ns()}'
+    target = os.path.join(directory, generation)
+    for name in data_loader.SERVED_DATASETS:
+        data_loader.write_arrow(data_loader.load_dataset(name), os.path.join(target, f'{name}.arrow'))
+    data_loader.write_arrow(data_loader.incident_conflicts(), os.path.join(target, 'incident_conflicts.arrow'))
+    aggregates.load_cube().save(os.path.join(target, 'cube'))
+
+    manifest = {
+        'generation': generation,
+        'published': time.time(),
+        'signature': repr(signature),
+        'dimensions': data_loader.load_dimensions().to_dict()
+    }
+    path = os.path.join(directory, data_loader.SHARED_MANIFEST)
+    with open(path + '.tmp', 'w') as sink:
+        json.dump(manifest, sink)
+    os.replace(path + '.tmp', path)
+
+    # Keep the previous generation for workers that read the old manifest
+    generations = sorted(entry for entry in os.listdir(directory) if entry.startswith('generation-'))
+    for old in generations[:-2]:
+        shutil.rmtree(os.path.join(directory, old), ignore_errors=True)
+
+    size = sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(target) for name in names)
+    print(f"{generation}: {size / 1024 / 1024:.1f} MiB in {time.perf_counter() - start:.2f}s -> {directory}")
+    return manifest
+
+
+def watch(directory, interval):
+    """Publish, then republish whenever a source, snapshot or appended batch changes."""
+    published = None
+    while True:
+        signature = _signature()
+        if signature != published:
+            publish(directory)
+            published = signature
+        time.sleep(interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Publish the dashboard data for workers to map read-only.")
+    parser.add_argument('directory', help="publication directory, e.g. /dev/shm/shootings")
+    parser.add_argument('--watch', type=float, metavar='SECONDS', default=None,
+                        help="keep running and republish when the data changes, checking this often")
+    args = parser.parse_args()
+    os.makedirs(args.directory, exist_ok=True)
+    if args.watch:
+        watch(args.directory, args.watch)
+    else:
+        publish(args.directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+import concurrent.futures
+import logging
+import os
+import threading
+import time
+
+import chart_cache
+
+# Background precompute of the selections users are likely to pick next.
+# After each rerun of the interactive dashboard, neighbours() lists the
+# selections one step away from the current one: the year range nudged by a
+# year at either end, the other metrics, and one more state from the region
+# of a selected state. schedule() builds the chart specs of those selections
+# on a small worker pool, which also fills the query and aggregate caches they
+# read. The specs go into the shared chart_cache, which every rerun checks
+# first, so moving to one of these selections finds its charts ready; a rerun
+# that asks for a spec still being built waits for that build instead of
+# starting its own.
+#
+#   speculation.schedule(tasks, signature)    # tasks: [(cache key, build)], most likely first
+#
+# Speculation runs under a budget: SPECULATION_WORKERS threads (0 disables
+# it), at most MAX_TASKS specs and CPU_BUDGET seconds of CPU per rerun, and
+# only while the spec cache is below MEMORY_FRACTION of its byte budget, so
+# speculative specs never push out the ones that were actually drawn. A new
+# rerun of the same session cancels the work scheduled for the previous one.
+# Reruns go first: a speculative build only starts while no session is
+# building or waiting for a spec of its own, and is dropped if that takes
+# longer than YIELD_TIMEOUT.
+
+logger = logging.getLogger(__name__)
+
+SPECULATION_WORKERS = int(os.environ.get('SHOOTINGS_SPECULATION_WORKERS', 1))
+MAX_TASKS = 64
+CPU_BUDGET = 2.0            # CPU seconds of speculative builds per rerun
+MEMORY_FRACTION = 0.5       # share of the spec cache's max_bytes speculation may fill
+NEIGHBOUR_STATES = 3        # states of the same region tried as an addition
+YIELD_TIMEOUT = 10.0        # seconds a speculative build waits for the foreground
+
+
+def neighbours(metric, year_range, states, metrics, years, regions):
+    """Selections one step away from (metric, year_range, states), most likely first.
+
+    `years` is the (first, last) year the slider allows and `regions` maps
+    each state to the states of its region, in the order to try them.
+    """
+    first, last = year_range
+    ranges = [(first - 1, last), (first + 1, last), (first, last - 1), (first, last + 1)]
+    selections = [
+        (metric, candidate, states)
+        for candidate in ranges
+        if years[0] <= candidate[0] <= candidate[1] <= years[1]
+    ]
+    selections += [(other, (first, last), states) for other in metrics if other != metric]
+    for state in states:
+        candidates = [other for other in regions.get(state, []) if other not in states]
+        selections += [(metric, (first, last), sorted([*states, other])) for other in candidates[:NEIGHBOUR_STATES]]
+    return selections
+
+
+class _Budget:
+    """CPU seconds left to one rerun's speculative builds."""
+
+    def __init__(self, seconds):
+        self.left = seconds
+        self._lock = threading.Lock()
+
+    def spend(self, seconds):
+        with self._lock:
+            self.left -= seconds
+
+
+class Speculator:
+    """Builds chart specs for likely next selections on a background pool."""
+
+    def __init__(self, cache=None, workers=SPECULATION_WORKERS, max_tasks=MAX_TASKS,
+                 cpu_budget=CPU_BUDGET, memory_fraction=MEMORY_FRACTION):
+        self.cache = cache or chart_cache.specs
+        self.max_tasks = max_tasks
+        self.cpu_budget = cpu_budget
+        self.memory_fraction = memory_fraction
+        self._executor = concurrent.futures.ThreadPoolExecutor(workers, thread_name_prefix='speculate') if workers > 0 else None
+        self._lock = threading.Lock()
+        self._sessions = {}     # session id -> (generation, futures of its pending work)
+        self._stats = {'scheduled': 0, 'built': 0, 'cancelled': 0, 'stale': 0, 'yielded': 0, 'over_budget': 0,
+                       'failed': 0}
+
+    def schedule(self, session, tasks, signature):
+        """Replace the pending work of `session` with `tasks`, (cache key, build) pairs."""
+        if self._executor is None:
+            return 0
+        tasks = [(key, build) for key, build in tasks if not self.cache.contains(key, signature)][:self.max_tasks]
+        budget = _Budget(self.cpu_budget)
+        with self._lock:
+            generation, pending = self._sessions.get(session, (0, []))
+            self._stats['cancelled'] += sum(future.cancel() for future in pending)
+            generation += 1
+            futures = [
+                self._executor.submit(self._run, session, generation, budget, key, signature, build)
+                for key, build in tasks
+            ]
+            self._sessions[session] = (generation, futures)
+            self._stats['scheduled'] += len(futures)
+            # Forget sessions whose work is done
+            for other, (_, others) in list(self._sessions.items()):
+                if other != session and all(future.done() for future in others):
+                    del self._sessions[other]
+        return len(futures)
+
+    def _count(self, outcome):
+        with self._lock:
+            self._stats[outcome] += 1
+
+    def _current(self, session, generation):
+        with self._lock:
+            return self._sessions.get(session, (None,))[0] == generation
+
+    def _run(self, session, generation, budget, key, signature, build):
+        if not self._current(session, generation):
+            return self._count('stale')
+        if not self.cache.wait_idle(YIELD_TIMEOUT):
+            return self._count('yielded')
+        if not self._current(session, generation):
+            return self._count('stale')
+        info = self.cache.info()
+        if budget.left <= 0 or info['bytes'] > self.memory_fraction * info['max_bytes']:
+            return self._count('over_budget')
+        start = time.thread_time()
+        try:
+            self.cache.get(key, signature, build, background=True)
+        except Exception:
+            logger.exception("Speculative build of %s failed", key[0])
+            return self._count('failed')
+        finally:
+            budget.spend(time.thread_time() - start)
+        self._count('built')
+
+    def info(self):
+        """Counts of scheduled, built, cancelled, stale, yielded, over-budget and failed builds."""
+        with self._lock:
+            return dict(self._stats)
+
+
+_speculator = None
+_speculator_lock = threading.Lock()
+
+
+def speculator():
+    """Process-wide Speculator, shared by every session."""
+    global _speculator
+    with _speculator_lock:
+        if _speculator is None:
+            _speculator = Speculator()
+        return _speculator
+
+
+def _session_id():
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+        ctx = get_script_run_ctx()
+    except ImportError:
+        ctx = None
+    return ctx.session_id if ctx is not None else None
+
+
+def schedule(tasks, signature):
+    """Speculator.schedule() for the session of the running script."""
+    return speculator().schedule(_session_id(), tasks, signature)
@@ -0,0 +1,341 @@
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+import aggregates
+import data_loader
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:  # CSV sources still stream through pandas
+    pa = None
+try:
+    import resource
+except ImportError:  # not on Windows: no peak RSS in the progress
+    resource = None
+
+# Out-of-core aggregation of incident feeds larger than memory.
+# The dashboards aggregate a DataFrame of every incident. For feeds that do
+# not fit, the Aggregator reads the sources in chunks of CHUNK_ROWS rows
+# (CSV in the mass-shootings-csv.csv layout, or Parquet/Arrow files with
+# those columns) and folds each chunk into per-cell totals, a cell being one
+# File x State x Region x County x Year x Month. Only the columns the charts
+# use are read, and a chunk is dropped once it is folded in, so memory is
+# bounded by the chunk size plus the number of cells, however many rows the
+# feed holds.
+#
+# The cells are enough to answer everything the charts aggregate: the
+# AggregateCube of the interactive dashboard is built from them, and
+# group_by_file() and the Month and Quarter series of the overview run over
+# them instead of the incident rows. publish() writes the cells and the cube
+# to a directory, in new generations like shared.py; dashboards started with
+# SHOOTINGS_AGGREGATES_DIR set to it read their aggregates from there (see
+# aggregates.load_cube, aggregates.load_groups_by_file and
+# timeseries.load_series). Tables of individual incidents still show the
+# shipped incident store.
+#
+#   python streaming.py big.csv --output aggregates/
+#   python streaming.py feeds/*.parquet --output aggregates/ --chunk-rows 500000
+#   SHOOTINGS_AGGREGATES_DIR=aggregates streamlit run shootings_dashboard_interactive.py
+#
+# Every row is counted as one incident; the sources of one run must not
+# repeat incidents (reconciling overlapping files needs the in-memory store,
+# see incidents.py). Progress is reported after every chunk, to a callback
+# and to progress.json in the output directory.
+
+CHUNK_ROWS = 250_000
+
+# Keys of a cell, and the totals each cell holds besides 'Shootings', its
+# number of incidents
+CELL_KEYS = ['File', 'State', 'Region', 'FIPS_State', 'FIPS', 'Year', 'Month']
+CELL_METRICS = data_loader.METRIC_COLUMNS
+
+# County columns kept per File x FIPS with the first value found in the feed,
+# for the 'first' aggregations of the overview's county charts
+FIRST_COLUMNS = ['County', 'Population']
+
+COLUMNS = ['Incident Date'] + CELL_KEYS + FIRST_COLUMNS + CELL_METRICS
+REQUIRED_COLUMNS = ['Incident Date', 'File', 'State', 'Region', 'FIPS_State', 'FIPS'] + CELL_METRICS
+
+PROGRESS_FILE = 'progress.json'
+
+
+def _csv_chunks(path, chunk_rows):
+    with open(path, 'rb') as source:
+        header = source.readline().decode()
+        delimiter = ';' if header.count(';') > header.count(',') else ','
+        source.seek(0)
+        columns = list(pd.read_csv(source, sep=delimiter, nrows=0).columns)
+        _check_columns(path, columns)
+        source.seek(0)
+        reader = pd.read_csv(source, sep=delimiter, usecols=[column for column in COLUMNS if column in columns],
+                             chunksize=chunk_rows)
+        for chunk in reader:
+            yield data_loader._prepare_incidents(chunk), source.tell()
+
+
+def _parquet_chunks(path, chunk_rows):
+    source = pa.parquet.ParquetFile(path)
+    columns = [column for column in COLUMNS if column in source.schema_arrow.names]
+    _check_columns(path, source.schema_arrow.names)
+    size, rows, total = os.path.getsize(path), 0, source.metadata.num_rows
+    for batch in source.iter_batches(batch_size=chunk_rows, columns=columns):
+        rows += batch.num_rows
+        yield _typed(batch.to_pandas()), size * rows // max(total, 1)
+
+
+def _arrow_chunks(path, chunk_rows):
+    with pa.memory_map(path, 'r') as mapped:
+        reader = pa.ipc.open_file(mapped)
+        _check_columns(path, reader.schema.names)
+        columns = [column for column in COLUMNS if column in reader.schema.names]
+        size, rows, total = os.path.getsize(path), 0, sum(reader.get_batch(i).num_rows for i in range(reader.num_record_batches))
+        for i in range(reader.num_record_batches):
+            batch = reader.get_batch(i).select(columns)
+            # Record batches can be of any size; fold them in chunk_rows slices
+            for offset in range(0, batch.num_rows, chunk_rows):
+                piece = batch.slice(offset, chunk_rows)
+                rows += piece.num_rows
+                yield _typed(piece.to_pandas()), size * rows // max(total, 1)
+
+
+READERS = {
+    '.csv': _csv_chunks,
+    '.parquet': _parquet_chunks,
+    '.arrow': _arrow_chunks,
+    '.feather': _arrow_chunks
+}
+
+
+def _check_columns(path, columns):
+    missing = [column for column in REQUIRED_COLUMNS if column not in columns]
+    if missing:
+        raise ValueError(f"{path}: missing columns {missing}; expected the {data_loader.DATASETS['mass_shootings'][0]} layout")
+
+
+def _typed(chunk):
+    # Columnar sources may already be typed, like the snapshots ingest.py writes
+    if pd.api.types.is_datetime64_any_dtype(chunk['Incident Date']):
+        return chunk.astype({column: dtype for column, dtype in data_loader.INCIDENT_SCHEMA.items() if column in chunk.columns})
+    return data_loader._prepare_incidents(chunk)
+
+
+def read_chunks(path, chunk_rows=CHUNK_ROWS):
+    """Typed chunks of at most chunk_rows incidents of `path`, each with the bytes read so far."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in READERS:
+        raise ValueError(f"{path}: cannot stream {extension or 'files without an extension'}; use one of {', '.join(READERS)}")
+    if extension != '.csv' and pa is None:
+        raise RuntimeError(f"pyarrow is required to stream {extension} files")
+    return READERS[extension](path, chunk_rows)
+
+
+def _plain(frame, columns):
+    # Categories differ from chunk to chunk, so keys are folded as plain values
+    return frame.astype({
+        column: object if isinstance(frame[column].dtype, pd.CategoricalDtype) and column != 'Month' else frame[column].dtype
+        for column in columns
+    }).astype({'Month': 'int8'} if 'Month' in columns else {})
+
+
+class Aggregator:
+    """Folds chunks of incidents into per-cell totals held in memory."""
+
+    def __init__(self, chunk_rows=CHUNK_ROWS):
+        self.chunk_rows = chunk_rows
+        self.rows = 0
+        self.chunks = 0
+        self._cells = None          # cell totals folded so far, with the first row of each cell
+        self._pending = []          # chunk totals not yet folded into _cells
+        self._pending_rows = 0
+        self._counties = None       # State, Region and County of the first row of each FIPS_State x FIPS
+        self._firsts = None         # first FIRST_COLUMNS values of each File x FIPS
+        self._bytes_read = 0
+        self._bytes_total = 0
+        self._started = time.perf_counter()
+        self.peak_bytes = 0
+
+    def add(self, chunk):
+        """Fold one typed chunk of incidents into the totals."""
+        chunk = chunk.reset_index(drop=True)
+        for column in CELL_KEYS + FIRST_COLUMNS:
+            if column not in chunk.columns:
+                chunk[column] = np.nan
+        chunk = _plain(chunk, CELL_KEYS).assign(Row=np.arange(self.rows, self.rows + len(chunk)))
+
+        totals = chunk.assign(Shootings=1).groupby(CELL_KEYS, dropna=False, sort=False).agg(
+            Shootings=('Shootings', 'sum'), Row=('Row', 'min'), **{column: (column, 'sum') for column in CELL_METRICS}
+        )
+        self._pending.append(totals)
+        self._pending_rows += len(totals)
+        if self._pending_rows > max(self.chunk_rows, len(self._cells) if self._cells is not None else 0):
+            self._fold()
+
+        # Counties seen for the first time in this chunk, at their first row
+        counties = chunk.drop_duplicates(['FIPS_State', 'FIPS']).set_index(['FIPS_State', 'FIPS'])[['State', 'Region', 'County', 'Row']]
+        if self._counties is not None:
+            counties = pd.concat([self._counties, counties[~counties.index.isin(self._counties.index)]])
+        self._counties = counties
+        # First non-missing value, as DataFrame.groupby().first() takes it
+        firsts = chunk.groupby(['File', 'FIPS'], dropna=False, sort=False)[FIRST_COLUMNS].first()
+        self._firsts = firsts if self._firsts is None else self._firsts.combine_first(firsts)
+
+        self.rows += len(chunk)
+        self.chunks += 1
+        self._track(chunk)
+
+    def _fold(self):
+        parts = ([self._cells] if self._cells is not None else []) + self._pending
+        if parts:
+            self._cells = pd.concat(parts).groupby(level=CELL_KEYS, dropna=False, sort=False).agg(
+                {'Shootings': 'sum', 'Row': 'min', **{column: 'sum' for column in CELL_METRICS}}
+            )
+        self._pending, self._pending_rows = [], 0
+
+    def _track(self, chunk):
+        # deep=True counts the strings of the County columns too; the rest is
+        # categorical or numeric, so this stays a few milliseconds per chunk
+        held = sum(
+            frame.memory_usage(deep=True).sum()
+            for frame in [self._cells, self._counties, self._firsts, *self._pending] if frame is not None
+        )
+        self.peak_bytes = max(self.peak_bytes, int(held + chunk.memory_usage(deep=True).sum()))
+
+    def read(self, paths, on_progress=None):
+        """Fold every chunk of `paths` in, calling on_progress(progress()) after each."""
+        self._bytes_total += sum(os.path.getsize(path) for path in paths)
+        for path in paths:
+            done = self._bytes_read
+            for chunk, position in read_chunks(path, self.chunk_rows):
+                self.add(chunk)
+                self._bytes_read = done + position
+                if on_progress is not None:
+                    on_progress(self.progress())
+            self._bytes_read = done + os.path.getsize(path)
+        return self
+
+    def progress(self):
+        """Rows, chunks, bytes read, share of the input done, cells held (a cell can
+        be counted once per chunk until they are folded together), peak memory
+        held in frames, peak RSS of the process (None where it cannot be read)
+        and rate so far."""
+        elapsed = time.perf_counter() - self._started
+        cells = (len(self._cells) if self._cells is not None else 0) + self._pending_rows
+        return {
+            'rows': self.rows,
+            'chunks': self.chunks,
+            'bytes_read': self._bytes_read,
+            'bytes_total': self._bytes_total,
+            'fraction': round(self._bytes_read / self._bytes_total, 4) if self._bytes_total else 0.0,
+            'cells': cells,
+            'peak_bytes': self.peak_bytes,
+            'peak_rss_bytes': peak_rss(),
+            'seconds': round(elapsed, 2),
+            'rows_per_second': round(self.rows / elapsed) if elapsed else 0
+        }
+
+    def cells(self):
+        """One row per cell: CELL_KEYS, 'Shootings', the CELL_METRICS totals and
+        the FIRST_COLUMNS of its File x FIPS, in order of each cell's first incident."""
+        self._fold()
+        if self._cells is None:
+            raise ValueError("no incidents were read")
+        cells = self._cells.reset_index().sort_values('Row', kind='stable')
+        cells = cells.merge(self._firsts.reset_index(), on=['File', 'FIPS'], how='left')
+        cells = cells.astype({column: 'category' for column in ['File', 'State', 'Region']})
+        cells = cells.astype({'Month': data_loader.INCIDENT_SCHEMA['Month'], 'County': 'str'})
+        return cells.drop(columns='Row').reset_index(drop=True)
+
+    def cube(self):
+        """AggregateCube of the incidents read, as aggregates.AggregateCube builds it from the rows."""
+        self._fold()
+        cells = self._cells.groupby(level=['Year', 'FIPS_State', 'FIPS'], sort=False).agg(
+            {'Shootings': 'sum', 'Row': 'min', **{column: 'sum' for column in CELL_METRICS}}
+        ).reset_index().sort_values('Row', kind='stable')
+        # The cube names each county after its first incident; cells in order
+        # of their first incident keep each state's first appearance per year
+        counties = self._counties[['State', 'Region', 'County']]
+        cells = cells.join(counties, on=['FIPS_State', 'FIPS']).reset_index(drop=True)
+        return aggregates.AggregateCube(cells)
+
+
+def aggregate(paths, chunk_rows=CHUNK_ROWS, on_progress=None):
+    """Aggregator holding the totals of every incident in `paths`."""
+    return Aggregator(chunk_rows).read(paths, on_progress)
+
+
+def _write_json(path, value):
+    with open(path + '.tmp', 'w') as sink:
+        json.dump(value, sink)
+    os.replace(path + '.tmp', path)
+
+
+def publish(directory, paths, chunk_rows=CHUNK_ROWS, on_progress=None):
+    """Aggregate `paths` into a new generation in `directory` for SHOOTINGS_AGGREGATES_DIR."""
+    os.makedirs(directory, exist_ok=True)
+
+    def report(progress):
+        _write_json(os.path.join(directory, PROGRESS_FILE), progress)
+        if on_progress is not None:
+            on_progress(progress)
+
+    aggregator = aggregate(paths, chunk_rows, report)
+    generation = f'generation-{time.time_ns()}'
+    target = os.path.join(directory, generation)
+    data_loader.write_arrow(aggregator.cells(), os.path.join(target, 'cells.arrow'))
+    aggregator.cube().save(os.path.join(target, 'cube'))
+
+    manifest = {
+        'generation': generation,
+        'published': time.time(),
+        'sources': [os.path.abspath(path) for path in paths],
+        'progress': aggregator.progress()
+    }
+    _write_json(os.path.join(directory, data_loader.SHARED_MANIFEST), manifest)
+
+    # Keep the previous generation for dashboards that read the old manifest
+    generations = sorted(entry for entry in os.listdir(directory) if entry.startswith('generation-'))
+    for old in generations[:-2]:
+        shutil.rmtree(os.path.join(directory, old), ignore_errors=True)
+    return manifest
+
+
+def peak_rss():
+    """Peak resident set size of this process in bytes, or None where it cannot be read."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _print_progress(progress):
+    memory = f"{progress['peak_bytes'] / 1024 / 1024:.1f} MiB held"
+    if progress['peak_rss_bytes'] is not None:
+        memory += f", {progress['peak_rss_bytes'] / 1024 / 1024:.0f} MiB peak RSS"
+    print(f"\r{progress['rows']:,} rows, {progress['fraction']:.0%} of the input, {progress['cells']:,} cells, "
+          f"{memory}, {progress['rows_per_second']:,} rows/s",
+          end='', file=sys.stderr, flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Aggregate incident feeds larger than memory for the dashboards.")
+    parser.add_argument('sources', nargs='+', help="CSV files in the mass-shootings-csv.csv layout, or Parquet/Arrow files")
+    parser.add_argument('--output', required=True, help="directory to publish to, for SHOOTINGS_AGGREGATES_DIR")
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS, help="rows read per chunk (default: %(default)s)")
+    args = parser.parse_args()
+    manifest = publish(args.output, args.sources, args.chunk_rows, _print_progress)
+    progress = manifest['progress']
+    print(f"\n{manifest['generation']}: {progress['rows']} incidents in {progress['cells']} cells, "
+          f"{progress['seconds']:.1f}s -> {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,335 @@
+import argparse
+import calendar
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+import data_loader
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv
+except ImportError:  # pandas writes the CSV instead, several times slower
+    pa = None
+
+# Synthetic incidents for scale testing.
+# IncidentModel learns the marginal distributions of the shipped files and
+# samples any number of rows in the exact layout of the incident CSVs:
+#
+#   State          state mix, with Region and FIPS_State following the state
+#   FIPS, County   counties of that state from FIPS.csv, weighted by their
+#                  observed incidents (plus smoothing, so every county can
+#                  appear) and carrying the county attributes of the source
+#   Year, Month    joint year x month frequencies (trend and seasonality);
+#                  Day is uniform within the month
+#   victims        (Victims Killed, Victims Injured) pairs and (Suspects
+#                  Killed, Injured, Arrested) triples from the observed joint
+#                  distributions; Total Victims is their sum
+#
+# Sampling is vectorized and chunked, so memory stays flat for any size and
+# the same seed always gives the same rows.
+#
+#   python synth.py 1000000 --output big.csv               # mass-shootings-csv.csv layout
+#   python synth.py 1000000 --layout counties --output -   # FIPSCounties2.csv layout to stdout
+#   python synth.py 100000000 --layout all --output data/  # all three incident files
+
+# Layout name -> dataset whose source file defines the columns and delimiter
+LAYOUTS = {
+    'mass_shootings': 'mass_shootings',
+    'mass_school_shootings': 'mass_school_shootings',
+    'counties': 'counties'
+}
+CHUNK_ROWS = 1_000_000
+SMOOTHING = 0.5   # pseudo-incidents added to every county of FIPS.csv
+
+# Columns that only depend on the county
+COUNTY_COLUMNS = ['County', 'LZIP', 'Population', 'Crime Rate', 'Unemployment', 'PopulrVoteParty',
+                  'Cost of Living', 'Median Income', 'Diversity Rank (Race)', 'Diversity Rank (Gender)']
+VICTIM_COLUMNS = ['Victims Killed', 'Victims Injured']
+SUSPECT_COLUMNS = ['Suspects Killed', 'Suspects Injured', 'Suspects Arrested']
+
+
+def layout(name):
+    """(columns, delimiter) of a layout, read from the header of its source file."""
+    dataset = LAYOUTS[name]
+    _, read_kwargs, _ = data_loader.DATASETS[dataset]
+    delimiter = read_kwargs.get('delimiter', ',')
+    columns = pd.read_csv(data_loader.source_path(dataset), nrows=0, delimiter=delimiter).columns.tolist()
+    return columns, delimiter
+
+
+def _probabilities(counts):
+    counts = np.asarray(counts, dtype=np.float64)
+    return counts / counts.sum()
+
+
+def _cumulative(weights):
+    return np.cumsum(np.asarray(weights, dtype=np.float64))
+
+
+# Text columns are kept as codes into their distinct values and sampled as
+# categoricals, which avoids building millions of string objects per chunk.
+
+def _encode(values):
+    values = pd.Series(values)
+    if pd.api.types.is_numeric_dtype(values):
+        return values.to_numpy(), None
+    codes, categories = pd.factorize(values.astype(object))
+    return codes, pd.Index(categories)
+
+
+def _decode(encoded, index):
+    codes, categories = encoded
+    if categories is None:
+        return codes[index]
+    return pd.Categorical.from_codes(codes[index], categories)
+
+
+class IncidentModel:
+    """Marginal distributions of the incident files, ready for vectorized sampling."""
+
+    def __init__(self, incidents, fips, smoothing=SMOOTHING, seed=0):
+        rng = np.random.default_rng(seed)
+        incidents = incidents.reset_index(drop=True)
+        self.next_id = int(incidents['Incident ID'].max()) + 1
+
+        # File and State mix
+        files = incidents['File'].value_counts()
+        self.files = pd.Index(files.index)
+        self.file_p = _probabilities(files.to_numpy())
+        states = incidents.groupby('State').agg(
+            count=('State', 'size'), region=('Region', 'first'), fips_state=('FIPS_State', 'first')
+        )
+        self.states = pd.Index(states.index)
+        self.state_p = _probabilities(states['count'].to_numpy())
+        self.state_region = _encode(states['region'])
+        self.state_fips = states['fips_state'].to_numpy()
+
+        # County pool: every county of FIPS.csv plus observed counties missing
+        # from it, grouped by state so each state is one contiguous block
+        observed = incidents.drop_duplicates('FIPS').set_index('FIPS')
+        pool = fips.rename(columns={'County2': 'County'})[['State', 'FIPS', 'County']]
+        missing = observed.loc[~observed.index.isin(pool['FIPS']), ['State', 'County']].reset_index()
+        pool = pd.concat([pool, missing], ignore_index=True)
+        pool = pool[pool['State'].isin(self.states)]
+        pool['state'] = self.states.get_indexer(pool['State'])
+        pool = pool.sort_values(['state', 'FIPS'], kind='stable').reset_index(drop=True)
+        incident_counts = incidents['FIPS'].value_counts()
+        pool['weight'] = pool['FIPS'].map(incident_counts).fillna(0).to_numpy() + smoothing
+        self.county_fips = pool['FIPS'].to_numpy()
+        self.county_cumulative = _cumulative(pool['weight'])
+        state_index = pool['state'].to_numpy()
+        self.state_start = np.searchsorted(state_index, np.arange(len(self.states)), side='left')
+        self.state_stop = np.searchsorted(state_index, np.arange(len(self.states)), side='right')
+
+        # County attributes. Counties without incidents borrow the attributes
+        # of a random observed county of the same state, keeping their name.
+        is_observed = pool['FIPS'].isin(observed.index).to_numpy()
+        donors = pool['FIPS'].to_numpy().copy()
+        for state in np.unique(state_index):
+            block = state_index == state
+            candidates = pool.loc[block & is_observed, 'FIPS'].to_numpy()
+            if len(candidates) == 0:
+                candidates = observed.index.to_numpy()
+            unseen = block & ~is_observed
+            donors[unseen] = rng.choice(candidates, unseen.sum())
+        attributes = observed.loc[donors, COUNTY_COLUMNS].reset_index(drop=True)
+        attributes['County'] = np.where(is_observed, attributes['County'], pool['County'])
+        self.county_attributes = {column: _encode(attributes[column]) for column in COUNTY_COLUMNS}
+
+        # City, address and location name come together from one incident of
+        # the donor county; counties without incidents use their own name as city
+        rows_by_county = incidents.groupby('FIPS').indices
+        donor_rows = [rows_by_county[donor] for donor in donors]
+        self.place_offsets = np.r_[0, np.cumsum([len(rows) for rows in donor_rows])]
+        place_rows = np.concatenate(donor_rows)
+        own_city = np.repeat(np.where(is_observed, None, pool['County'].to_numpy(dtype=object)), np.diff(self.place_offsets))
+        city = incidents['City Or County'].to_numpy(dtype=object)[place_rows]
+        self.place_city = _encode(np.where(pd.isna(own_city), city, own_city))
+        self.place_address = _encode(incidents['Address'].to_numpy(dtype=object)[place_rows])
+        self.place_location = _encode(incidents['Business/Location Name'].to_numpy(dtype=object)[place_rows])
+
+        # Year x Month frequencies
+        months = incidents.groupby(['Year', 'Month']).size()
+        self.month_year = months.index.get_level_values('Year').to_numpy()
+        self.month_month = months.index.get_level_values('Month').to_numpy()
+        self.month_p = _probabilities(months.to_numpy())
+        self.month_days = np.array([calendar.monthrange(year, month)[1]
+                                    for year, month in zip(self.month_year, self.month_month)])
+        # Incident Date text of every (year x month cell, day), coded cell * 31 + day - 1
+        self.month_dates = pd.Index([
+            f'{year:04d}-{month:02d}-{day:02d}T00:00:00Z'
+            for year, month in zip(self.month_year, self.month_month) for day in range(1, 32)
+        ])
+
+        # Victim and suspect counts, sampled as observed tuples
+        self.victims = incidents[VICTIM_COLUMNS].to_numpy()
+        self.suspects = incidents[SUSPECT_COLUMNS].to_numpy()
+
+    @classmethod
+    def fit(cls, smoothing=SMOOTHING, seed=0):
+        """Model of the shipped mass-shootings-csv.csv and FIPS.csv."""
+        incidents = data_loader.read_csv(data_loader.source_path('mass_shootings'))
+        fips = data_loader.read_csv(data_loader.source_path('fips'))
+        return cls(incidents, fips, smoothing, seed)
+
+    def sample(self, rows, rng, first_id=None):
+        """`rows` incidents in the mass-shootings-csv.csv layout."""
+        first_id = self.next_id if first_id is None else first_id
+
+        state = rng.choice(len(self.states), rows, p=self.state_p)
+        # County within the state: invert the cumulative weights of its block
+        start, stop = self.state_start[state], self.state_stop[state]
+        low = np.where(start > 0, self.county_cumulative[start - 1], 0.0)
+        high = self.county_cumulative[stop - 1]
+        county = np.searchsorted(self.county_cumulative, low + rng.random(rows) * (high - low), side='right')
+        county = np.clip(county, start, stop - 1)
+
+        cell = rng.choice(len(self.month_p), rows, p=self.month_p)
+        year, month = self.month_year[cell], self.month_month[cell]
+        day = 1 + (rng.random(rows) * self.month_days[cell]).astype(np.int64)
+
+        place_start = self.place_offsets[county]
+        place = place_start + (rng.random(rows) * (self.place_offsets[county + 1] - place_start)).astype(np.int64)
+
+        victims = self.victims[rng.integers(0, len(self.victims), rows)]
+        suspects = self.suspects[rng.integers(0, len(self.suspects), rows)]
+
+        frame = pd.DataFrame({
+            'File': pd.Categorical.from_codes(rng.choice(len(self.files), rows, p=self.file_p), self.files),
+            'Incident ID': np.arange(first_id, first_id + rows),
+            'Incident Date': pd.Categorical.from_codes(cell * 31 + day - 1, self.month_dates),
+            'Day': day,
+            'Month': month,
+            'Year': year,
+            'State': pd.Categorical.from_codes(state, self.states),
+            'City Or County': _decode(self.place_city, place),
+            'Address': _decode(self.place_address, place),
+            'Victims Killed': victims[:, 0],
+            'Victims Injured': victims[:, 1],
+            'Total Victims': victims.sum(axis=1),
+            'Suspects Killed': suspects[:, 0],
+            'Suspects Injured': suspects[:, 1],
+            'Suspects Arrested': suspects[:, 2],
+            'Business/Location Name': _decode(self.place_location, place),
+            'FIPS': self.county_fips[county]
+        })
+        for column in COUNTY_COLUMNS:
+            frame[column] = _decode(self.county_attributes[column], county)
+        frame['Region'] = _decode(self.state_region, state)
+        frame['FIPS_State'] = self.state_fips[state]
+        return frame
+
+
+def generate(rows, seed=0, chunk_rows=CHUNK_ROWS, model=None):
+    """Yield `rows` synthetic incidents as DataFrames of at most `chunk_rows` rows."""
+    model = model or IncidentModel.fit()
+    rng = np.random.default_rng(seed)
+    for start in range(0, rows, chunk_rows):
+        yield model.sample(min(chunk_rows, rows - start), rng, model.next_id + start)
+
+
+class _ArrowWriter:
+    """CSV writer for one layout backed by pyarrow; the header goes out with the first chunk."""
+
+    def __init__(self, sink, columns, delimiter):
+        self.sink = sink
+        self.columns = columns
+        self.delimiter = delimiter
+        self.schema = None
+        self.writer = None
+
+    def write(self, chunk):
+        table = pa.Table.from_pandas(chunk[self.columns], preserve_index=False)
+        # Text columns arrive dictionary-encoded and all-missing ones as null
+        table = pa.table([
+            column.cast(column.type.value_type) if pa.types.is_dictionary(column.type)
+            else column.cast(pa.string()) if pa.types.is_null(column.type) else column
+            for column in table.columns
+        ], names=table.column_names)
+        if self.writer is None:
+            self.schema = table.schema
+            options = pa.csv.WriteOptions(delimiter=self.delimiter, quoting_style='needed')
+            self.writer = pa.csv.CSVWriter(self.sink, self.schema, write_options=options)
+        # Later chunks may infer narrower types (e.g. an int8 dictionary index)
+        self.writer.write_table(table if table.schema == self.schema else table.cast(self.schema))
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+class _PandasWriter:
+    def __init__(self, sink, columns, delimiter):
+        self.sink = sink
+        self.columns = columns
+        self.delimiter = delimiter
+        self.header = True
+
+    def write(self, chunk):
+        self.sink.write(chunk[self.columns].to_csv(sep=self.delimiter, index=False, header=self.header).encode())
+        self.header = False
+
+    def close(self):
+        pass
+
+
+def write(outputs, rows, seed=0, chunk_rows=CHUNK_ROWS, model=None):
+    """Write the same synthetic incidents in one or more layouts.
+
+    `outputs` maps layout name -> path, or a binary file object for streaming
+    (the CLI passes sys.stdout.buffer for '-'). Returns the number of rows written.
+    """
+    writer_class = _ArrowWriter if pa is not None else _PandasWriter
+    files = {}
+    writers = {}
+    written = 0
+    try:
+        for name, target in outputs.items():
+            files[name] = open(f'{target}.tmp', 'wb') if isinstance(target, str) else target
+            writers[name] = writer_class(files[name], *layout(name))
+        for chunk in generate(rows, seed, chunk_rows, model):
+            for writer in writers.values():
+                writer.write(chunk)
+            written += len(chunk)
+        for writer in writers.values():
+            writer.close()
+    finally:
+        for name, target in outputs.items():
+            if isinstance(target, str) and name in files:
+                files[name].close()
+    for target in outputs.values():
+        if isinstance(target, str):
+            os.replace(f'{target}.tmp', target)
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic incidents shaped like the shipped data.")
+    parser.add_argument('rows', type=int, help="number of incidents")
+    parser.add_argument('--layout', choices=list(LAYOUTS) + ['all'], default='mass_shootings',
+                        help="file layout to write (default: %(default)s)")
+    parser.add_argument('--output', default='-',
+                        help="output file, '-' for stdout, or a directory with --layout all (default: stdout)")
+    parser.add_argument('--seed', type=int, default=0, help="random seed (default: %(default)s)")
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS, help="rows generated per chunk")
+    args = parser.parse_args()
+
+    if args.layout == 'all':
+        if args.output == '-':
+            parser.error("--layout all writes one file per layout; pass a directory as --output")
+        os.makedirs(args.output, exist_ok=True)
+        outputs = {name: os.path.join(args.output, data_loader.DATASETS[name][0]) for name in LAYOUTS}
+    else:
+        outputs = {args.layout: sys.stdout.buffer if args.output == '-' else args.output}
+
+    start = time.perf_counter()
+    written = write(outputs, args.rows, args.seed, args.chunk_rows)
+    print(f"{written} rows in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
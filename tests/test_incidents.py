@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+
+import incidents
+
+# reconcile(): earlier sources win conflicts, later ones fill in missing
+# values, columns and incidents, and every disagreement is reported.
+
+
+def _frame(rows, columns):
+    frame = pd.DataFrame(rows, columns=['File', 'Incident ID'] + columns)
+    return frame.astype({'File': 'category'})
+
+
+MASS_SHOOTINGS = _frame([
+    ('MS', 1, 'Harris County', 2),
+    ('MS', 2, None, 1),
+    ('SS', 2, 'Allen County', 0),
+], ['County', 'Victims Killed'])
+# Overlaps on MS 2 and SS 2, adds MS 3 and the LZIP column
+COUNTIES = _frame([
+    ('MS', 2, 'Cuyahoga County', 4, 44141.0),
+    ('SS', 2, 'Allen County', 0, 45801.0),
+    ('MS', 3, 'Travis County', 1, 78701.0),
+], ['County', 'Victims Killed', 'LZIP'])
+
+
+def _by_key(store):
+    return store.set_index(incidents.KEY).sort_index()
+
+
+def test_reconcile_store():
+    store, _ = incidents.reconcile({'mass_shootings': MASS_SHOOTINGS, 'counties': COUNTIES})
+
+    assert store.columns.tolist() == ['File', 'Incident ID', 'County', 'Victims Killed', 'LZIP']
+    assert store[['File', 'Incident ID']].values.tolist() == [['MS', 1], ['MS', 2], ['SS', 2], ['MS', 3]]
+    rows = _by_key(store)
+    # The first source wins the conflict on MS 2; the second fills its missing County
+    assert rows.loc[('MS', 2), 'Victims Killed'] == 1
+    assert rows.loc[('MS', 2), 'County'] == 'Cuyahoga County'
+    # Incidents and columns only the second source has
+    assert rows.loc[('MS', 3), 'County'] == 'Travis County'
+    assert rows.loc[('MS', 3), 'LZIP'] == 78701.0
+    assert np.isnan(rows.loc[('MS', 1), 'LZIP'])
+    assert store['Victims Killed'].dtype == MASS_SHOOTINGS['Victims Killed'].dtype
+
+
+def test_reconcile_conflicts():
+    _, conflicts = incidents.reconcile({'mass_shootings': MASS_SHOOTINGS, 'counties': COUNTIES})
+
+    assert conflicts.columns.tolist() == incidents.CONFLICT_COLUMNS
+    assert conflicts.to_dict('records') == [{
+        'File': 'MS', 'Incident ID': 2, 'Column': 'Victims Killed',
+        'Kept': '1', 'Kept From': 'mass_shootings', 'Value': '4', 'Source': 'counties'
+    }]
+
+
+def test_reconcile_conflict_with_filled_value():
+    # A value filled in by the second source is the one a third source conflicts with
+    third = _frame([('MS', 2, 'Summit County')], ['County'])
+    store, conflicts = incidents.reconcile({'mass_shootings': MASS_SHOOTINGS, 'counties': COUNTIES, 'third': third})
+
+    assert _by_key(store).loc[('MS', 2), 'County'] == 'Cuyahoga County'
+    county = conflicts[conflicts['Column'] == 'County']
+    assert county[['Kept', 'Kept From', 'Value', 'Source']].values.tolist() == [
+        ['Cuyahoga County', 'counties', 'Summit County', 'third']
+    ]
+
+
+def test_reconcile_without_conflicts():
+    store, conflicts = incidents.reconcile({'mass_shootings': MASS_SHOOTINGS, 'copy': MASS_SHOOTINGS.copy()})
+
+    assert conflicts.empty and conflicts.columns.tolist() == incidents.CONFLICT_COLUMNS
+    assert len(store) == len(MASS_SHOOTINGS)
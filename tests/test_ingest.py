@@ -0,0 +1,125 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import aggregates
+import data_loader
+import ingest
+
+# Incremental ingest: cubes extended by a batch must match a rebuild, and
+# validate() must reject each kind of bad row with its reason.
+
+
+def _incidents(rows):
+    frame = pd.DataFrame(rows, columns=['Year', 'State', 'FIPS_State', 'FIPS', 'County', 'Region', 'Victims Killed'])
+    frame['Shootings'] = 1
+    return frame
+
+
+BASE = _incidents([
+    (2019, 'Texas', 48, 48201, 'Harris County', 'South', 2),
+    (2019, 'Ohio', 39, 39035, 'Cuyahoga County', 'Midwest', 1),
+    (2020, 'Ohio', 39, 39003, 'Allen County', 'Midwest', 3),
+])
+# Texas first appears in 2020 in the batch; Ohio was seen in 2019 before it
+BATCH = _incidents([
+    (2020, 'Texas', 48, 48201, 'Harris County', 'South', 4),
+    (2019, 'Ohio', 39, 39003, 'Allen County', 'Midwest', 0),
+])
+CUBE_ARRAYS = ['values', 'incidents_per_year', 'active_year_prefix', 'first_seen', 'state_values', 'region_values',
+               'county_prefix', 'state_prefix', 'region_prefix', 'national_prefix']
+
+
+def test_extended_cube_matches_rebuild():
+    cube = aggregates.AggregateCube(BASE)
+    extended = cube.extended(BATCH)
+    rebuilt = aggregates.AggregateCube(pd.concat([BASE, BATCH], ignore_index=True))
+
+    for name in CUBE_ARRAYS:
+        np.testing.assert_array_equal(getattr(extended, name), getattr(rebuilt, name), err_msg=name)
+    assert extended._unseen == rebuilt._unseen
+    assert extended.states_with_incidents(2020, 2020) == rebuilt.states_with_incidents(2020, 2020) == ['Ohio', 'Texas']
+    assert extended.states_with_incidents(2019, 2020) == ['Texas', 'Ohio']
+    assert extended.total('Victims Killed', 2019, 2020) == 10
+    # The original cube is left untouched
+    assert cube.total('Victims Killed', 2019, 2020) == 6
+    assert cube.states_with_incidents(2020, 2020) == ['Ohio']
+
+
+@pytest.mark.parametrize('row', [
+    (2021, 'Ohio', 39, 39035, 'Cuyahoga County', 'Midwest', 1),
+    (2019, 'Ohio', 39, 39049, 'Franklin County', 'Midwest', 1),
+], ids=['new year', 'new county'])
+def test_extended_needs_rebuild_outside_cube(row):
+    assert aggregates.AggregateCube(BASE).extended(_incidents([row])) is None
+
+
+NEW_ID = 9_000_001
+
+
+@pytest.fixture(scope='module')
+def row():
+    """One valid source row, as ingest.append reads a batch."""
+    raw = pd.read_csv(data_loader.source_path('mass_shootings'), dtype=str, keep_default_na=False, na_values=[''], nrows=1)
+    raw['Incident ID'] = str(NEW_ID)
+    return raw
+
+
+KNOWN = pd.MultiIndex.from_tuples([('MS', 1), ('SS', NEW_ID)])
+
+
+def test_validate_accepts_valid_row(row):
+    accepted, rejected = ingest.validate(row, KNOWN)
+    assert len(accepted) == 1 and rejected.empty
+
+
+@pytest.mark.parametrize('changes, reason', [
+    ({'Incident ID': 'abc'}, 'invalid Incident ID'),
+    ({'Incident ID': '12.5'}, 'invalid Incident ID'),
+    ({'File': 'XX'}, 'invalid File'),
+    ({'Incident Date': 'yesterday'}, 'invalid Incident Date'),
+    ({'Day': '1'}, 'Year/Month/Day do not match Incident Date'),
+    ({'State': 'Atlantis'}, 'unknown State'),
+    ({'Victims Killed': '-1'}, 'invalid victim or suspect count'),
+    ({'Suspects Arrested': 'two'}, 'invalid victim or suspect count'),
+    ({'Total Victims': '99'}, 'Total Victims is not Victims Killed + Victims Injured'),
+    ({'FIPS': 'abc'}, 'invalid FIPS'),
+    ({'FIPS': '-39035'}, 'invalid FIPS'),
+    ({'FIPS': '39035.5'}, 'invalid FIPS'),
+    ({'FIPS_State': None}, 'missing FIPS_State'),
+    ({'FIPS_State': '0'}, 'invalid FIPS_State'),
+    ({'FIPS_State': '57'}, 'invalid FIPS_State'),
+    ({'FIPS_State': 'Ohio'}, 'invalid FIPS_State'),
+    ({'Region': None}, 'missing Region'),
+    ({'Region': '  '}, 'missing Region'),
+    ({'Incident ID': '1'}, 'Incident ID already ingested'),
+])
+def test_validate_rejects(row, changes, reason):
+    accepted, rejected = ingest.validate(row.assign(**changes), KNOWN)
+    assert accepted.empty
+    assert rejected['Reason'].tolist() == [reason]
+
+
+def test_validate_accepts_missing_fips(row):
+    accepted, rejected = ingest.validate(row.assign(FIPS=None), KNOWN)
+    assert len(accepted) == 1 and rejected.empty
+
+
+def test_validate_ids_are_per_file(row):
+    # NEW_ID is known for SS only
+    accepted, _ = ingest.validate(row, KNOWN)
+    assert len(accepted) == 1
+    _, rejected = ingest.validate(row.assign(File='SS'), KNOWN)
+    assert rejected['Reason'].tolist() == ['Incident ID already ingested']
+
+
+def test_validate_rejects_duplicates_in_batch(row):
+    accepted, rejected = ingest.validate(pd.concat([row, row], ignore_index=True), KNOWN)
+    assert accepted.index.tolist() == [0]
+    assert rejected.index.tolist() == [1]
+    assert rejected['Reason'].tolist() == ['duplicate Incident ID in batch']
+
+
+def test_validate_requires_every_column(row):
+    with pytest.raises(ValueError, match='FIPS_State'):
+        ingest.validate(row.drop(columns='FIPS_State'), KNOWN)
@@ -0,0 +1,94 @@
+import pandas as pd
+import pyarrow as pa
+import pyarrow.ipc
+from streamlit import dataframe_util
+
+import payload
+
+# optimize() keeps the fields a spec encodes and drops every other column.
+
+STATES = pd.DataFrame({
+    'State': ['Ohio', 'Texas', 'Ohio', 'Utah'],
+    'Region': ['Midwest', 'South', 'Midwest', 'West'],
+    'Shootings': [3, 5, 2, 1],
+    'Year': [2019, 2019, 2020, 2020],
+    'Population': [11.7, 29.1, 11.7, 3.3],
+    'Notes': ['a long unused text column'] * 4
+}, index=[10, 11, 12, 13])
+
+
+def _arrow(frame):
+    return dataframe_util.convert_anything_to_arrow_bytes(frame)
+
+
+def _frame(data):
+    return pa.ipc.open_stream(data).read_pandas()
+
+
+def _spec(**fields):
+    return {
+        'datasets': {'states': _arrow(STATES)},
+        'data': {'name': 'states'},
+        'mark': 'bar',
+        **fields
+    }
+
+
+def test_optimize_keeps_encoded_fields():
+    spec, saved = payload.optimize(_spec(encoding={
+        'x': {'field': 'State', 'type': 'nominal'},
+        'y': {'field': 'Shootings', 'type': 'quantitative', 'aggregate': 'sum'},
+        'color': {'field': 'Region', 'type': 'nominal'}
+    }))
+
+    (name, data), = spec['datasets'].items()
+    assert spec['data'] == {'name': name}
+    frame = _frame(data)
+    assert frame.columns.tolist() == ['State', 'Region', 'Shootings']
+    assert frame['Shootings'].tolist() == STATES['Shootings'].tolist()
+    assert frame.index.tolist() == [0, 1, 2, 3]
+    assert saved == len(_arrow(STATES)) - len(data) > 0
+
+
+def test_optimize_keeps_fields_of_expressions():
+    spec, _ = payload.optimize(_spec(
+        transform=[{'filter': 'datum.Year > 2019'}, {'calculate': "datum['Shootings'] / datum.Population", 'as': 'Rate'}],
+        encoding={'x': {'field': 'State'}, 'y': {'field': 'Rate'}}
+    ))
+
+    (data,) = spec['datasets'].values()
+    assert sorted(_frame(data).columns) == ['Population', 'Shootings', 'State', 'Year']
+
+
+def test_optimize_drops_repeated_lookup_rows():
+    counties = pd.DataFrame({'FIPS': [39035, 48201, 39003], 'State': ['Ohio', 'Texas', 'Ohio']})
+    spec, _ = payload.optimize({
+        'datasets': {'counties': _arrow(counties), 'states': _arrow(STATES)},
+        'data': {'name': 'counties'},
+        'transform': [{'lookup': 'State', 'from': {'data': {'name': 'states'}, 'key': 'State', 'fields': ['Region']}}],
+        'mark': 'geoshape',
+        'encoding': {'color': {'field': 'Region'}, 'tooltip': {'field': 'FIPS'}}
+    })
+
+    lookup = spec['transform'][0]['from']['data']['name']
+    frame = _frame(spec['datasets'][lookup])
+    assert frame.columns.tolist() == ['State', 'Region']
+    assert frame.values.tolist() == [['Ohio', 'Midwest'], ['Texas', 'South'], ['Utah', 'West']]
+    # The drawn dataset already held only used fields
+    assert spec['datasets']['counties'] == _arrow(counties)
+
+
+def test_optimize_keeps_specs_showing_every_field():
+    original = _spec(encoding={'x': {'field': 'State'}}, mark={'type': 'bar', 'tooltip': True})
+    spec, saved = payload.optimize(original)
+    assert spec is original and saved == 0
+
+
+def test_optimize_keeps_lookup_of_every_field():
+    original = _spec(
+        transform=[{'lookup': 'State', 'from': {'data': {'name': 'states'}, 'key': 'State'}}],
+        encoding={'x': {'field': 'State'}}
+    )
+    original['datasets']['states'] = _arrow(STATES)
+    spec, saved = payload.optimize(original)
+    assert spec['datasets'] == original['datasets'] and saved == 0
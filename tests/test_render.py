@@ -0,0 +1,36 @@
+import os
+
+import render
+
+# prune() keeps exactly the files the manifest's rendered pages refer to.
+
+
+def _page(dashboard, path, charts, geometry, **fields):
+    return {'dashboard': dashboard, 'path': path, 'charts': charts, 'geometry': geometry, **fields}
+
+
+def test_prune_deletes_unreferenced_files(tmp_path):
+    files = ['overview/top.html', 'overview/old.html', 'interactive/ohio.html', 'interactive/failed.html',
+             'specs/a.vl.json', 'specs/b.vl.json', 'specs/old.vl.json', 'specs/failed.vl.json',
+             'geo/states.json', 'geo/old.json']
+    for path in files:
+        os.makedirs(tmp_path / os.path.dirname(path), exist_ok=True)
+        (tmp_path / path).write_text('{}')
+    (tmp_path / 'manifest.json').write_text('{}')
+    pages = {
+        'overview/top.html': _page('overview', 'overview/top.html', ['specs/a.vl.json'], []),
+        'interactive/ohio.html': _page('interactive', 'interactive/ohio.html', ['specs/a.vl.json', 'specs/b.vl.json'],
+                                       ['geo/states.json']),
+        'interactive/failed.html': _page('interactive', 'interactive/failed.html', ['specs/failed.vl.json'], [],
+                                         error='RuntimeError: boom')
+    }
+
+    assert render.prune(pages, str(tmp_path)) == 5
+    left = sorted(os.path.relpath(os.path.join(root, name), tmp_path)
+                  for root, _, names in os.walk(tmp_path) for name in names)
+    assert left == ['geo/states.json', 'interactive/ohio.html', 'manifest.json', 'overview/top.html',
+                    'specs/a.vl.json', 'specs/b.vl.json']
+
+
+def test_prune_without_output(tmp_path):
+    assert render.prune({}, str(tmp_path)) == 0
@@ -0,0 +1,43 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import timeseries
+
+# LTTB keeps the endpoints and exactly the number of points asked for.
+
+
+@pytest.mark.parametrize('n, threshold', [(1000, 100), (1000, 3), (101, 100), (100, 99), (50, 7), (7, 5)])
+def test_lttb_keeps_threshold_points_and_endpoints(n, threshold):
+    rng = np.random.default_rng(n + threshold)
+    x = np.sort(rng.choice(10 * n, n, replace=False))
+    keep = timeseries.lttb(x, rng.normal(size=n), threshold)
+
+    assert len(keep) == threshold
+    assert keep[0] == 0 and keep[-1] == n - 1
+    assert (np.diff(keep) > 0).all()
+
+
+def test_lttb_keeps_peak():
+    y = np.zeros(500)
+    y[137] = 10.0
+    assert 137 in timeseries.lttb(np.arange(500), y, 20)
+
+
+@pytest.mark.parametrize('threshold', [10, 11, 2, 0])
+def test_lttb_under_budget_keeps_every_point(threshold):
+    np.testing.assert_array_equal(timeseries.lttb(np.arange(10), np.arange(10), threshold), np.arange(10))
+
+
+def test_downsample_per_series():
+    dates = pd.date_range('2019-01-01', periods=200, freq='D')
+    frame = pd.DataFrame({
+        'Date': np.tile(dates, 2),
+        'File': np.repeat(['MS', 'SS'], 200),
+        'Shootings': np.arange(400) % 7
+    }).sample(frac=1, random_state=0)
+    kept = timeseries.downsample(frame, 'Date', 'Shootings', 50, by='File')
+
+    for _, series in kept.groupby('File'):
+        assert len(series) == 50
+        assert series['Date'].iloc[0] == dates[0] and series['Date'].iloc[-1] == dates[-1]
@@ -0,0 +1,140 @@
+import numpy as np
+import pandas as pd
+
+import data_loader
+
+# Time series for the trend charts.
+# Incidents are bucketed on their Incident Date by day, week, month or quarter
+# into a real datetime axis, with empty buckets filled with zero so gaps show
+# as zero instead of being skipped. Long series are then downsampled with
+# Largest-Triangle-Three-Buckets (LTTB) to at most one point per pixel of the
+# chart, which keeps the peaks and the overall shape while the number of
+# points sent to the browser stays fixed however long the history grows.
+
+# Bucket name -> pandas period frequency; weeks start on Monday
+BUCKETS = {
+    'Day': 'D',
+    'Week': 'W',
+    'Month': 'M',
+    'Quarter': 'Q'
+}
+DEFAULT_BUCKET = 'Month'
+
+# Buckets streamed aggregates can be cut into: they hold totals per month
+# (see streaming.py)
+MONTHLY_BUCKETS = ['Month', 'Quarter']
+
+
+def _bucket_sums(incidents, bucket, columns):
+    """Sums of `columns` per File and bucket; only buckets with incidents."""
+    periods = incidents['Incident Date'].dt.to_period(BUCKETS[bucket]).rename('Period')
+    return incidents.assign(Shootings=1).groupby([incidents['File'], periods], observed=True)[columns].sum()
+
+
+def _fill(sums):
+    """Split bucket sums by File, each over its full range of buckets with gaps set to zero."""
+    series = {}
+    for file, part in sums.groupby(level='File', observed=True):
+        part = part.droplevel('File')
+        periods = pd.period_range(part.index.min(), part.index.max(), freq=part.index.freq)
+        part = part.reindex(periods, fill_value=0)
+        part.insert(0, 'Date', part.index.start_time)
+        series[str(file)] = part.reset_index(drop=True)
+    return series
+
+
+def group_by_bucket(incidents, bucket, columns):
+    """Group every incident family by time bucket in one scan.
+
+    Returns {file: frame} with a 'Date' column (start of each bucket) and the
+    sums of `columns`; 'Shootings' counts incidents.
+    """
+    return _fill(_bucket_sums(incidents, bucket, columns))
+
+
+def buckets(name):
+    """Buckets load_series() can cut dataset `name` into."""
+    if data_loader.AGGREGATES_DIR and name == data_loader.INCIDENTS:
+        return [bucket for bucket in BUCKETS if bucket in MONTHLY_BUCKETS]
+    return list(BUCKETS)
+
+
+def _cell_sums(cells, bucket, columns):
+    """_bucket_sums() of the per-month cell totals of streaming.py."""
+    cells = cells[cells['Month'].notna()]
+    periods = pd.PeriodIndex.from_fields(year=cells['Year'].to_numpy(), month=cells['Month'].astype('int64').to_numpy(), freq='M')
+    periods = pd.Series(periods.asfreq(BUCKETS[bucket]), index=cells.index, name='Period')
+    return cells.groupby([cells['File'], periods], observed=True)[columns].sum()
+
+
+def load_series(name, bucket, columns):
+    """group_by_bucket() over dataset `name`, cached per dataset version and
+    updated by delta when batches are appended."""
+    columns = list(columns)
+    if data_loader.AGGREGATES_DIR and name == data_loader.INCIDENTS:
+        if bucket not in MONTHLY_BUCKETS:
+            raise ValueError(f"streamed aggregates hold monthly totals; cannot bucket them by {bucket}")
+        return _fill(data_loader.cached(
+            ('streamed series', bucket, tuple(columns)), data_loader.dataset_signature(name),
+            lambda: _cell_sums(data_loader.load_streamed('cells'), bucket, columns),
+            f'streamed cells by File x {bucket}'
+        ))
+
+    def update(sums, incidents):
+        delta = _bucket_sums(incidents, bucket, columns)
+        index = sums.index.union(delta.index)
+        return sums.reindex(index, fill_value=0) + delta.reindex(index, fill_value=0)
+
+    return _fill(data_loader.cached_incremental(
+        ('series', name, bucket, tuple(columns)), name,
+        lambda incidents: _bucket_sums(incidents, bucket, columns), update,
+        f'{name} by File x {bucket}'
+    ))
+
+
+def lttb(x, y, threshold):
+    """Indices of the `threshold` points LTTB keeps from the series (x, y), x sorted.
+
+    The first and last points are always kept; every bucket in between keeps
+    the point forming the largest triangle with the point kept before it and
+    the average of the next bucket.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    edges = np.r_[edges, n]
+    keep = np.empty(threshold, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    previous = 0
+    for i in range(threshold - 2):
+        start, stop = edges[i], edges[i + 1]
+        next_x = x[stop:edges[i + 2]].mean()
+        next_y = y[stop:edges[i + 2]].mean()
+        area = np.abs((x[previous] - next_x) * (y[start:stop] - y[previous])
+                      - (x[previous] - x[start:stop]) * (next_y - y[previous]))
+        previous = start + int(area.argmax())
+        keep[i + 1] = previous
+    return keep
+
+
+def downsample(frame, x, y, threshold, by=None):
+    """Rows of `frame` kept by LTTB on (x, y), at most `threshold` per series of `by`.
+
+    x may be a datetime or numeric column. Series already under the budget
+    are returned unchanged.
+    """
+    def one(series):
+        series = series.sort_values(x)
+        values = series[x]
+        if pd.api.types.is_datetime64_any_dtype(values):
+            values = values.astype('int64')
+        return series.iloc[lttb(values.to_numpy(), series[y].to_numpy(), threshold)]
+
+    if by is None:
+        return one(frame) if len(frame) > threshold else frame
+    if len(frame) <= threshold or frame.groupby(by, observed=True).size().max() <= threshold:
+        return frame
+    return pd.concat([one(series) for _, series in frame.groupby(by, observed=True, sort=False)])